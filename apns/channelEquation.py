@@ -0,0 +1,94 @@
+"""Channel equations (see Wmnet.setChannelEquation) compiled once.
+
+An equation is an arithmetic expression of dist (and of rate for the
+bandwidth one). It is parsed and checked when it is set: only numbers,
+the variables, arithmetic operators, comparisons, conditional
+expressions and the functions below are accepted. It is then compiled
+into a function for single links and into a NumPy one evaluating many
+links at once."""
+
+import ast
+import math
+from functools import reduce
+
+import numpy as np
+
+
+class ChannelEquation(object):
+    functions = {'abs': abs, 'min': min, 'max': max, 'pow': pow,
+                 'exp': math.exp, 'log': math.log, 'log10': math.log10,
+                 'log2': math.log2, 'sqrt': math.sqrt, 'sin': math.sin,
+                 'cos': math.cos, 'pi': math.pi, 'e': math.e}
+    # np.minimum and np.maximum take two operands, a third would be `out`
+    np_functions = {'abs': np.abs,
+                    'min': lambda *args: reduce(np.minimum, args),
+                    'max': lambda *args: reduce(np.maximum, args),
+                    'pow': np.power, 'exp': np.exp, 'log': np.log,
+                    'log10': np.log10, 'log2': np.log2, 'sqrt': np.sqrt,
+                    'sin': np.sin, 'cos': np.cos, 'pi': np.pi, 'e': np.e}
+    nodes = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant,
+             ast.Name, ast.Load, ast.Call, ast.Compare, ast.IfExp,
+             ast.BoolOp, ast.operator, ast.unaryop, ast.cmpop, ast.boolop)
+    # branches are evaluated element by element in batches
+    branches = (ast.Compare, ast.IfExp, ast.BoolOp)
+    cache = {}  # (expression, variables): ChannelEquation
+
+    def __init__(self, expr, variables=('dist',)):
+        """:param expr: the equation
+        :param variables: names the equation may use"""
+        self.expr = expr
+        self.variables = tuple(variables)
+        try:
+            tree = ast.parse(expr.strip(), mode='eval')
+        except SyntaxError as e:
+            raise Exception('Invalid channel equation %r: %s' % (expr, e))
+        self.vectorized = True
+        for node in ast.walk(tree):
+            self.check(node)
+            if isinstance(node, self.branches):
+                self.vectorized = False
+        code = compile('lambda %s: (%s)' % (', '.join(self.variables),
+                                            expr.strip()),
+                       '<channel equation>', 'eval')
+        self.func = eval(code, {'__builtins__': {}, **self.functions})
+        self.np_func = eval(code, {'__builtins__': {}, **self.np_functions})
+
+    def check(self, node):
+        if not isinstance(node, self.nodes):
+            raise Exception('Invalid channel equation %r: %s is not allowed'
+                            % (self.expr, type(node).__name__))
+        if isinstance(node, ast.Constant) and \
+                not isinstance(node.value, (int, float)):
+            raise Exception('Invalid channel equation %r: %r is not a number'
+                            % (self.expr, node.value))
+        if isinstance(node, ast.Name) and node.id not in self.variables \
+                and node.id not in self.functions:
+            raise Exception('Invalid channel equation %r: unknown name %s'
+                            % (self.expr, node.id))
+        if isinstance(node, ast.Call) and (
+                not isinstance(node.func, ast.Name) or node.keywords):
+            raise Exception('Invalid channel equation %r: only calls of %s'
+                            % (self.expr, ', '.join(sorted(self.functions))))
+
+    @classmethod
+    def get(cls, expr, variables=('dist',)):
+        """:return: the compiled equation, shared by all the interfaces"""
+        key = expr, tuple(variables)
+        if key not in cls.cache:
+            cls.cache[key] = cls(expr, variables)
+        return cls.cache[key]
+
+    def __call__(self, *args):
+        return self.func(*args)
+
+    def batch(self, *args):
+        """Evaluates arrays of the variables (broadcast together)"""
+        args = np.broadcast_arrays(*[np.asarray(arg, dtype=float)
+                                     for arg in args])
+        if self.vectorized:
+            with np.errstate(all='ignore'):
+                return np.broadcast_to(self.np_func(*args),
+                                       args[0].shape).astype(float)
+        values = [self.func(*[float(arg) for arg in row])
+                  for row in zip(*[arg.ravel() for arg in args])]
+        return np.array(values, dtype=float).reshape(args[0].shape)
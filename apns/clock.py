@@ -0,0 +1,160 @@
+"""Simulation clock shared by the mobility drivers.
+
+Ticks are scheduled on absolute deadlines (start + n * interval), so the
+time spent handling a tick does not accumulate as drift. When a tick
+takes longer than the interval, the following ones fire right away until
+the schedule is met again and the overrun is accounted for."""
+
+from collections import deque
+from threading import Condition
+import time as tm
+
+from apns.log import debug
+
+
+class SimClock(object):
+    """Fixed-step clock.
+    :param interval: seconds between ticks
+    :param name: used in the report
+    :param history: number of ticks kept for the per-tick report"""
+    interval = 0.1
+    paused = False
+    pause_cond = Condition()
+
+    def __init__(self, interval=None, name='clock', history=1000):
+        if interval is not None:
+            self.interval = float(interval)
+        if self.interval <= 0:
+            raise ValueError('tick interval must be greater than 0')
+        self.name = name
+        self.history = deque(maxlen=history)
+        self.reset()
+
+    def time(self):
+        return tm.monotonic()
+
+    def sleep(self, seconds):
+        tm.sleep(seconds)
+
+    def reset(self):
+        """(Re)starts the clock at t=0"""
+        self.start = self.time()
+        self.tick = 0
+        self.tick_started = None
+        self.overruns = 0
+        self.lateness = [0.0, 0.0]  # total, max
+        self.busy = [0.0, 0.0]  # total, max
+        self.history.clear()
+
+    def now(self):
+        """Seconds elapsed since reset, pauses excluded"""
+        return self.time() - self.start
+
+    def sleep_until(self, sim_time):
+        """Blocks until the simulation time is reached"""
+        while True:
+            self.wait_while_paused()
+            remaining = sim_time - self.now()
+            if remaining <= 0:
+                return
+            self.sleep(remaining)
+
+    def wait_tick(self, sim_time=None):
+        """Ends the current tick and blocks until the next one is due
+        :param sim_time: wake up at this simulation time instead of the
+        next fixed step (event-driven drivers)
+        :return: simulation time of the new tick"""
+        now = self.time()
+        if self.tick_started is not None:
+            busy = now - self.tick_started
+            self.busy[0] += busy
+            self.busy[1] = max(self.busy[1], busy)
+            if busy > self.interval:
+                self.overruns += 1
+        else:
+            busy = 0.0
+
+        self.tick += 1
+        if sim_time is None:
+            sim_time = self.tick * self.interval
+        deadline = self.start + sim_time
+        if now < deadline:
+            self.sleep(deadline - now)
+            now = self.time()
+        late = now - deadline
+        self.lateness[0] += late
+        self.lateness[1] = max(self.lateness[1], late)
+        self.history.append((self.tick, late, busy))
+
+        self.wait_while_paused()
+        self.tick_started = self.time()
+        return sim_time
+
+    def wait_while_paused(self):
+        """Blocks while the simulation is paused; the time spent paused
+        does not count as simulation time"""
+        if not SimClock.paused:
+            return
+        paused_at = self.time()
+        with SimClock.pause_cond:
+            while SimClock.paused:
+                SimClock.pause_cond.wait()
+        self.start += self.time() - paused_at
+
+    @staticmethod
+    def pause():
+        with SimClock.pause_cond:
+            SimClock.paused = True
+
+    @staticmethod
+    def resume():
+        with SimClock.pause_cond:
+            SimClock.paused = False
+            SimClock.pause_cond.notify_all()
+
+    def report(self):
+        """Whether the emulator is keeping up with the clock
+        :return: dict"""
+        ticks = max(self.tick, 1)
+        return {'name': self.name,
+                'interval': self.interval,
+                'ticks': self.tick,
+                'overruns': self.overruns,
+                'lateness_avg': self.lateness[0] / ticks,
+                'lateness_max': self.lateness[1],
+                'busy_avg': self.busy[0] / ticks,
+                'busy_max': self.busy[1],
+                'last_ticks': list(self.history)}
+
+    def log_report(self, log=debug):
+        report = self.report()
+        log('*** {name}: {ticks} ticks of {interval}s, {overruns} overruns, '
+            'lateness avg {lateness_avg:.4f}s max {lateness_max:.4f}s, '
+            'busy avg {busy_avg:.4f}s max {busy_max:.4f}s\n'.format(**report))
+
+
+class VirtualClock(SimClock):
+    """Clock decoupled from the wall clock, for runs where nothing needs
+    real time (no containers, no traffic).
+    :param dilation: simulated seconds per wall-clock second, e.g. 10 runs
+    ten times faster than real time, None steps from one tick to the
+    next without sleeping"""
+
+    def __init__(self, interval=None, name='clock', dilation=None, **kwargs):
+        if dilation is not None and dilation <= 0:
+            raise ValueError('dilation must be greater than 0')
+        self.dilation = dilation
+        self.virtual = 0.0
+        self.wall_start = tm.monotonic()
+        super(VirtualClock, self).__init__(interval, name=name, **kwargs)
+
+    def time(self):
+        if self.dilation is None:
+            return self.virtual
+        return (tm.monotonic() - self.wall_start) * self.dilation
+
+    def sleep(self, seconds):
+        if self.dilation is None:
+            self.virtual += seconds
+        else:
+            tm.sleep(seconds / self.dilation)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+"""Benchmarks the wmediumd connector against the pure-Python stand-in
+of wmediumd (apns.wmediumdServer), so neither wmediumd nor root is needed.
+
+Interfaces move at random and send their position every tick:
+    single: one request/response round trip per update
+    batch:  one write and one read of all the responses per tick
+    async:  batches handed to the writer thread without waiting
+
+The latency of an update is the time from its request to its response,
+measured by the callback of the request: after its round trip, once its
+batch is flushed or once the writer thread received the batch responses.
+
+    python -m apns.examples.wmediumdBenchmark -n 100,1000,10000 -t 10
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from apns.log import setLogLevel, info
+from apns.wmediumdConnector import w_server, w_pos, WmediumdIntfRef
+from apns.wmediumdServer import WmediumdServer
+
+
+def run(n, ticks, mode, latency=0., step=1., seed=1, percentile=99):
+    """:return: updates/s, mean and percentile of the latencies of the
+    updates (s), slowest tick (s)"""
+    server = WmediumdServer(latency=latency, record=False).start()
+    w_server.connect(server.path)
+    try:
+        intfs = []
+        for i in range(n):
+            mac = '02:00:00:%02x:%02x:%02x' % (i >> 16, (i >> 8) & 255, i & 255)
+            intf = WmediumdIntfRef('sta%d' % i, 'sta%d-wlan0' % i, mac)
+            intf.sta_id = w_server.register_interface(mac)
+            intfs.append(intf)
+        rng = np.random.default_rng(seed)
+        positions = rng.uniform(0, 1000, (n, 3))
+        positions[:, 2] = 0
+        durations = []
+        latencies = []  # appended by the writer thread in the async mode
+
+        def sent(submitted):
+            return lambda resp: latencies.append(time.perf_counter()
+                                                 - submitted)
+
+        start = time.perf_counter()
+        for _ in range(ticks):
+            positions[:, :2] += rng.normal(0, step, (n, 2))
+            tick = time.perf_counter()
+            if mode == 'single':
+                for intf, pos in zip(intfs, positions.tolist()):
+                    w_server.send_pos_update(w_pos(intf, pos),
+                                             sent(time.perf_counter()))
+            else:
+                with w_server.batch_updates(wait=mode == 'batch'):
+                    for intf, pos in zip(intfs, positions.tolist()):
+                        w_server.send_pos_update(w_pos(intf, pos),
+                                                 sent(time.perf_counter()))
+            durations.append(time.perf_counter() - tick)
+        w_server.stop_writer()  # waits for the updates still queued
+        elapsed = time.perf_counter() - start
+    finally:
+        w_server.disconnect()
+        server.stop()
+    updates = server.counts.get('pos', 0)
+    latencies = np.array(latencies or [0.])
+    return (updates / elapsed, latencies.mean(),
+            np.percentile(latencies, percentile), max(durations))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-n', '--intfs', default='100,1000,10000',
+                        help='interface counts, comma separated')
+    parser.add_argument('-t', '--ticks', type=int, default=10)
+    parser.add_argument('-m', '--modes', default='single,batch,async')
+    parser.add_argument('-l', '--latency', type=float, default=0.,
+                        help='delay (s) of the server before answering')
+    parser.add_argument('-s', '--step', type=float, default=1.,
+                        help='standard deviation of the moves per tick (m)')
+    parser.add_argument('-p', '--percentile', type=float, default=99.,
+                        help='percentile of the latencies reported')
+    args = parser.parse_args()
+
+    setLogLevel('info')
+    info('%8s %8s %12s %14s %14s %14s\n' % (
+        'intfs', 'mode', 'updates/s', 'mean lat (us)',
+        'p%g lat (us)' % args.percentile, 'max tick (ms)'))
+    for n in [int(n) for n in args.intfs.split(',')]:
+        for mode in args.modes.split(','):
+            rate, mean, high, max_tick = run(n, args.ticks, mode,
+                                             args.latency, args.step,
+                                             percentile=args.percentile)
+            info('%8d %8s %12.0f %14.1f %14.1f %14.1f\n' % (
+                n, mode, rate, mean * 1e6, high * 1e6, max_tick * 1e3))
+
+
+if __name__ == '__main__':
+    main()
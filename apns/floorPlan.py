@@ -0,0 +1,258 @@
+"""Floor plans for the floorPlan propagation model.
+
+Walls are segments with the attenuation (dB) a signal loses crossing
+them. They are read from a text file:
+
+    # name attenuation(dB)
+    material concrete 12
+    # x1 y1 x2 y2 material (or attenuation)
+    wall 0 0 20 0 concrete
+    wall 10 0 10 8 3.5
+
+and registered in the cells of a uniform grid, so a link is only tested
+against the walls of the cells it goes through."""
+
+import math
+
+import numpy as np
+
+from apns.log import debug
+
+
+class FloorPlan(object):
+    materials = {'concrete': 12., 'brick': 8., 'wood': 4., 'drywall': 3.,
+                 'glass': 2., 'metal': 20.}
+    eps = 1e-9
+
+    def __init__(self, walls=None, file_=None, cell=5.):
+        """:param walls: list of (x1, y1, x2, y2, attenuation)
+        :param file_: floor plan file, see above
+        :param cell: grid cell size (m)"""
+        self.materials = dict(self.materials)
+        walls = list(walls or [])
+        if file_:
+            walls += self.load(file_)
+        self.walls = np.array([wall[:4] for wall in walls],
+                              dtype=float).reshape(-1, 4)
+        self.loss = np.array([wall[4] for wall in walls], dtype=float)
+        self.cell = float(cell)
+        self.cells = {}  # (i, j): ids of the walls in the cell
+        self.origin = np.zeros(2)
+        self.shape = (0, 0)
+        if len(self.walls):
+            self.build_grid()
+
+    def __len__(self):
+        return len(self.walls)
+
+    def load(self, file_):
+        walls = []
+        with open(file_) as f:
+            for line in f:
+                fields = line.split('#')[0].split()
+                if not fields:
+                    continue
+                if fields[0] == 'material':
+                    self.materials[fields[1]] = float(fields[2])
+                elif fields[0] == 'wall':
+                    x1, y1, x2, y2 = [float(v) for v in fields[1:5]]
+                    walls.append((x1, y1, x2, y2,
+                                  self.get_attenuation(fields[5])))
+                else:
+                    raise Exception('%s: unknown line %s' % (file_, line))
+        debug('%s walls loaded from %s\n' % (len(walls), file_))
+        return walls
+
+    def get_attenuation(self, material):
+        if material in self.materials:
+            return self.materials[material]
+        return float(material)
+
+    def build_grid(self):
+        xs, ys = self.walls[:, [0, 2]], self.walls[:, [1, 3]]
+        self.origin = np.array([xs.min(), ys.min()]) - self.cell
+        top = np.array([xs.max(), ys.max()]) + self.cell
+        self.shape = tuple(int(n) for n in
+                           np.ceil((top - self.origin) / self.cell))
+        for idx, (x1, y1, x2, y2) in enumerate(self.walls):
+            i1, j1 = self.get_cell(min(x1, x2) - self.eps,
+                                   min(y1, y2) - self.eps)
+            i2, j2 = self.get_cell(max(x1, x2) + self.eps,
+                                   max(y1, y2) + self.eps)
+            for i in range(i1, i2 + 1):
+                for j in range(j1, j2 + 1):
+                    self.cells.setdefault((i, j), []).append(idx)
+        # the same, flat: walls of cell c are cell_walls[starts[c]:starts[c + 1]]
+        counts = np.zeros(self.shape[0] * self.shape[1], dtype=np.int64)
+        for (i, j), walls in self.cells.items():
+            counts[i * self.shape[1] + j] = len(walls)
+        self.starts = np.concatenate(([0], np.cumsum(counts)))
+        self.cell_walls = np.zeros(self.starts[-1], dtype=np.int64)
+        for (i, j), walls in self.cells.items():
+            start = self.starts[i * self.shape[1] + j]
+            self.cell_walls[start:start + len(walls)] = walls
+
+    def get_cell(self, x, y):
+        return (int(math.floor((x - self.origin[0]) / self.cell)),
+                int(math.floor((y - self.origin[1]) / self.cell)))
+
+    def clip(self, p, q):
+        """Liang-Barsky: part of p -> q inside the grid, None if none"""
+        t0, t1 = 0., 1.
+        d = (q[0] - p[0], q[1] - p[1])
+        for axis in range(2):
+            low = self.origin[axis]
+            high = low + self.shape[axis] * self.cell
+            if d[axis] == 0:
+                if not low <= p[axis] <= high:
+                    return None
+                continue
+            ta = (low - p[axis]) / d[axis]
+            tb = (high - p[axis]) / d[axis]
+            t0, t1 = max(t0, min(ta, tb)), min(t1, max(ta, tb))
+            if t0 > t1:
+                return None
+        return ((p[0] + t0 * d[0], p[1] + t0 * d[1]),
+                (p[0] + t1 * d[0], p[1] + t1 * d[1]))
+
+    def candidates(self, p, q):
+        """Walls registered in the cells p -> q goes through (grid DDA)"""
+        found = set()
+        clipped = self.clip(p, q)
+        if not self.cells or clipped is None:
+            return found
+        (x, y), (x2, y2) = clipped
+        i, j = self.get_cell(x, y)
+        i_end, j_end = self.get_cell(x2, y2)
+        dx, dy = x2 - x, y2 - y
+        step_i = 1 if dx > 0 else -1
+        step_j = 1 if dy > 0 else -1
+        if dx:
+            edge = self.origin[0] + (i + (dx > 0)) * self.cell
+            t_max_x, t_delta_x = (edge - x) / dx, self.cell / abs(dx)
+        else:
+            t_max_x = t_delta_x = float('inf')
+        if dy:
+            edge = self.origin[1] + (j + (dy > 0)) * self.cell
+            t_max_y, t_delta_y = (edge - y) / dy, self.cell / abs(dy)
+        else:
+            t_max_y = t_delta_y = float('inf')
+        steps = abs(i_end - i) + abs(j_end - j)
+        for _ in range(steps + 1):
+            found.update(self.cells.get((i, j), ()))
+            if t_max_x < t_max_y:
+                t_max_x += t_delta_x
+                i += step_i
+            else:
+                t_max_y += t_delta_y
+                j += step_j
+        return found
+
+    def crossings(self, p, q, walls):
+        """:return: which walls the segment p -> q crosses"""
+        w = self.walls[walls]
+        rx, ry = q[..., 0] - p[..., 0], q[..., 1] - p[..., 1]
+        sx, sy = w[:, 2] - w[:, 0], w[:, 3] - w[:, 1]
+        ax, ay = w[:, 0] - p[..., 0], w[:, 1] - p[..., 1]
+        denom = rx * sy - ry * sx
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (ax * sy - ay * sx) / denom
+            u = (ax * ry - ay * rx) / denom
+        return (denom != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+
+    def get_loss(self, p, q):
+        """:return: attenuation (dB) of the walls between p and q"""
+        walls = sorted(self.candidates(p, q))
+        if not walls:
+            return 0.
+        crossed = self.crossings(np.asarray(p[:2], dtype=float),
+                                 np.asarray(q[:2], dtype=float), walls)
+        loss = 0.
+        for value in self.loss[walls][crossed]:
+            loss += value
+        return float(loss)
+
+    def get_losses(self, src, dst):
+        """Batched get_loss, the cells of all the links are walked at once
+        :param src: array of positions, (..., 2 or 3)
+        :param dst: array of positions broadcasting against src
+        :return: attenuation of every src -> dst link"""
+        src, dst = np.broadcast_arrays(np.asarray(src, dtype=float)[..., :2],
+                                       np.asarray(dst, dtype=float)[..., :2])
+        shape = src.shape[:-1]
+        src, dst = src.reshape(-1, 2), dst.reshape(-1, 2)
+        losses = np.zeros(len(src))
+        if self.cells:
+            links, walls = self.get_pairs(src, dst)
+            crossed = self.crossings(src[links], dst[links], walls)
+            # in order, as get_loss adds them
+            np.add.at(losses, links[crossed], self.loss[walls][crossed])
+        return losses.reshape(shape)
+
+    def clip_all(self, src, dst):
+        """Vectorized clip: :return: the links crossing the grid and the
+        ends of their part inside"""
+        d = dst - src
+        low = self.origin
+        high = low + np.array(self.shape) * self.cell
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ta, tb = (low - src) / d, (high - src) / d
+        inside = (low <= src) & (src <= high)
+        t_in = np.where(d == 0, np.where(inside, -np.inf, np.inf),
+                        np.minimum(ta, tb))
+        t_out = np.where(d == 0, np.where(inside, np.inf, -np.inf),
+                         np.maximum(ta, tb))
+        t0 = np.maximum(0., t_in.max(axis=1))
+        t1 = np.minimum(1., t_out.min(axis=1))
+        with np.errstate(invalid='ignore'):
+            links = np.nonzero((t0 <= t1) & np.isfinite(d).all(axis=1))[0]
+        return (links, src[links] + t0[links, None] * d[links],
+                src[links] + t1[links, None] * d[links])
+
+    def get_pairs(self, src, dst):
+        """:return: (link, wall) candidate pairs, sorted and unique"""
+        links, a, b = self.clip_all(src, dst)
+        shape = np.array(self.shape)
+        c0 = np.floor((a - self.origin) / self.cell).astype(np.int64)
+        c1 = np.floor((b - self.origin) / self.cell).astype(np.int64)
+        step = np.where(c1 >= c0, 1, -1)
+        # cell boundaries crossed, per axis
+        event_links, event_t, event_axis = [], [], []
+        for axis in range(2):
+            count = np.abs(c1[:, axis] - c0[:, axis])
+            idx = np.repeat(np.arange(len(links)), count)
+            m = get_ranges(np.zeros(len(links), dtype=np.int64), count) + 1
+            up = step[idx, axis] > 0
+            edge = c0[idx, axis] + np.where(up, m, 1 - m)
+            coord = self.origin[axis] + edge * self.cell
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t = (coord - a[idx, axis]) / (b[idx, axis] - a[idx, axis])
+            event_links.append(idx)
+            event_t.append(t)
+            event_axis.append(np.full(len(idx), axis))
+        idx = np.concatenate(event_links)
+        axis = np.concatenate(event_axis)
+        order = np.lexsort((1 - axis, np.concatenate(event_t), idx))
+        idx, axis = idx[order], axis[order]
+        # cell entered by every event: start cell plus the steps so far
+        moves = np.zeros((len(idx), 2), dtype=np.int64)
+        moves[np.arange(len(idx)), axis] = step[idx, axis]
+        moves = np.cumsum(moves, axis=0)
+        first = np.searchsorted(idx, np.arange(len(links)))
+        before = np.vstack((np.zeros((1, 2), dtype=np.int64), moves))[first]
+        cells = np.vstack((c0, c0[idx] + moves - before[idx]))
+        cell_links = np.concatenate((np.arange(len(links)), idx))
+        cells = np.clip(cells, 0, shape - 1)
+        cell = cells[:, 0] * self.shape[1] + cells[:, 1]
+        count = self.starts[cell + 1] - self.starts[cell]
+        walls = self.cell_walls[get_ranges(self.starts[cell], count)]
+        pairs = np.unique(np.repeat(links[cell_links], count) * len(self) +
+                          walls)
+        return pairs // len(self), pairs % len(self)
+
+
+def get_ranges(starts, counts):
+    """:return: concatenated arange(start, start + count)"""
+    ends = np.cumsum(counts)
+    return np.repeat(starts - ends + counts, counts) + \
+        np.arange(ends[-1] if len(ends) else 0)
@@ -5,10 +5,14 @@ from os import system as sh, getpid
 from subprocess import check_output as co, CalledProcessError
 from time import sleep
 
+import numpy as np
+
+from apns.channelEquation import ChannelEquation
 from apns.devices import DeviceRate
 from apns.frequency import Frequency as Getfreq
 from apns.log import error, debug, info
-from apns.propagationModels import SetSignalRange, GetPowerGivenRange
+from apns.propagationModels import RangeCache
+from apns.rateEngine import RateEngine
 from apns.util import makeIntfPair
 from apns.wmediumdConnector import DynamicIntfRef, \
     WStarter, SNRLink, w_pos, w_cst, w_server, ERRPROBLink, \
@@ -583,6 +587,7 @@ class IntfWireless(Intf):
     eqDelay = '(dist / 10) + 1'
     eqLatency = '(dist / 10)/2'
     eqBw = ' * (1.01 ** -dist)'
+    rate_engine = True  # bw and loss from the signal tables (see RateEngine)
 
     def __init__(self, name, node=None, port=None, link=None,
                  mac=None, ifb=None, id=None, country_code=None, **params):
@@ -609,28 +614,65 @@ class IntfWireless(Intf):
         self.config(**params)
 
     def configWLink(self, dist=0):
-        bw = self.get_bw(dist)
-        loss = self.get_loss(dist)
+        rate = RateEngine.get_rate(self) \
+            if self.rate_engine and not wmediumd_mode.mode else None
+        if rate:
+            bw, loss = rate
+        else:
+            bw = self.get_bw(dist)
+            loss = self.get_loss(dist)
         latency = self.get_latency(dist)
         self.config_tc(bw=bw, loss=loss, latency=latency)
 
     def getDelay(self, dist):
         """Based on RandomPropagationDelayModel"""
-        return eval(self.eqDelay)
+        return ChannelEquation.get(self.eqDelay)(dist)
 
     def get_latency(self, dist):
-        return eval(self.eqLatency)
+        return ChannelEquation.get(self.eqLatency)(dist)
 
     def get_loss(self, dist):
-        return eval(self.eqLoss)
+        return ChannelEquation.get(self.eqLoss)(dist)
+
+    @staticmethod
+    def get_bw_equation(eqBw):
+        """eqBw goes on the custom rate of the mode, e.g. ' * (1.01 ** -dist)'"""
+        return ChannelEquation.get('rate' + eqBw, ('dist', 'rate'))
 
     def get_bw(self, dist):
-        # dist is used by eval
         custombw = self.getCustomRate()
-        rate = eval(str(custombw) + self.eqBw)
+        rate = self.get_bw_equation(self.eqBw)(dist, custombw)
         if rate <= 0.0: rate = 0.1
         return rate
 
+    @staticmethod
+    def get_wlink_params(intfs, dists):
+        """Batched configWLink: bw, loss and latency of many links at once
+        :param intfs: station interfaces
+        :param dists: distance of each one to its AP
+        :return: arrays of bw, loss and latency"""
+        dists = np.asarray(dists, dtype=float)
+        cls = IntfWireless
+        rates = [intf.getCustomRate() for intf in intfs]
+        rates = np.array([np.nan if rate is None else rate for rate in rates])
+        bw = cls.get_bw_equation(cls.eqBw).batch(dists, rates)
+        bw = np.where(bw <= 0.0, 0.1, bw)
+        loss = ChannelEquation.get(cls.eqLoss).batch(dists)
+        latency = ChannelEquation.get(cls.eqLatency).batch(dists)
+        if cls.rate_engine and not wmediumd_mode.mode:
+            groups = {}
+            for idx, intf in enumerate(intfs):
+                if intf.rssi:
+                    table = RateEngine.get_table(
+                        intf.mode, intf.band, RateEngine.is_short_gi(intf))
+                    if table is not None:
+                        groups.setdefault(table, []).append(idx)
+            for table, idx in groups.items():
+                rssi = np.array([intfs[i].rssi for i in idx], dtype=float)
+                bw[idx], loss[idx] = table.get(rssi)
+                bw[idx] = np.maximum(bw[idx], 0.1)
+        return bw, loss, latency
+
     def config_tc(self, **args):
         if self.ifb: self.set_tc(self.ifb, **args)
         self.set_tc(self.name, **args)
@@ -728,17 +770,17 @@ class IntfWireless(Intf):
 
     def setGainWmediumd(self, gain):
         """Sends Antenna Gain to wmediumd"""
-        if wmediumd_mode.mode == w_cst.INTERFERENCE_MODE:
+        if wmediumd_mode.mode == w_cst.INTERFERENCE_MODE and w_server.connected:
             w_server.update_gain(w_gain(self.wmIface, int(gain)))
 
     def setHeightWmediumd(self, height):
         """Sends Antenna Height to wmediumd"""
-        if wmediumd_mode.mode == w_cst.INTERFERENCE_MODE:
+        if wmediumd_mode.mode == w_cst.INTERFERENCE_MODE and w_server.connected:
             w_server.update_height(w_height(self.wmIface, int(height)))
 
     def setTXPowerWmediumd(self):
         """Sends TxPower to wmediumd"""
-        if wmediumd_mode.mode == w_cst.INTERFERENCE_MODE:
+        if wmediumd_mode.mode == w_cst.INTERFERENCE_MODE and w_server.connected:
             w_server.update_txpower(w_txpower(self.wmIface, self.txpower))
 
     def setSNRWmediumd(self, ap_intf, snr):
@@ -752,9 +794,15 @@ class IntfWireless(Intf):
 
     def sendIntfTowmediumd(self):
         """Dynamically sending nodes to wmediumd"""
+        wmIface = getattr(self, 'wmIface', None)
+        if wmIface is not None and wmIface.sta_id is not None:
+            return  # listed in the configuration wmediumd started with
         self.wmIface = DynamicIntfRef(self.node, intf=self.name)
         self.node.wmIfaces.append(self.wmIface)
-        w_server.register_interface(self.mac)
+        if not w_server.connected:
+            return  # wmediumd starts with it (see wmediumd)
+        # queued with the other stations added at once (see Wmnet.addSta)
+        w_server.register_interface(self.mac, self.wmIface)
 
     def getCustomRate(self):
         mode_rate = {'a': 11, 'b': 3, 'g': 11, 'n': 600, 'n2': 600,
@@ -796,6 +844,8 @@ class IntfWireless(Intf):
         for intf in self.node.intfs:
             if self.node.intfs[intf].name == self.name:
                 self.node.intfs[intf].name = args[0]
+        if args[0] != self.name and hasattr(self, 'wmIface'):
+            self.wmIface.reset(intf=args[0])
         self.name = args[0]
 
     def setAPChannel(self, channel):
@@ -847,10 +897,10 @@ class IntfWireless(Intf):
         self.mode = mode
 
     def getTxPowerGivenRange(self):
-        txpower = GetPowerGivenRange(self).txpower
+        txpower = RangeCache.get_txpower(self)
         self.setTxPower(txpower)
         if self.txpower == 1:
-            min_range = int(SetSignalRange(self).range)
+            min_range = int(RangeCache.get_range(self))
             if self.range < min_range:
                 info('*** {}: the signal range should be '
                      'changed to (at least) {}m\n'.format(self.name, min_range))
@@ -1103,14 +1153,17 @@ class IntfWireless(Intf):
             if not wmediumd_mode.mode == w_cst.INTERFERENCE_MODE:
                 if self.rssi == 0:
                     self.update_client_params(ap_intf)
-            if ap_intf != self.associatedTo or not self.associatedTo:
+            associating = ap_intf != self.associatedTo or not self.associatedTo
+            if associating:
                 self.associate_infra(ap_intf)
+            if not wmediumd_mode.mode == w_cst.INTERFERENCE_MODE:
+                # before tc is set up: RateEngine takes the rate from it
+                self.rssi = self.get_rssi(ap_intf, dist)
+            if associating:
                 if wmediumd_mode.mode == w_cst.WRONG_MODE:
                     if dist >= 0.01: self.configWLink(dist)
                 if self not in ap_intf.associatedStations:
                     ap_intf.associatedStations.append(self)
-            if not wmediumd_mode.mode == w_cst.INTERFERENCE_MODE:
-                self.rssi = self.get_rssi(ap_intf, dist)
 
     def associate(self, ap_intf):
         """Associate to Access Point"""
@@ -1141,7 +1194,10 @@ class IntfWireless(Intf):
     def setMAC(self, macstr):
         """Set the MAC address for an interface.
            macstr: MAC address as string"""
+        changed = macstr != self.mac
         self.mac = macstr
+        if changed and hasattr(self, 'wmIface'):
+            self.wmIface.reset()  # packed again with the new address
         return (self.ipLink('down') +
                 self.ipLink('address', macstr) +
                 self.ipLink('up'))
@@ -1192,6 +1248,8 @@ class IntfWireless(Intf):
             self.node.nameToIntf[newname] = self.node.nameToIntf.pop(self.name)
         self.ipLink('down')
         result = self.cmd('ip link set', self.name, 'name', newname)
+        if newname != self.name and hasattr(self, 'wmIface'):
+            self.wmIface.reset(intf=newname)
         self.name = newname
         self.ipLink('up')
         return result
@@ -1583,7 +1641,9 @@ class WirelessLink(TCIntf, IntfWireless):
         self.id = wlan
 
     def assign_params_to_intf(self, intf, wlan):
-        if intf and hasattr(intf, 'wmIface'): self.wmIface = intf.wmIface
+        if intf and hasattr(intf, 'wmIface'):
+            self.wmIface = intf.wmIface
+            self.wmIface.reset(intf=intf.name)  # now references self
 
         for key in self.__dict__.keys():
             if key in self.node.params:
@@ -2000,16 +2060,45 @@ class wmediumd(object):
     def __init__(self, **kwargs):
         self.cleanStartWmediumd(**kwargs)
 
-    def cleanStartWmediumd(self, fading_cof, noise_th,
-                      ppm):
-        """Configure wmediumd"""
-        intfrefs = []
-        isnodeaps = []
-
-        WStarter(intfrefs=intfrefs, links=self.links, pos=self.positions,
-                 fading_cof=fading_cof, noise_th=noise_th, txpowers=self.txpowers,
+    def cleanStartWmediumd(self, fading_cof, noise_th, ppm, aps=(),
+                           stations=(), **kwargs):
+        """Configure wmediumd. In the interference mode, it starts with
+        the interfaces of the nodes added so far in its configuration,
+        the ones added later being registered to it
+        :param aps: APs, stations: stations already added"""
+        intfrefs, positions, txpowers, isnodeaps = [], [], [], []
+        if wmediumd_mode.mode == w_cst.INTERFERENCE_MODE:
+            for isnodeap, nodes in ((1, aps), (0, stations)):
+                for node in nodes:
+                    for intfref, pos, txpower in self.get_intfrefs(node):
+                        intfrefs.append(intfref)
+                        positions.append(w_pos(intfref, pos))
+                        txpowers.append(w_txpower(intfref, txpower))
+                        isnodeaps.append(isnodeap)
+
+        WStarter(intfrefs=intfrefs, links=self.links, pos=positions,
+                 fading_cof=fading_cof, noise_th=noise_th, txpowers=txpowers,
                  isnodeaps=isnodeaps, ppm=ppm)
 
+    def get_intfrefs(self, node):
+        """:return: (intf ref, position, txpower) of the interfaces of a
+        node not registered to wmediumd yet"""
+        posX, posY, posZ = self.get_position(getattr(node, 'position', None))
+        if not hasattr(node, 'wmIfaces'):
+            node.wmIfaces = []
+        for intf in node.wintfs.values():
+            if isinstance(intf, (phyAP, _4addrAP)):
+                continue
+            intfref = getattr(intf, 'wmIface', None)
+            if intfref is None:
+                intfref = intf.wmIface = DynamicIntfRef(node, intf=intf.name)
+                node.wmIfaces.append(intfref)
+            if intfref.sta_id is None:
+                # as Node.set_pos_wmediumd places them
+                offset = node.wmIfaces.index(intfref) \
+                    if intfref in node.wmIfaces else 0
+                yield intfref, [posX + offset, posY, posZ], int(intf.txpower)
+
     @staticmethod
     def get_position(pos=None):
         if pos: return float(pos[0]), float(pos[1]), float(pos[2])
@@ -2268,6 +2357,7 @@ class adhoc(LinkAttrs):
 
         if intf and hasattr(intf, 'wmIface'):
             self.wmIface = intf.wmIface
+            self.wmIface.reset(intf=intf.name)  # now references self
 
         if 'mp' in intf.name:
             self.iwdev_cmd('{} del'.format(intf.name))
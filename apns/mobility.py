@@ -1,16 +1,21 @@
 import time as tm
 from glob import glob
 from os import system as sh, getpid
-from threading import Thread
+from threading import Thread, Condition
 
 import numpy as np
-from numpy.random import rand
 
 from apns.associationControl import AssociationControl as AssCtrl
-from apns.link import mesh, adhoc, ITSLink, master
+from apns.clock import SimClock, VirtualClock
+from apns.link import mesh, adhoc, ITSLink, master, IntfWireless
 from apns.log import debug
+from apns.mobilityProcess import MobilityProcess
+from apns.mobilityTrace import TraceRecorder
 from apns.plot import PlotGraph
-from apns.wmediumdConnector import w_cst, wmediumd_mode
+from apns.propagationMatrix import PropagationMatrix
+from apns.randomStreams import NodeRandom, RandomStreams
+from apns.spatialIndex import SpatialGrid
+from apns.wmediumdConnector import w_cst, w_server, wmediumd_mode
 
 class Mobility(object):
     aps = []
@@ -20,6 +25,25 @@ class Mobility(object):
     pause_simulation = False
     allAutoAssociation = True
     thread_ = ''
+    use_spatial_index = True
+    spatial_cell_size = None  # None: largest AP range
+    spatial_index = None
+    use_propagation_matrix = True
+    matrix = None  # PropagationMatrix of the pass in progress
+    wlinks = None  # (intf, dist) whose tc the pass in progress configures
+    dirty = set()  # nodes moved since the last association pass
+    retry = set()  # nodes left unassociated, evaluated again every pass
+    dirty_cond = Condition()
+    ap_check_interval = 1  # seconds between checks for AP changes
+    # ap intf -> (position, range, txpower, antennaGain[, stations])
+    ap_state = {}
+    counters = {'evaluated': 0, 'skipped': 0, 'since': 0}
+    association_stats = {'evaluated': 0.0, 'skipped': 0.0}  # per second
+    tick_interval = None  # None: default step of each mobility driver
+    clock = None  # SimClock of the running mobility driver
+    dilation = None  # simulated seconds per wall-clock second
+    stepped = False  # run ticks back to back, as fast as possible
+    headless = False  # association is bookkeeping only: no iw/wpa/tc/wmediumd
 
     def move_factor(self, node, diff_time):
         """:param node: node
@@ -53,14 +77,53 @@ class Mobility(object):
         diff_time = node.endTime - node.startTime - 1
         node.moveFac = self.move_factor(node, diff_time)
 
+    def get_clock(self, interval, name, clock=None, shared=True):
+        """Clock the mobility driver schedules its steps against
+        :param shared: becomes the clock positions are recorded with"""
+        if clock is None:
+            interval = self.tick_interval or interval
+            if self.stepped or self.dilation:
+                clock = VirtualClock(interval, name=name, dilation=self.dilation)
+            else:
+                clock = SimClock(interval, name=name)
+        if shared:
+            Mobility.clock = clock
+        return clock
+
     def set_pos(self, node, pos):
         node.position = pos
-        if wmediumd_mode.mode == w_cst.INTERFERENCE_MODE and self.thread_._keep_alive:
+        TraceRecorder.record(node, pos, self.clock)
+        if wmediumd_mode.mode == w_cst.INTERFERENCE_MODE and self.thread_._keep_alive \
+                and not self.headless:
             node.set_pos_wmediumd(pos)
+        self.set_dirty(node)
+
+    def step_links(self, nodes):
+        """Headless mode: the association pass runs in the mobility thread
+        right after each tick, so results do not depend on thread timing"""
+        if not self.headless or not self.allAutoAssociation:
+            return
+        nodes = [node for node in nodes if node not in self.aps]
+        if self.ap_state is None:
+            self.get_changed_aps()
+            self.set_dirty(*nodes)
+        dirty = self.get_dirty_nodes(nodes, wait=False)
+        self.count(len(dirty), len(nodes) - len(dirty))
+        if dirty:
+            self.config_links(dirty)
+
+    @classmethod
+    def set_dirty(cls, *nodes):
+        """Wakes the association pass up for these nodes"""
+        with cls.dirty_cond:
+            cls.dirty.update(nodes)
+            cls.dirty_cond.notify_all()
 
     def set_wifi_params(self):
         """Opens a thread for wifi parameters"""
-        if self.allAutoAssociation:
+        Mobility.ap_state = None
+        Mobility.retry = set()
+        if self.allAutoAssociation and not self.headless:
             thread_ = Thread(name='wifiParameters', target=self.parameters)
             thread_.daemon = True
             thread_.start()
@@ -89,7 +152,11 @@ class Mobility(object):
 
     def ap_out_of_range(self, intf, ap_intf):
         """When ap is out of range"""
-        if ap_intf == intf.associatedTo:
+        if ap_intf == intf.associatedTo and self.headless:
+            if not ap_intf.ieee80211r:
+                intf.setDisconnected(ap_intf)
+            self.remove_node_in_range(intf, ap_intf)
+        elif ap_intf == intf.associatedTo:
             if ap_intf.encrypt and not ap_intf.ieee80211r:
                 if ap_intf.encrypt == 'wpa' and not ap_intf.ieee80211r:
                     self.kill_wpasupprocess(intf)
@@ -105,7 +172,7 @@ class Mobility(object):
     def ap_in_range(self, intf, ap, dist):
         for ap_intf in ap.wintfs.values():
             if isinstance(ap_intf, master):
-                rssi = intf.get_rssi(ap_intf, dist)
+                rssi = self.get_rssi(intf, ap_intf, dist)
                 intf.apsInRange[ap_intf.node] = rssi
                 ap_intf.stationsInRange[intf.node] = rssi
                 if ap_intf == intf.associatedTo:
@@ -117,6 +184,8 @@ class Mobility(object):
                             pass
                         else:
                             intf.rssi = rssi
+                            if self.headless:
+                                continue
                             # send rssi to wemu
                             if hasattr(intf.node, 'phyid'):
                                 intf.rec_rssi()
@@ -126,10 +195,25 @@ class Mobility(object):
                             else:
                                 if hasattr(intf.node, 'pos') and intf.node.position != intf.node.pos:
                                     intf.node.pos = intf.node.position
-                                    intf.configWLink(dist)
+                                    if self.wlinks is None:
+                                        intf.configWLink(dist)
+                                    else:
+                                        self.wlinks.append((intf, dist))
+
+    def get_distance(self, intf, ap):
+        dist = self.matrix.distance(intf, ap) if self.matrix else None
+        if dist is None:
+            dist = intf.node.get_distance_to(ap)
+        return dist
+
+    def get_rssi(self, intf, ap_intf, dist):
+        rssi = self.matrix.get_rssi(intf, ap_intf, dist) if self.matrix else None
+        if rssi is None:
+            rssi = intf.get_rssi(ap_intf, dist)
+        return rssi
 
     def check_in_range(self, intf, ap_intf):
-        dist = intf.node.get_distance_to(ap_intf.node)
+        dist = self.get_distance(intf, ap_intf.node)
         if dist > ap_intf.range:
             self.ap_out_of_range(intf, ap_intf)
             return 0
@@ -137,7 +221,7 @@ class Mobility(object):
 
     def set_handover(self, intf, aps):
         for ap in aps:
-            dist = intf.node.get_distance_to(ap)
+            dist = self.get_distance(intf, ap)
             for ap_wlan, ap_intf in enumerate(ap.wintfs.values()):
                 self.do_handover(intf, ap_intf)
             self.ap_in_range(intf, ap, dist)
@@ -157,41 +241,218 @@ class Mobility(object):
         if self.check_if_ap_exists(intf, ap_intf):
             if not intf.associatedTo or changeAP:
                 if ap_intf.node != intf.associatedTo:
-                    intf.associate_infra(ap_intf)
+                    self.associate(intf, ap_intf)
+
+    def associate(self, intf, ap_intf):
+        if self.headless:
+            self.associate_analytic(intf, ap_intf)
+        else:
+            intf.associate_infra(ap_intf)
+
+    @staticmethod
+    def associate_analytic(intf, ap_intf):
+        """Same outcome as associate_infra, without running iw or
+        wpa_supplicant"""
+        if not ap_intf.ieee80211r or (intf.encrypt and 'wpa' not in intf.encrypt):
+            if ap_intf.encrypt:
+                if intf.associatedTo:
+                    return
+                if not ('wpa' in ap_intf.encrypt and
+                        (not intf.encrypt or 'wpa' in intf.encrypt)) \
+                        and ap_intf.encrypt != 'wep':
+                    return
+        old = intf.associatedTo
+        if old and old != ap_intf and intf in getattr(old, 'associatedStations', []):
+            old.associatedStations.remove(intf)
+        intf.associatedTo = ap_intf
+        if intf not in ap_intf.associatedStations:
+            ap_intf.associatedStations.append(intf)
+        intf.update_client_params(ap_intf)
 
     def parameters(self):
         """Applies channel params and handover"""
         mob_nodes = list(set(self.mobileNodes) - set(self.aps))
+        Mobility.ap_state = {}
+        self.get_changed_aps()
+        self.set_dirty(*mob_nodes)
         while self.thread_._keep_alive:
-            self.config_links(mob_nodes)
+            nodes = self.get_dirty_nodes(mob_nodes)
+            self.count(len(nodes), len(mob_nodes) - len(nodes))
+            if nodes:
+                self.config_links(nodes)
+
+    def wait_dirty(self, wait=True):
+        with self.dirty_cond:
+            if not self.dirty and wait:
+                self.dirty_cond.wait(self.ap_check_interval)
+            dirty, Mobility.dirty = Mobility.dirty, set()
+        return dirty
+
+    def get_dirty_nodes(self, mob_nodes, wait=True):
+        """Nodes which moved, the ones left unassociated, plus the ones
+        close to an AP whose position, range, power or (with association
+        control) associated stations changed, in mob_nodes order"""
+        dirty = self.wait_dirty(wait)
+        dirty.update(self.retry)
+        changed = self.get_changed_aps()
+        if changed:
+            dirty.update(self.get_nodes_near(mob_nodes, changed))
+        return [node for node in mob_nodes if node in dirty]
+
+    def get_ap_state(self, ap_intf):
+        pos = ap_intf.node.position
+        pos = tuple(float(p) for p in pos[:3]) if pos is not None else None
+        state = pos, ap_intf.range, ap_intf.txpower, ap_intf.antennaGain
+        if getattr(self, 'ac', None):
+            # the load of an AP decides where its neighbours go
+            state += (frozenset(getattr(ap_intf, 'associatedStations', ())),)
+        return state
+
+    def get_changed_aps(self):
+        """:return: {ap intf: (previous state, current state)}"""
+        changed = {}
+        if Mobility.ap_state is None:
+            Mobility.ap_state = {}
+        for ap in self.aps:
+            for ap_intf in ap.wintfs.values():
+                if isinstance(ap_intf, adhoc) or isinstance(ap_intf, mesh):
+                    continue
+                state = self.get_ap_state(ap_intf)
+                old = self.ap_state.get(ap_intf)
+                if old is not None and old != state:
+                    changed[ap_intf] = (old, state)
+                self.ap_state[ap_intf] = state
+        return changed
+
+    @staticmethod
+    def get_nodes_near(nodes, changed):
+        near = set()
+        for node in nodes:
+            for intf in node.wintfs.values():
+                if intf.associatedTo in changed:
+                    near.add(node)
+            if node in near or node.position is None:
+                continue
+            pos = [float(p) for p in node.position[:3]]
+            for states in changed.values():
+                range_ = max(float(state[1]) for state in states)
+                for state in states:
+                    if state[0] is None or \
+                            sum((a - b) ** 2 for a, b in zip(pos, state[0])) \
+                            <= (range_ + 0.01) ** 2:
+                        near.add(node)
+        return near
+
+    @classmethod
+    def count(cls, evaluated, skipped):
+        """Keeps evaluated/skipped stations per second"""
+        counters = cls.counters
+        counters['evaluated'] += evaluated
+        counters['skipped'] += skipped
+        now = tm.time()
+        elapsed = now - counters['since']
+        if elapsed >= 1:
+            if counters['since']:
+                cls.association_stats = {
+                    'evaluated': counters['evaluated'] / elapsed,
+                    'skipped': counters['skipped'] / elapsed}
+            cls.counters = {'evaluated': 0, 'skipped': 0, 'since': now}
 
     def associate_interference_mode(self, intf, ap_intf):
         if intf.bgscan_module or (intf.active_scan and 'wpa' in intf.encrypt):
             if not intf.associatedTo:
-                intf.associate_infra(ap_intf)
+                self.associate(intf, ap_intf)
                 intf.associatedTo = 'bgscan' if intf.bgscan_module else 'active_scan'
             return 0
 
         return self.check_in_range(intf, ap_intf)
 
+    @staticmethod
+    def is_bgscan(intf):
+        return wmediumd_mode.mode == w_cst.INTERFERENCE_MODE and \
+               (intf.bgscan_module or (intf.active_scan and 'wpa' in intf.encrypt))
+
+    def get_spatial_index(self):
+        if not Mobility.use_spatial_index:
+            return None
+        if Mobility.spatial_index is None:
+            Mobility.spatial_index = SpatialGrid(Mobility.spatial_cell_size)
+        Mobility.spatial_index.sync(self.aps)
+        return Mobility.spatial_index
+
+    def config_links_brute_force(self, intf):
+        aps = []
+        for ap in self.aps:
+            for ap_intf in ap.wintfs.values():
+                if not isinstance(ap_intf, adhoc) and not isinstance(ap_intf, mesh):
+                    if wmediumd_mode.mode == w_cst.INTERFERENCE_MODE:
+                        ack = self.associate_interference_mode(intf, ap_intf)
+                    else:
+                        ack = self.check_in_range(intf, ap_intf)
+                    if ack and ap not in aps:
+                        aps.append(ap)
+        self.set_handover(intf, aps)
+
+    def config_links_indexed(self, intf, index):
+        """Same outcome as config_links_brute_force, but only the APs sharing
+        the station's grid cell are measured. The remaining ones are out of
+        range by construction, so all that is left to do for them is what
+        ap_out_of_range would have done."""
+        aps, measured = [], set()
+        for ap, ap_intf in index.candidates(intf.node):
+            measured.add(ap_intf)
+            if self.check_in_range(intf, ap_intf) and ap not in aps:
+                aps.append(ap)
+        if len(measured) < len(index):
+            ap_intf = intf.associatedTo
+            if ap_intf in index and ap_intf not in measured:
+                self.ap_out_of_range(intf, ap_intf)
+            if not intf.associatedTo:
+                intf.rssi = 0
+        self.set_handover(intf, aps)
+
+    def get_matrix(self, nodes):
+        if not self.use_propagation_matrix:
+            return None
+        intfs = [intf for node in nodes for intf in node.wintfs.values()
+                 if not isinstance(intf, adhoc) and not isinstance(intf, mesh)
+                 and not isinstance(intf, ITSLink)]
+        ap_intfs = [ap_intf for ap in self.aps for ap_intf in ap.wintfs.values()
+                    if not isinstance(ap_intf, adhoc) and not isinstance(ap_intf, mesh)]
+        return PropagationMatrix(intfs, ap_intfs)
+
+    def config_wlinks(self):
+        """configWLink of the links the pass updated, at once"""
+        wlinks, self.wlinks = self.wlinks, None
+        if not wlinks:
+            return
+        intfs = [intf for intf, _ in wlinks]
+        bw, loss, latency = IntfWireless.get_wlink_params(
+            intfs, [dist for _, dist in wlinks])
+        for intf, bw_, loss_, latency_ in zip(intfs, bw.tolist(),
+                                              loss.tolist(), latency.tolist()):
+            intf.config_tc(bw=bw_, loss=loss_, latency=latency_)
+
     def config_links(self, nodes):
+        index = self.get_spatial_index()
+        self.matrix = self.get_matrix(nodes)
+        retry = set()
+        self.wlinks = []
         for node in nodes:
             for intf in node.wintfs.values():
                 if isinstance(intf, adhoc) or isinstance(intf, mesh) or isinstance(intf, ITSLink):
-                    pass
+                    continue
+                elif index is None or self.is_bgscan(intf):
+                    self.config_links_brute_force(intf)
                 else:
-                    aps = []
-                    for ap in self.aps:
-                        for ap_intf in ap.wintfs.values():
-                            if not isinstance(ap_intf, adhoc) and not isinstance(ap_intf, mesh):
-                                if wmediumd_mode.mode == w_cst.INTERFERENCE_MODE:
-                                    ack = self.associate_interference_mode(intf, ap_intf)
-                                else:
-                                    ack = self.check_in_range(intf, ap_intf)
-                                if ack and ap not in aps:
-                                    aps.append(ap)
-                    self.set_handover(intf, aps)
-        tm.sleep(0.0001)
+                    self.config_links_indexed(intf, index)
+                if not intf.associatedTo:
+                    retry.add(node)
+        Mobility.retry = retry
+        self.config_wlinks()
+        self.matrix = None
+        if not self.headless:
+            tm.sleep(0.0001)
 
 
 class ConfigMobility(Mobility):
@@ -236,6 +497,7 @@ class ConfigMobLinks(Mobility):
 
 
 class model(Mobility):
+    lookahead = 64  # steps computed at once by the models supporting it
 
     def __init__(self, **kwargs):
         self.start_thread(**kwargs)
@@ -250,9 +512,13 @@ class model(Mobility):
 
     def models(self, stations=None, aps=None, stat_nodes=None, mob_nodes=None,
                draw=False, seed=1, mob_model='RandomWalk',
-               min_wt=1, max_wt=5, max_x=100, max_y=100, **kwargs):
-        """Used when a mobility model is set"""
+               min_wt=1, max_wt=5, max_x=100, max_y=100, clock=None,
+               mob_process=False, **kwargs):
+        """Used when a mobility model is set
+        :param clock: SimClock or VirtualClock driving the model
+        :param mob_process: generate the steps in a separate process"""
         np.random.seed(seed)
+        RandomStreams.set_seed(seed)
         self.ac = kwargs.get('ac_method', None)
         n_groups = kwargs.get('n_groups', 1)
         self.stations, self.mobileNodes, self.aps = stations, stations, aps
@@ -274,64 +540,80 @@ class model(Mobility):
             return
 
         debug('Configuring the mobility model %s\n' % mob_model)
-        if mob_model == 'RandomWalk':  # Random Walk model
-            for node in mob_nodes:
-                array_ = ['constantVelocity', 'constantDistance']
-                for param in array_:
-                    if not hasattr(node, param):
-                        setattr(node, param, 1)
-            mob = random_walk(mob_nodes)
-        elif mob_model == 'TruncatedLevyWalk':  # Truncated Levy Walk model
-            mob = truncated_levy_walk(mob_nodes)
-        elif mob_model == 'RandomDirection':  # Random Direction model
-            mob = random_direction(mob_nodes, dimensions=(max_x, max_y))
-        elif mob_model == 'RandomWayPoint':  # Random Waypoint model
-            for node in mob_nodes:
-                array_ = ['constantVelocity', 'constantDistance',
-                          'min_v', 'max_v']
-                for param in array_:
-                    if not hasattr(node, param):
-                        setattr(node, param, '1')
-            mob = random_waypoint(mob_nodes, wt_min=min_wt, wt_max=max_wt)
-        elif mob_model == 'GaussMarkov':  # Gauss-Markov model
-            mob = gauss_markov(mob_nodes, alpha=0.99)
-        elif mob_model == 'ReferencePoint':  # Reference Point Group model
-            mob = reference_point_group(mob_nodes, n_groups,
-                                        dimensions=(max_x, max_y),
-                                        aggregation=0.5)
-        elif mob_model == 'TimeVariantCommunity':
-            mob = tvc(mob_nodes, n_groups, dimensions=(max_x, max_y),
-                      aggregation=[0.5, 0.], epoch=[100, 100])
-        elif mob_model == 'CRP':
-            mob = coherence_ref_point(mob_nodes, n_groups, (max_x, max_y),
-                                      kwargs['pointlist'])
+        if mob_process:
+            mob = MobilityProcess(mob_nodes, mob_model, seed,
+                                  n_groups=n_groups, max_x=max_x, max_y=max_y,
+                                  min_wt=min_wt, max_wt=max_wt,
+                                  pointlist=kwargs.get('pointlist'))
         else:
-            raise Exception("Mobility Model not defined or doesn't exist!")
+            mob = get_model(mob_model, mob_nodes, n_groups, max_x, max_y,
+                            min_wt, max_wt, kwargs.get('pointlist'))
 
-        current_time = tm.time()
-        while (tm.time() - current_time) < kwargs['mob_start_time']:
-            pass
+        clock = self.get_clock(0.5, 'mobModel', clock)
+        clock.sleep_until(kwargs.get('mob_start_time', 0))
+        clock.reset()
 
-        self.start_mob_mod(mob, mob_nodes, draw)
+        stop_time = None
+        if isinstance(clock, VirtualClock):
+            # nothing else would end a run going faster than real time
+            stop_time = kwargs.get('mob_stop_time') or None
+        self.start_mob_mod(mob, mob_nodes, draw, stop_time)
 
-    def start_mob_mod(self, mob, nodes, draw):
+    def start_mob_mod(self, mob, nodes, draw, stop_time=None):
         """
         :param mob: mobility params
         :param nodes: list of nodes
         :param draw:
+        :param stop_time: simulation time the model stops at
         """
-        for xy in mob:
-            for idx, node in enumerate(nodes):
-                pos = round(xy[idx][0], 2), round(xy[idx][1], 2), 0.0
-                self.set_pos(node, pos)
-                if draw:
-                    node.update_2d()
+        clock = self.clock or self.get_clock(0.5, 'mobModel')
+        for xy in get_steps(mob, self.lookahead):
+            with w_server.batch_updates(wait=False):
+                for node, (x, y) in zip(nodes, xy):
+                    self.set_pos(node, (x, y, 0.0))
+                    if draw:
+                        node.update_2d()
+            self.step_links(nodes)
             if draw:
                 PlotGraph.pause()
-            else:
-                tm.sleep(0.5)
-            while self.pause_simulation:
-                pass
+            t = clock.wait_tick()
+            if not self.thread_._keep_alive or \
+                    (stop_time is not None and t > stop_time):
+                break
+        if isinstance(mob, MobilityProcess):
+            mob.stop()
+        clock.log_report()
+
+
+class Trajectory(object):
+    """Piecewise-linear path: points[i] (float32) is reached times[i]
+    seconds after the node starts moving. Positions are interpolated when
+    asked for, nothing is materialized per tick."""
+    __slots__ = ('times', 'points')
+
+    def __init__(self, times, points):
+        self.times = np.asarray(times, dtype=np.float64)
+        self.points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+
+    @property
+    def duration(self):
+        return float(self.times[-1])
+
+    def sample(self, t):
+        """Positions at the times in t, as a (len(t), 3) array"""
+        t = np.asarray(t, dtype=np.float64)
+        pos = np.empty(t.shape + (3,))
+        for axis in range(3):
+            pos[..., axis] = np.interp(t, self.times, self.points[:, axis])
+        return pos
+
+    def at(self, t):
+        """Position at time t, clamped to the ends of the path"""
+        x, y, z = self.sample(t)
+        return round(x, 2), round(y, 2), round(z, 2)
+
+    def __len__(self):
+        return len(self.times)
 
 
 class Tracked(Mobility):
@@ -375,11 +657,14 @@ class Tracked(Mobility):
         self.run(mob_nodes, draw, coordinate, dim, **kwargs)
 
     def run(self, mob_nodes, draw, coordinate, dim, mob_start_time=0,
-            mob_stop_time=10, reverse=False, mob_rep=1, **kwargs):
+            mob_stop_time=10, reverse=False, mob_rep=1, clock=None, **kwargs):
+        # nodes advance 0.1s along their path per step, slower clocks
+        # take several steps per tick
+        clock = self.get_clock(0.1, 'tracked', clock)
+        steps = max(1, int(round(clock.interval / 0.1)))
 
         for rep in range(mob_rep):
-            t1 = tm.time()
-            i = 0.1
+            clock.reset()
             if reverse:
                 for node in mob_nodes:
                     if rep % 2 == 1 or (rep % 2 == 0 and rep > 0):
@@ -393,59 +678,42 @@ class Tracked(Mobility):
                     self.calculate_diff_time(node)
                     coordinate[node] = self.create_coord(node, tracked=True)
 
-            while mob_start_time <= tm.time() - t1 <= mob_stop_time:
-                t2 = tm.time()
-                if t2 - t1 >= i:
-                    for node, pos in coordinate.items():
-                        if (t2 - t1) >= node.startTime and node.time <= node.endTime:
-                            node.matrix_id += 1
-                            if node.matrix_id < len(coordinate[node]):
-                                pos = pos[node.matrix_id]
-                            else:
-                                pos = pos[len(coordinate[node]) - 1]
-                            self.set_pos(node, pos)
-                            node.time += 0.1
-                            if draw:
-                                node_update = getattr(node, dim)
-                                node_update()
-                    PlotGraph.pause()
-                    i += 0.1
-                while self.pause_simulation:
-                    pass
+            t = clock.wait_tick()
+            while t <= mob_stop_time and self.thread_._keep_alive:
+                if t >= mob_start_time:
+                    with w_server.batch_updates(wait=False):
+                        for node, pos in coordinate.items():
+                            if t >= node.startTime and node.time <= node.endTime:
+                                node.matrix_id += steps
+                                self.set_pos(node, pos.at(node.matrix_id * 0.1))
+                                for _ in range(steps):
+                                    node.time += 0.1
+                                if draw:
+                                    node_update = getattr(node, dim)
+                                    node_update()
+                    self.step_links(mob_nodes)
+                    if draw:
+                        PlotGraph.pause()
+                t = clock.wait_tick()
+            clock.log_report()
             if rep == mob_rep:
                 self.thread_._keep_alive = False
 
-    @staticmethod
-    def get_total_displacement(node):
-        x, y, z = 0, 0, 0
-        for num, coord in enumerate(node.coord):
-            if num > 0:
-                c0 = node.coord[num].split(',')
-                c1 = node.coord[num - 1].split(',')
-                x += abs(float(c0[0]) - float(c1[0]))
-                y += abs(float(c0[1]) - float(c1[1]))
-                z += abs(float(c0[2]) - float(c1[2]))
-        return (x, y, z)
-
     def create_coord(self, node, tracked=False):
-        coord = []
         if tracked:
-            pos = node.position
-            for _ in range((node.endTime - node.startTime) * 10):
-                x = round(pos[0], 2) + round(node.moveFac[0], 2)
-                y = round(pos[1], 2) + round(node.moveFac[1], 2)
-                z = round(pos[2], 2) + round(node.moveFac[2], 2)
-                pos = (x, y, z)
-                coord.append((x, y, z))
-        else:
-            for idx in range(len(node.coord) - 1):
-                coord.append([node.coord[idx], node.coord[idx + 1]])
-        return coord
+            # steps of moveFac every 0.1s, starting one step away from pos
+            pos = np.round(np.asarray(node.position, dtype=float), 2)
+            step = np.round(np.asarray(node.moveFac, dtype=float), 2)
+            n = (node.endTime - node.startTime) * 10
+            return Trajectory([0, max(n - 1, 0) * 0.1],
+                              [pos + step, pos + n * step])
+        return self.get_waypoints(node)
 
-    def dir(self, p1, p2):
-        if p1 > p2:
-            return False
-        return True
+    @staticmethod
+    def get_waypoints(node):
+        """node.coord ('x,y,z' strings) as a (M, 3) array"""
+        return np.array(','.join(node.coord).split(','),
+                        dtype=float).reshape(-1, 3)
 
     def mob_time(self, node):
         t1 = node.startTime
@@ -455,80 +723,40 @@ class Tracked(Mobility):
         t = t2 - t1
         return t
 
-    def get_points(self, node, a0, a1, total):
-        x1, y1, z1 = float(a0[0]), float(a0[1]), float(a0[2])
-        x2, y2, z2 = float(a1[0]), float(a1[1]), float(a1[2])
-        points = []
-        perc_dif = []
-        ldelta = [0, 0, 0]
-        faxes = [x1, y1, z1]  # first reference point
-        laxes = [x2, y2, z2]  # last refence point
-        dif = [abs(x2 - x1), abs(y2 - y1), abs(z2 - z1)]  # difference first and last axes
-        for n in dif:
-            if n == 0:
-                perc_dif.append(0)
-            else:
-                # we get the difference among axes to calculate the speed
-                perc_dif.append((n * 100) / total[dif.index(n)])
-
-        dmin = min(x for x in perc_dif if x != 0)
-        t = self.mob_time(node) * 1000  # node simulation time
-        dt = t * (dmin / 100)
-
-        for n in perc_dif:
-            if n != 0:
-                ldelta[perc_dif.index(n)] = dif[perc_dif.index(n)] / dt
-
-        # direction of the node
-        dir = (self.dir(x1, x2), self.dir(y1, y2), self.dir(z1, z2))
-
-        for n in np.arange(0, dt, 1):
-            for delta in ldelta:
-                if dir[ldelta.index(delta)]:
-                    if n < dt - 1:
-                        faxes[ldelta.index(delta)] += delta
-                    else:
-                        faxes[ldelta.index(delta)] = laxes[ldelta.index(delta)]
-                else:
-                    if n < dt - 1:
-                        faxes[ldelta.index(delta)] -= delta
-                    else:
-                        faxes[ldelta.index(delta)] = laxes[ldelta.index(delta)]
-            points.append(self.get_position(faxes))
-        return points
-
     def set_coordinates(self, node):
-        coord = self.create_coord(node)
-        total = self.get_total_displacement(node)
-        points = []
-        for c in coord:
-            a0 = c[0].split(',')
-            a1 = c[1].split(',')
-            points += (self.get_points(node, a0, a1, total))
-
-        t = self.mob_time(node) * 10
-        interval = len(points) / t
-        pointsL = []
-        for id in np.arange(0, len(points), interval):
-            if id < len(points) - interval:
-                pointsL.append(points[int(id)])
-            else:
-                # set the last position according to the coordinates
-                pointsL.append(points[int(len(points) - 1)])
-        return pointsL
-
+        """Trajectory through node.coord lasting the node's mobility time.
+        Each leg takes a share of the time equal to the smallest share,
+        among the axes it moves along, of the total displacement on that
+        axis"""
+        points = self.create_coord(node)
+        dif = np.abs(np.diff(points, axis=0))
+        total = dif.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            perc_dif = np.where(dif > 0, dif * 100 / total, np.inf)
+        dmin = perc_dif.min(axis=1)
+        dmin[np.isinf(dmin)] = 0
+        # the legs used to be walked in 1ms steps, one per started ms
+        legs = np.ceil(self.mob_time(node) * 1000 * dmin / 100)
+        elapsed = np.concatenate(([0], np.cumsum(legs)))
+        if elapsed[-1]:
+            elapsed *= self.mob_time(node) / elapsed[-1]
+        return Trajectory(elapsed, points)
 
 # coding: utf-8
 
-# define a Uniform Distribution
-U = lambda MIN, MAX, SAMPLES: rand(*SAMPLES.shape) * (MAX - MIN) + MIN
+# Random draws go through NodeRandom: rng.uniform(MIN, MAX, SAMPLES) and
+# rng.power(ALPHA, MIN, MAX, SAMPLES) draw one number per node index of
+# SAMPLES, from the stream of that node
+
 
-# define a Truncated Power Law Distribution
-P = lambda ALPHA, MIN, MAX, SAMPLES: ((MAX ** (ALPHA + 1.) - 1.) *
-                                      rand(*SAMPLES.shape) + 1.) ** (1. / (ALPHA + 1.))
+def get_rng(nodes):
+    return NodeRandom([node.name for node in nodes])
 
-# define an Exponential Distribution
-E = lambda SCALE, SAMPLES: -SCALE * np.log(rand(*SAMPLES.shape))
+
+def get_bounds(nodes):
+    """:return: MIN_X, MAX_X, MIN_Y, MAX_Y arrays"""
+    return tuple(np.array([getattr(node, attr) for node in nodes], dtype=float)
+                 for attr in ('min_x', 'max_x', 'min_y', 'max_y'))
 
 
 # *************** Palm state probability **********************
@@ -542,11 +770,11 @@ def pause_probability_init(wt_min, wt_max, min_v,
 
 
 # *************** Palm residual ******************************
-def residual_time(mean, delta, shape=(1,)):
+def residual_time(mean, delta, rng, idx):
     t1 = mean - delta
     t2 = mean + delta
-    u = rand(*shape)
-    residual = np.zeros(shape)
+    u = rng.random(idx)
+    residual = np.zeros(idx.shape)
     if delta != 0.0:
         case_1_u = u < (2. * t1 / (t1 + t2))
         residual[case_1_u] = u[case_1_u] * (t1 + t2) / 2.
@@ -558,15 +786,15 @@ def residual_time(mean, delta, shape=(1,)):
 
 
 # *********** Initial speed ***************************
-def initial_speed(speed_mean, speed_delta, shape=(1,)):
+def initial_speed(speed_mean, speed_delta, rng, idx):
     v0 = speed_mean - speed_delta
     v1 = speed_mean + speed_delta
-    u = rand(*shape)
+    u = rng.random(idx)
     return pow(v1, u) / pow(v0, u - 1)
 
 
 def init_random_waypoint(nr_nodes, dimensions, min_v, max_v,
-                         wt_min, wt_max):
+                         wt_min, wt_max, rng):
     x = np.empty(nr_nodes)
     y = np.empty(nr_nodes)
     x_waypoint = np.empty(nr_nodes)
@@ -583,6 +811,7 @@ def init_random_waypoint(nr_nodes, dimensions, min_v, max_v,
     max_x = dimensions[0]
     max_y = dimensions[1]
     for i in range(nr_nodes):
+        rand = rng[i].random
         while True:
             if rand() < q0[i]:
                 # moving[i] = 0.
@@ -621,20 +850,22 @@ def init_random_waypoint(nr_nodes, dimensions, min_v, max_v,
 
     # steady-state positions
     # initially the node has traveled a proportion u2 of the path from (x1,y1) to (x2,y2)
-    u2 = rand(*x.shape)
+    u2 = rng.random(np.arange(nr_nodes))
     x[:] = u2 * x + (1 - u2) * x_waypoint
     y[:] = u2 * y + (1 - u2) * y_waypoint
 
     # steady-state speed and pause time
     paused_bool = moving == 0.
     paused_idx = np.where(paused_bool)[0]
-    pause_time[paused_idx] = residual_time(pause_mean, pause_delta, paused_idx.shape)
+    pause_time[paused_idx] = residual_time(pause_mean, pause_delta, rng,
+                                           paused_idx)
     speed[paused_idx] = 0.0
 
     moving_bool = np.logical_not(paused_bool)
     moving_idx = np.where(moving_bool)[0]
     pause_time[moving_idx] = 0.0
-    speed[moving_idx] = initial_speed(speed_mean, speed_delta, moving_idx.shape)
+    speed[moving_idx] = initial_speed(speed_mean[moving_idx],
+                                      speed_delta[moving_idx], rng, moving_idx)
 
     return x, y, x_waypoint, y_waypoint, speed, pause_time
 
@@ -662,51 +893,55 @@ class RandomWaypoint(object):
         self.init_stationary = True
 
     def __iter__(self):
+        for x, y in self.walk():
+            yield np.dstack((x, y))[0]
 
+    def chunks(self, k=64):
+        """Looks k steps ahead at a time
+        :param k: number of steps per chunk
+        :return: generator of (k, N, 2) arrays; the same buffer is filled
+        again by the next chunk"""
+        return fill_chunks(self.walk(), k, self.nr_nodes)
+
+    def walk(self):
+        """Advances the nodes one step per iteration, in place
+        :return: generator of the x and y arrays"""
         NODES = np.arange(self.nr_nodes)
+        rng = get_rng(self.nodes)
 
-        MAX_V = U(0, 0, NODES)
-        MIN_V = U(0, 0, NODES)
-        MAX_X = U(0, 0, NODES)
-        MAX_Y = U(0, 0, NODES)
-        MIN_X = U(0, 0, NODES)
-        MIN_Y = U(0, 0, NODES)
-
-        for node in range(self.nr_nodes):
-            MAX_V[node] = self.nodes[node].max_v / 10.
-            MIN_V[node] = self.nodes[node].min_v / 10.
-            MAX_X[node] = self.nodes[node].max_x
-            MAX_Y[node] = self.nodes[node].max_y
-            MIN_X[node] = self.nodes[node].min_x
-            MIN_Y[node] = self.nodes[node].min_y
+        MAX_V = np.array([float(node.max_v) for node in self.nodes]) / 10.
+        MIN_V = np.array([float(node.min_v) for node in self.nodes]) / 10.
+        MIN_X, MAX_X, MIN_Y, MAX_Y = get_bounds(self.nodes)
 
         dimensions = (MAX_X, MAX_Y)
 
         if self.init_stationary:
             x, y, x_waypoint, y_waypoint, velocity, wt = \
-                init_random_waypoint(self.nr_nodes, dimensions,
-                                     MIN_V, MAX_V, self.wt_min, self.wt_max)
+                init_random_waypoint(self.nr_nodes, dimensions, MIN_V, MAX_V,
+                                     self.wt_min, self.wt_max, rng)
 
         else:
-            NODES = np.arange(self.nr_nodes)
-            x = U(MIN_X, MAX_X, NODES)
-            y = U(MIN_Y, MAX_Y, NODES)
-            x_waypoint = U(MIN_X, MAX_X, NODES)
-            y_waypoint = U(MIN_Y, MAX_Y, NODES)
+            x = rng.uniform(MIN_X, MAX_X, NODES)
+            y = rng.uniform(MIN_Y, MAX_Y, NODES)
+            x_waypoint = rng.uniform(MIN_X, MAX_X, NODES)
+            y_waypoint = rng.uniform(MIN_Y, MAX_Y, NODES)
             wt = np.zeros(self.nr_nodes)
-            velocity = U(MIN_V, MAX_V, NODES)
+            velocity = rng.uniform(MIN_V, MAX_V, NODES)
 
         theta = np.arctan2(y_waypoint - y, x_waypoint - x)
         costheta = np.cos(theta)
         sintheta = np.sin(theta)
+        d, tmp = np.empty(self.nr_nodes), np.empty(self.nr_nodes)
 
         while True:
             # update node position
-            x += velocity * costheta
-            y += velocity * sintheta
+            x += np.multiply(velocity, costheta, out=tmp)
+            y += np.multiply(velocity, sintheta, out=tmp)
 
             # calculate distance to waypoint
-            d = np.sqrt(np.square(y_waypoint - y) + np.square(x_waypoint - x))
+            np.square(np.subtract(y_waypoint, y, out=d), out=d)
+            d += np.square(np.subtract(x_waypoint, x, out=tmp), out=tmp)
+            np.sqrt(d, out=d)
             # update info for arrived nodes
             arrived = np.where(np.logical_and(d <= velocity, wt <= 0.))[0]
 
@@ -716,19 +951,19 @@ class RandomWaypoint(object):
 
             if self.wt_max:
                 velocity[arrived] = 0.
-                wt[arrived] = U(self.wt_min, self.wt_max, arrived)
+                wt[arrived] = rng.uniform(self.wt_min, self.wt_max, arrived)
                 # update info for paused nodes
                 wt[np.where(velocity == 0.)[0]] -= 1.
                 # update info for moving nodes
                 arrived = np.where(np.logical_and(velocity == 0., wt < 0.))[0]
 
-            if arrived.size > 0 and len(arrived) == 1:
-                wx = U(MIN_X, MAX_X, arrived)
-                x_waypoint[arrived] = wx[arrived]
-                wy = U(MIN_Y, MAX_Y, arrived)
-                y_waypoint[arrived] = wy[arrived]
-                v = U(MIN_V, MAX_V, arrived)
-                velocity[arrived] = v[arrived]
+            if arrived.size > 0:
+                x_waypoint[arrived] = rng.uniform(MIN_X[arrived],
+                                                  MAX_X[arrived], arrived)
+                y_waypoint[arrived] = rng.uniform(MIN_Y[arrived],
+                                                  MAX_Y[arrived], arrived)
+                velocity[arrived] = rng.uniform(MIN_V[arrived],
+                                                MAX_V[arrived], arrived)
                 theta[arrived] = np.arctan2(y_waypoint[arrived] - y[arrived],
                                             x_waypoint[arrived] - x[arrived])
                 costheta[arrived] = np.cos(theta[arrived])
@@ -736,7 +971,7 @@ class RandomWaypoint(object):
 
             self.velocity = velocity
             self.wt = wt
-            yield np.dstack((x, y))[0]
+            yield x, y
 
 
 class StochasticWalk(object):
@@ -756,8 +991,9 @@ class StochasticWalk(object):
             This function should implement the distribution of flight lengths
              to be used in the model.
           *VEL_DISTR*:
-            A function that, given a set of flight lengths,
-             returns another set with the same size of the input set.
+            A function that, given a set of flight lengths and the nodes
+             they belong to, returns another set with the same size of the
+             input set.
             This function should implement the distribution of velocities
              to be used in the model, as random or as a function of the flight
              lengths.
@@ -785,8 +1021,22 @@ class StochasticWalk(object):
         self.VEL_DISTR = VEL_DISTR
         self.WT_DISTR = WT_DISTR
         self.model = model
+        self.rng = get_rng(nodes)
 
     def __iter__(self):
+        return self.walk()
+
+    def chunks(self, k=64):
+        """Looks k steps ahead at a time
+        :param k: number of steps per chunk
+        :return: generator of (k, N, 2) arrays; the same buffer is filled
+        again by the next chunk"""
+        return fill_chunks(((xy[:, 0], xy[:, 1]) for xy in self.walk()),
+                           k, self.nr_nodes)
+
+    def walk(self):
+        """Advances the nodes one step per iteration
+        :return: generator of the (N, 2) positions, updated in place"""
         def reflect(xy):
             # node bounces on the margins
             b = np.where(xy[:, 0] < MIN_X)[0]
@@ -826,22 +1076,13 @@ class StochasticWalk(object):
             borderp = self.border_policy
 
         NODES = np.arange(self.nr_nodes)
+        rng = self.rng
+        MIN_X, MAX_X, MIN_Y, MAX_Y = get_bounds(self.nodes)
 
-        MAX_X = U(0, 0, NODES)
-        MAX_Y = U(0, 0, NODES)
-        MIN_X = U(0, 0, NODES)
-        MIN_Y = U(0, 0, NODES)
-
-        for node in range(len(self.nodes)):
-            MAX_X[node] = self.nodes[node].max_x
-            MAX_Y[node] = self.nodes[node].max_y
-            MIN_X[node] = self.nodes[node].min_x
-            MIN_Y[node] = self.nodes[node].min_y
-
-        xy = U(0, MAX_X[self.b], np.dstack((NODES, NODES))[0])
+        xy = rng.uniform(0, MAX_X[self.b], np.dstack((NODES, NODES))[0])
         fl = self.FL_DISTR(NODES)
-        velocity = self.VEL_DISTR(fl)
-        theta = U(0, 1.8 * np.pi, NODES)
+        velocity = self.VEL_DISTR(fl, NODES)
+        theta = rng.uniform(0, 1.8 * np.pi, NODES)
         cosintheta = np.dstack((np.cos(theta), np.sin(theta)))[0] * \
                      np.dstack((velocity, velocity))[0]
         wt = np.zeros(self.nr_nodes)
@@ -873,15 +1114,10 @@ class StochasticWalk(object):
 
             # update info for moving nodes
             if arrived.size > 0:
-                theta = U(0, 2 * np.pi, arrived)
+                theta = rng.uniform(0, 2 * np.pi, arrived)
                 fl[arrived] = self.FL_DISTR(arrived)
                 if self.collect_fl_stats: self.fl_stats.extend(fl[arrived])
-                if self.model == 'RandomDirection':
-                    velocity[arrived] = self.VEL_DISTR(fl[arrived][0])[arrived]
-                elif self.model == 'TruncatedLevyWalk':
-                    velocity[arrived] = self.VEL_DISTR(fl[arrived])
-                else:
-                    velocity[arrived] = self.VEL_DISTR(fl[arrived])[arrived]
+                velocity[arrived] = self.VEL_DISTR(fl[arrived], arrived)
                 v = velocity[arrived]
                 cosintheta[arrived] = np.dstack((v * np.cos(theta),
                                                  v * np.sin(theta)))[0]
@@ -912,26 +1148,16 @@ class RandomWalk(StochasticWalk):
             If 'wrap', the node reappears at the opposite edge
             (as in a torus-shaped area).
         """
-        nr_nodes = len(nodes)
-        NODES = np.arange(nr_nodes)
-        VELOCITY = U(0, 0, NODES)
-        velocity = VELOCITY
-        distance = VELOCITY
-
-        for node in range(len(nodes)):
-            velocity[node] = nodes[node].constantVelocity
-            distance[node] = nodes[node].constantDistance
-
-            if velocity[node] > distance[node]:
-                # In this implementation, each step is 1 second,
-                # it is not possible to have a velocity larger than the distance
-                raise Exception('Velocity must be <= Distance')
+        vel = np.array([float(node.constantVelocity) for node in nodes])
+        fl = np.array([float(node.constantDistance) for node in nodes])
 
-        fl = np.zeros(nr_nodes) + distance
-        vel = np.zeros(nr_nodes) + velocity
+        if (vel > fl).any():
+            # In this implementation, each step is 1 second,
+            # it is not possible to have a velocity larger than the distance
+            raise Exception('Velocity must be <= Distance')
 
-        FL_DISTR = lambda SAMPLES: np.array(fl[:len(SAMPLES)])
-        VEL_DISTR = lambda FD: np.array(vel[:len(FD)])
+        FL_DISTR = lambda SAMPLES: fl[SAMPLES]
+        VEL_DISTR = lambda FD, SAMPLES: vel[SAMPLES]
 
         StochasticWalk.__init__(self, nodes, FL_DISTR, VEL_DISTR,
                                 border_policy=border_policy)
@@ -966,27 +1192,19 @@ class RandomDirection(StochasticWalk):
             off the border. If 'wrap', the node reappears at the opposite edge
             (as in a torus-shaped area).
         """
-        nr_nodes = len(nodes)
-        NODES = np.arange(nr_nodes)
-
-        max_v = U(0, 0, NODES)
-        min_v = U(0, 0, NODES)
-
-        MAX_V = max_v
-        MIN_V = min_v
-
-        for node in range(len(nodes)):
-            MAX_V[node] = nodes[node].max_v / 10.
-            MIN_V[node] = nodes[node].min_v / 10.
+        MAX_V = np.array([float(node.max_v) for node in nodes]) / 10.
+        MIN_V = np.array([float(node.min_v) for node in nodes]) / 10.
 
         FL_MAX = max(dimensions)
 
-        FL_DISTR = lambda SAMPLES: U(0, FL_MAX, SAMPLES)
+        FL_DISTR = lambda SAMPLES: self.rng.uniform(0, FL_MAX, SAMPLES)
         if wt_max:
-            WT_DISTR = lambda SAMPLES: U(0, wt_max, SAMPLES)
+            WT_DISTR = lambda SAMPLES: self.rng.uniform(0, wt_max, SAMPLES)
         else:
             WT_DISTR = None
-        VEL_DISTR = lambda FD: U(MIN_V, MAX_V, FD)
+        VEL_DISTR = lambda FD, SAMPLES: self.rng.uniform(MIN_V[SAMPLES],
+                                                         MAX_V[SAMPLES],
+                                                         SAMPLES)
 
         StochasticWalk.__init__(self, nodes, FL_DISTR, VEL_DISTR,
                                 WT_DISTR, border_policy, model='RandomDirection')
@@ -1028,12 +1246,13 @@ class TruncatedLevyWalk(StochasticWalk):
             border. If 'wrap', the node reappears at the opposite edge (as in a
             torus-shaped area).
         """
-        FL_DISTR = lambda SAMPLES: P(FL_EXP, 1., FL_MAX, SAMPLES)
+        FL_DISTR = lambda SAMPLES: self.rng.power(FL_EXP, 1., FL_MAX, SAMPLES)
         if WT_EXP and WT_MAX:
-            WT_DISTR = lambda SAMPLES: P(WT_EXP, 1., WT_MAX, SAMPLES)
+            WT_DISTR = lambda SAMPLES: self.rng.power(WT_EXP, 1., WT_MAX,
+                                                      SAMPLES)
         else:
             WT_DISTR = None
-        VEL_DISTR = lambda FD: np.sqrt(FD) / 10.
+        VEL_DISTR = lambda FD, SAMPLES: np.sqrt(FD) / 10.
 
         StochasticWalk.__init__(self, nodes, FL_DISTR, VEL_DISTR,
                                 WT_DISTR, border_policy, model='TruncatedLevyWalk')
@@ -1075,20 +1294,84 @@ class HeterogeneousTruncatedLevyWalk(StochasticWalk):
             the border. If 'wrap', the node reappears at the opposite edge
             (as in a torus-shaped area).
         """
-        nr_nodes = len(nodes)
-        NODES = np.arange(nr_nodes)
-        FL_MAX = P(-1.8, 10., FL_MAX, NODES)
-        FL_MIN = FL_MAX / 10.
-
-        FL_DISTR = lambda SAMPLES: rand(len(SAMPLES)) * \
-                                   (FL_MAX[SAMPLES] - FL_MIN[SAMPLES]) + \
-                                   FL_MIN[SAMPLES]
-        WT_DISTR = lambda SAMPLES: P(WT_EXP, 1., WT_MAX, SAMPLES)
-        VEL_DISTR = lambda FD: np.sqrt(FD) / 10.
+        FL_DISTR = lambda SAMPLES: self.rng.uniform(FL_MIN[SAMPLES],
+                                                    FL_MAX[SAMPLES], SAMPLES)
+        WT_DISTR = lambda SAMPLES: self.rng.power(WT_EXP, 1., WT_MAX, SAMPLES)
+        VEL_DISTR = lambda FD, SAMPLES: np.sqrt(FD) / 10.
 
-        StochasticWalk.__init__(self, nr_nodes, dimensions, FL_DISTR,
+        StochasticWalk.__init__(self, nodes, FL_DISTR,
                                 VEL_DISTR, WT_DISTR=WT_DISTR,
                                 border_policy=border_policy)
+        # the original P(-1.8, 10., FL_MAX) ignored its lower bound of 10
+        FL_MAX = self.rng.power(-1.8, 1., FL_MAX, np.arange(len(nodes)))
+        FL_MIN = FL_MAX / 10.
+
+
+def get_model(mob_model, mob_nodes, n_groups=1, max_x=100, max_y=100,
+              min_wt=1, max_wt=5, pointlist=None):
+    """Mobility model yielding the (N, 2) positions of mob_nodes at every
+    step when iterated"""
+    if mob_model == 'RandomWalk':  # Random Walk model
+        for node in mob_nodes:
+            array_ = ['constantVelocity', 'constantDistance']
+            for param in array_:
+                if not hasattr(node, param):
+                    setattr(node, param, 1)
+        mob = RandomWalk(mob_nodes)
+    elif mob_model == 'TruncatedLevyWalk':  # Truncated Levy Walk model
+        mob = TruncatedLevyWalk(mob_nodes)
+    elif mob_model == 'RandomDirection':  # Random Direction model
+        mob = RandomDirection(mob_nodes, dimensions=(max_x, max_y))
+    elif mob_model == 'RandomWayPoint':  # Random Waypoint model
+        for node in mob_nodes:
+            array_ = ['constantVelocity', 'constantDistance',
+                      'min_v', 'max_v']
+            for param in array_:
+                if not hasattr(node, param):
+                    setattr(node, param, '1')
+        mob = RandomWaypoint(mob_nodes, wt_min=min_wt, wt_max=max_wt)
+    elif mob_model == 'GaussMarkov':  # Gauss-Markov model
+        mob = gauss_markov(mob_nodes, alpha=0.99)
+    elif mob_model == 'ReferencePoint':  # Reference Point Group model
+        mob = reference_point_group(mob_nodes, n_groups,
+                                    dimensions=(max_x, max_y),
+                                    aggregation=0.5)
+    elif mob_model == 'TimeVariantCommunity':
+        mob = tvc(mob_nodes, n_groups, dimensions=(max_x, max_y),
+                  aggregation=[0.5, 0.], epoch=[100, 100])
+    elif mob_model == 'CRP':
+        mob = coherence_ref_point(mob_nodes, n_groups, (max_x, max_y),
+                                  pointlist)
+    else:
+        raise Exception("Mobility Model not defined or doesn't exist!")
+    return mob
+
+
+def fill_chunks(walk, k, n):
+    """Copies the steps of walk into a (k, N, 2) buffer, k at a time"""
+    buf = np.empty((k, n, 2))
+    while True:
+        for frame in buf:
+            x, y = next(walk)
+            frame[:, 0] = x
+            frame[:, 1] = y
+        yield buf
+
+
+def get_steps(mob, lookahead=64):
+    """Positions of a mobility model rounded to the centimeter, one step
+    at a time. Models having chunks() compute and round `lookahead` steps
+    per call
+    :return: generator of [[x, y], ...] lists"""
+    if not hasattr(mob, 'chunks'):
+        for xy in mob:
+            yield np.round(xy, 2).tolist()
+        return
+    rounded = None
+    for chunk in mob.chunks(lookahead):
+        rounded = np.round(chunk, 2, out=rounded)
+        for xy in rounded.tolist():
+            yield xy
 
 
 def random_waypoint(*args, **kwargs):
@@ -1134,22 +1417,13 @@ def gauss_markov(nodes, velocity_mean=1., alpha=1., variance=1.):
     """
     nr_nodes = len(nodes)
     NODES = np.arange(nr_nodes)
+    rng = get_rng(nodes)
+    MIN_X, MAX_X, MIN_Y, MAX_Y = get_bounds(nodes)
 
-    MAX_X = U(0, 0, NODES)
-    MAX_Y = U(0, 0, NODES)
-    MIN_X = U(0, 0, NODES)
-    MIN_Y = U(0, 0, NODES)
-
-    for node in range(len(nodes)):
-        MAX_X[node] = nodes[node].max_x
-        MAX_Y[node] = nodes[node].max_y
-        MIN_X[node] = nodes[node].min_x
-        MIN_Y[node] = nodes[node].min_y
-
-    x = U(MIN_X, MAX_X, NODES)
-    y = U(MIN_Y, MAX_Y, NODES)
+    x = rng.uniform(MIN_X, MAX_X, NODES)
+    y = rng.uniform(MIN_Y, MAX_Y, NODES)
     velocity = np.zeros(nr_nodes) + velocity_mean
-    theta = U(0, 2 * np.pi, NODES)
+    theta = rng.uniform(0, 2 * np.pi, NODES)
     angle_mean = theta
     alpha2 = 1.0 - alpha
     alpha3 = np.sqrt(1.0 - alpha * alpha) * variance
@@ -1181,11 +1455,11 @@ def gauss_markov(nodes, velocity_mean=1., alpha=1., variance=1.):
         # calculate new speed and direction based on the model
         velocity = (alpha * velocity +
                     alpha2 * velocity_mean +
-                    alpha3 * np.random.normal(0.0, 1.0, nr_nodes))
+                    alpha3 * rng.normal(NODES))
 
         theta = (alpha * theta +
                  alpha2 * angle_mean +
-                 alpha3 * np.random.normal(0.0, 1.0, nr_nodes))
+                 alpha3 * rng.normal(NODES))
 
         yield np.dstack((x, y))[0]
 
@@ -1240,30 +1514,32 @@ def reference_point_group(nodes, n_groups, dimensions,
         groups.append(np.arange(prev, n + prev))
         prev += n
 
-    g_ref = np.empty(sum(nr_nodes), dtype=np.int)
+    g_ref = np.empty(sum(nr_nodes), dtype=int)
     for (i, g) in enumerate(groups):
         for n in g:
             g_ref[n] = i
 
+    rng = get_rng(nodes)
+    g_rng = NodeRandom(range(len(groups)), purpose='mobilityGroup')
     FL_MAX = max(dimensions)
     MIN_V, MAX_V = velocity
-    FL_DISTR = lambda SAMPLES: U(0, FL_MAX, SAMPLES)
-    VEL_DISTR = lambda FD: U(MIN_V, MAX_V, FD)
+    FL_DISTR = lambda SAMPLES: g_rng.uniform(0, FL_MAX, SAMPLES)
+    VEL_DISTR = lambda FD, SAMPLES: g_rng.uniform(MIN_V, MAX_V, SAMPLES)
 
     MAX_X, MAX_Y = dimensions
-    x = U(0, MAX_X, NODES)
-    y = U(0, MAX_Y, NODES)
+    x = rng.uniform(0, MAX_X, NODES)
+    y = rng.uniform(0, MAX_Y, NODES)
     velocity = 1.
-    theta = U(0, 2 * np.pi, NODES)
+    theta = rng.uniform(0, 2 * np.pi, NODES)
     costheta = np.cos(theta)
     sintheta = np.sin(theta)
 
     GROUPS = np.arange(len(groups))
-    g_x = U(0, MAX_X, GROUPS)
-    g_y = U(0, MAX_X, GROUPS)
+    g_x = g_rng.uniform(0, MAX_X, GROUPS)
+    g_y = g_rng.uniform(0, MAX_X, GROUPS)
     g_fl = FL_DISTR(GROUPS)
-    g_velocity = VEL_DISTR(g_fl)
-    g_theta = U(0, 2 * np.pi, GROUPS)
+    g_velocity = VEL_DISTR(g_fl, GROUPS)
+    g_theta = g_rng.uniform(0, 2 * np.pi, GROUPS)
     g_costheta = np.cos(g_theta)
     g_sintheta = np.sin(g_theta)
 
@@ -1309,7 +1585,7 @@ def reference_point_group(nodes, n_groups, dimensions,
             g_sintheta[g_idx] = -g_sintheta[g_idx]
 
         # update info for nodes
-        theta = U(0, 2 * np.pi, NODES)
+        theta = rng.uniform(0, 2 * np.pi, NODES)
         costheta = np.cos(theta)
         sintheta = np.sin(theta)
 
@@ -1318,11 +1594,11 @@ def reference_point_group(nodes, n_groups, dimensions,
         g_arrived = np.where(np.logical_and(g_velocity > 0., g_fl <= 0.))[0]
 
         if g_arrived.size > 0:
-            g_theta = U(0, 2 * np.pi, g_arrived)
+            g_theta = g_rng.uniform(0, 2 * np.pi, g_arrived)
             g_costheta[g_arrived] = np.cos(g_theta)
             g_sintheta[g_arrived] = np.sin(g_theta)
             g_fl[g_arrived] = FL_DISTR(g_arrived)
-            g_velocity[g_arrived] = VEL_DISTR(g_fl[g_arrived])
+            g_velocity[g_arrived] = VEL_DISTR(g_fl[g_arrived], g_arrived)
 
         yield np.dstack((x, y))[0]
 
@@ -1400,15 +1676,17 @@ def tvc(nodes, n_groups, dimensions, velocity=(0.1, 1.),
         groups.append(np.arange(prev, n + prev))
         prev += n
 
-    g_ref = np.empty(sum(nr_nodes), dtype=np.int)
+    g_ref = np.empty(sum(nr_nodes), dtype=int)
     for (i, g) in enumerate(groups):
         for n in g:
             g_ref[n] = i
 
+    rng = get_rng(nodes)
+    g_rng = NodeRandom(range(len(groups)), purpose='mobilityGroup')
     FL_MAX = max(dimensions)
     MIN_V, MAX_V = velocity
-    FL_DISTR = lambda SAMPLES: U(0, FL_MAX, SAMPLES)
-    VEL_DISTR = lambda FD: U(MIN_V, MAX_V, FD)
+    FL_DISTR = lambda SAMPLES: g_rng.uniform(0, FL_MAX, SAMPLES)
+    VEL_DISTR = lambda FD, SAMPLES: g_rng.uniform(MIN_V, MAX_V, SAMPLES)
 
     def wrap(x, y):
         b = np.where(x < 0)[0]
@@ -1425,19 +1703,19 @@ def tvc(nodes, n_groups, dimensions, velocity=(0.1, 1.),
             y[b] -= MAX_Y
 
     MAX_X, MAX_Y = dimensions
-    x = U(0, MAX_X, NODES)
-    y = U(0, MAX_Y, NODES)
+    x = rng.uniform(0, MAX_X, NODES)
+    y = rng.uniform(0, MAX_Y, NODES)
     velocity = 1.
-    theta = U(0, 2 * np.pi, NODES)
+    theta = rng.uniform(0, 2 * np.pi, NODES)
     costheta = np.cos(theta)
     sintheta = np.sin(theta)
 
     GROUPS = np.arange(len(groups))
-    g_x = U(0, MAX_X, GROUPS)
-    g_y = U(0, MAX_X, GROUPS)
+    g_x = g_rng.uniform(0, MAX_X, GROUPS)
+    g_y = g_rng.uniform(0, MAX_X, GROUPS)
     g_fl = FL_DISTR(GROUPS)
-    g_velocity = VEL_DISTR(g_fl)
-    g_theta = U(0, 2 * np.pi, GROUPS)
+    g_velocity = VEL_DISTR(g_fl, GROUPS)
+    g_theta = g_rng.uniform(0, 2 * np.pi, GROUPS)
     g_costheta = np.cos(g_theta)
     g_sintheta = np.sin(g_theta)
 
@@ -1466,11 +1744,11 @@ def tvc(nodes, n_groups, dimensions, velocity=(0.1, 1.),
             g_fl = g_fl - g_velocity
 
             if g_arrived.size > 0:
-                g_theta = U(0, 2 * np.pi, g_arrived)
+                g_theta = g_rng.uniform(0, 2 * np.pi, g_arrived)
                 g_costheta[g_arrived] = np.cos(g_theta)
                 g_sintheta[g_arrived] = np.sin(g_theta)
                 g_fl[g_arrived] = FL_DISTR(g_arrived)
-                g_velocity[g_arrived] = VEL_DISTR(g_fl[g_arrived])
+                g_velocity[g_arrived] = VEL_DISTR(g_fl[g_arrived], g_arrived)
 
             # update node position according to group center
             for (i, g) in enumerate(groups):
@@ -1494,7 +1772,7 @@ def tvc(nodes, n_groups, dimensions, velocity=(0.1, 1.),
         wrap(x, y)
 
         # update info for nodes
-        theta = U(0, 2 * np.pi, NODES)
+        theta = rng.uniform(0, 2 * np.pi, NODES)
         costheta = np.cos(theta)
         sintheta = np.sin(theta)
 
@@ -1564,17 +1842,19 @@ def coherence_ref_point(nodes, n_groups, dimensions, pointlist, velocity=(0.1, 1
         groups.append(np.arange(prev, n + prev))
         prev += n
 
-    g_ref = np.empty(sum(nr_nodes), dtype=np.int)
+    g_ref = np.empty(sum(nr_nodes), dtype=int)
     for (i, g) in enumerate(groups):
         for n in g:
             g_ref[n] = i
 
+    rng = get_rng(nodes)
+    g_rng = NodeRandom(range(len(groups)), purpose='mobilityGroup')
     FL_MAX = max(dimensions)
     MIN_V, MAX_V = velocity
     G_VEL = g_velocity
 
-    FL_DISTR = lambda SAMPLES: U(0, FL_MAX, SAMPLES)
-    # VEL_DISTR = lambda FD: U(MIN_V, MAX_V, FD)
+    FL_DISTR = lambda SAMPLES: g_rng.uniform(0, FL_MAX, SAMPLES)
+    # VEL_DISTR = lambda FD, SAMPLES: g_rng.uniform(MIN_V, MAX_V, SAMPLES)
     MAX_X, MAX_Y = dimensions
 
     if len(pointlist) > 1:
@@ -1583,10 +1863,10 @@ def coherence_ref_point(nodes, n_groups, dimensions, pointlist, velocity=(0.1, 1
     else:
         current_x, current_y, current_z = pointlist[0]
         next_x, next_y, next_z = pointlist[0]
-    x = U(current_x, current_x + MAX_V, NODES)
-    y = U(current_y, current_y + MAX_V, NODES)
+    x = rng.uniform(current_x, current_x + MAX_V, NODES)
+    y = rng.uniform(current_y, current_y + MAX_V, NODES)
     velocity = 1.
-    theta = U(0, 2 * np.pi, NODES)
+    theta = rng.uniform(0, 2 * np.pi, NODES)
     costheta = np.cos(theta)
     sintheta = np.sin(theta)
 
@@ -1618,7 +1898,7 @@ def coherence_ref_point(nodes, n_groups, dimensions, pointlist, velocity=(0.1, 1
             y[g] = y_g + g_velocity[i] * g_sintheta[i] + aggregation * np.sin(c_theta)
 
         # update info for nodes
-        theta = U(0, 2 * np.pi, NODES)
+        theta = rng.uniform(0, 2 * np.pi, NODES)
         costheta = np.cos(theta)
         sintheta = np.sin(theta)
 
@@ -0,0 +1,168 @@
+"""Runs a mobility model generator in its own process.
+
+Steps are written into a ring of frames kept in shared memory, so the
+emulator reads positions without copying them and trajectory generation
+no longer competes for the GIL with association control, plotting or
+wmediumd updates."""
+
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from apns.log import debug
+from apns.randomStreams import RandomStreams
+
+
+class SharedPositions(object):
+    """Ring of `slots` frames of (N, 2) positions in shared memory. The
+    first int64 of the block counts the frames written so far"""
+
+    def __init__(self, n, slots=4, name=None):
+        self.n, self.slots = n, slots
+        size = 8 + slots * n * 2 * 8
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner,
+                                              size=size)
+        self.name = self.shm.name
+        self.seq = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        self.frames = np.ndarray((slots, n, 2), dtype=np.float64,
+                                 buffer=self.shm.buf, offset=8)
+        if self.owner:
+            self.seq[0] = 0
+
+    def write(self, xy):
+        """Copies a step into the next slot, then publishes it"""
+        seq = int(self.seq[0])
+        self.frames[seq % self.slots] = xy
+        self.seq[0] = seq + 1
+
+    def frame(self, seq):
+        """View (no copy) of frame number seq"""
+        return self.frames[seq % self.slots]
+
+    def latest(self):
+        """Copy of the last frame, read outside the semaphores of
+        MobilityProcess: copied again if the writer may have reached its
+        slot meanwhile
+        :return: number of frames written, copy of the last one"""
+        seq = int(self.seq[0])
+        while seq:
+            xy = self.frame(seq - 1).copy()
+            # frame seq - 1 + slots, written into the same slot, is only
+            # started once seq - 1 + slots frames were written
+            now = int(self.seq[0])
+            if now < seq - 1 + self.slots:
+                return seq, xy
+            seq = now
+        return 0, None
+
+    def close(self):
+        del self.seq, self.frames
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # a reader still holds a frame, unmapped once released
+        if self.owner:
+            self.shm.unlink()
+
+
+class NodeParams(object):
+    """Picklable copy of the node attributes read by the mobility models"""
+    attrs = ['name', 'min_x', 'min_y', 'max_x', 'max_y', 'min_v', 'max_v',
+             'constantVelocity', 'constantDistance']
+
+    def __init__(self, node):
+        for attr in self.attrs:
+            if hasattr(node, attr):
+                setattr(self, attr, getattr(node, attr))
+
+
+def generate(shm_name, n, slots, free, filled, stop, nodes, mob_model, seed,
+             kwargs):
+    """Child process: runs the generator and fills the ring"""
+    from apns.mobility import get_model
+
+    np.random.seed(seed)
+    RandomStreams.set_seed(seed)
+    positions = SharedPositions(n, slots, name=shm_name)
+    try:
+        for xy in get_model(mob_model, nodes, **kwargs):
+            while not free.acquire(timeout=0.5):
+                if stop.is_set():
+                    return
+            if stop.is_set():
+                return
+            positions.write(xy)
+            filled.release()
+    finally:
+        positions.close()
+
+
+class MobilityProcess(object):
+    """Iterates over the steps of a mobility model computed by a separate
+    process. Each step is a view into shared memory which stays valid
+    until the next one is requested. The generator runs at most
+    slots - 1 steps ahead of the consumer."""
+    models = ['RandomWalk', 'TruncatedLevyWalk', 'RandomDirection',
+              'RandomWayPoint', 'GaussMarkov', 'ReferencePoint',
+              'TimeVariantCommunity', 'CRP']
+
+    def __init__(self, nodes, mob_model, seed, slots=4, **kwargs):
+        if mob_model not in self.models:
+            raise Exception("Mobility Model not defined or doesn't exist!")
+        if slots < 2:
+            raise ValueError('at least two slots are required')
+        # not forked: the child would inherit locks held by the threads
+        # running here (logging, plotting, wmediumd writer)
+        ctx = mp.get_context('forkserver'
+                             if 'forkserver' in mp.get_all_start_methods()
+                             else 'spawn')
+        self.positions = SharedPositions(len(nodes), slots)
+        self.free = ctx.Semaphore(slots - 1)
+        self.filled = ctx.Semaphore(0)
+        self.stop_event = ctx.Event()
+        self.read = 0
+        self.holding = False
+        self.process = ctx.Process(
+            target=generate, name='mobilityGenerator',
+            args=(self.positions.name, len(nodes), slots, self.free,
+                  self.filled, self.stop_event,
+                  [NodeParams(node) for node in nodes], mob_model, seed,
+                  kwargs))
+        self.process.daemon = True
+        self.process.start()
+        debug('Mobility generator running in process %s\n' % self.process.pid)
+
+    def next_frame(self, timeout=None):
+        """Blocks until the next step is available
+        :return: (N, 2) view, None on timeout or when the generator ended"""
+        if self.holding:
+            self.free.release()  # the previous frame can be reused
+            self.holding = False
+        while not self.filled.acquire(timeout=timeout or 0.5):
+            if timeout is not None or not self.process.is_alive():
+                return None
+        self.holding = True
+        self.read += 1
+        return self.positions.frame(self.read - 1)
+
+    def latest(self):
+        """Copy of the last step written by the generator, without
+        waiting"""
+        return self.positions.latest()
+
+    def __iter__(self):
+        while True:
+            xy = self.next_frame()
+            if xy is None:
+                return
+            yield xy
+
+    def stop(self):
+        self.stop_event.set()
+        self.free.release()
+        self.process.join(2)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.positions.close()
@@ -0,0 +1,247 @@
+"""Binary mobility traces.
+
+A trace keeps, for every node, a column of timestamps (float64) and a
+column of x, y, z positions (float32):
+
+    magic | header length (uint64) | JSON header | padding
+    time columns of all the nodes, one after the other
+    position columns of all the nodes, one after the other
+
+The header holds the node names and how many samples each one has, the
+columns follow it, 8-byte aligned. Replaying memory-maps the file, so a trace of any size
+is paged in on demand, and the per-node columns are merged by time with a
+heap."""
+
+import heapq
+import json
+import os
+import struct
+from threading import Lock
+from time import monotonic
+
+import numpy as np
+
+from apns.log import debug
+
+
+MAGIC = b'APNSTRC1'
+RECORD = np.dtype([('node', '<u4'), ('time', '<f8'), ('x', '<f4'),
+                   ('y', '<f4'), ('z', '<f4')])
+
+
+class TraceRecorder(object):
+    """Records the positions set by any mobility driver. Samples are
+    spooled to disk in blocks and sorted into columns when the recorder
+    is closed, so memory use does not grow with the run"""
+    active = None  # recorder positions are sent to
+    block = 65536  # samples kept in memory
+
+    def __init__(self, path, clock=None):
+        """:param path: trace file
+        :param clock: SimClock giving the sample times, wall time since
+        the recorder started otherwise"""
+        self.path = path
+        self.clock = clock
+        self.start = monotonic()
+        self.spool = open(path + '.spool', 'w+b')
+        self.buf = np.empty(self.block, dtype=RECORD)
+        self.size = 0
+        self.ids, self.names, self.counts = {}, [], []
+        self.lock = Lock()
+
+    @classmethod
+    def start_recording(cls, path, clock=None):
+        cls.stop_recording()
+        cls.active = cls(path, clock)
+        debug('Recording mobility into %s\n' % path)
+        return cls.active
+
+    @classmethod
+    def stop_recording(cls):
+        recorder, cls.active = cls.active, None
+        if recorder:
+            recorder.close()
+        return recorder
+
+    @classmethod
+    def record(cls, node, pos, clock=None):
+        """Called whenever a node is moved"""
+        if cls.active:
+            cls.active.add(node.name, pos, clock)
+
+    def time(self, clock=None):
+        clock = self.clock or clock
+        if clock:
+            return clock.now()
+        return monotonic() - self.start
+
+    def add(self, name, pos, clock=None):
+        self.add_sample(name, self.time(clock), pos)
+
+    def add_sample(self, name, t, pos):
+        """Adds the position of a node at time t"""
+        with self.lock:
+            if name not in self.ids:
+                self.ids[name] = len(self.names)
+                self.names.append(name)
+                self.counts.append(0)
+            node = self.ids[name]
+            self.buf[self.size] = (node, t, float(pos[0]), float(pos[1]),
+                                   float(pos[2]) if len(pos) > 2 else 0.)
+            self.counts[node] += 1
+            self.size += 1
+            if self.size == self.block:
+                self.flush()
+
+    def flush(self):
+        self.buf[:self.size].tofile(self.spool)
+        self.size = 0
+
+    def close(self):
+        """Writes the trace file
+        :return: the number of samples recorded"""
+        with self.lock:
+            self.flush()
+            self.spool.flush()
+            total = sum(self.counts)
+            write_trace(self.path, self.names, self.counts, self.spool.name,
+                        total)
+            self.spool.close()
+            os.remove(self.spool.name)
+        debug('%s samples of %s nodes recorded into %s\n'
+              % (total, len(self.names), self.path))
+        return total
+
+
+def get_header(names, counts):
+    header = {'version': 1, 'nodes': names, 'counts': counts}
+    size = len(MAGIC) + 8
+    raw = json.dumps(header).encode()
+    # columns start 8-byte aligned
+    pad = -(size + len(raw)) % 8
+    raw += b' ' * pad
+    time_offset = size + len(raw)
+    return raw, time_offset
+
+
+def write_trace(path, names, counts, spool, total):
+    """Sorts the spooled samples into per-node columns, one block at a
+    time: the write cursor of each node is all that is kept"""
+    raw, time_offset = get_header(names, counts)
+    xyz_offset = time_offset + 8 * total
+    with open(path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<Q', len(raw)) + raw)
+        f.truncate(xyz_offset + 12 * total)
+    if not total:
+        return
+    times = np.memmap(path, dtype='<f8', mode='r+', offset=time_offset,
+                      shape=(total,))
+    xyz = np.memmap(path, dtype='<f4', mode='r+', offset=xyz_offset,
+                    shape=(total, 3))
+    cursor = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+    records = np.memmap(spool, dtype=RECORD, mode='r', shape=(total,))
+    for start in range(0, total, TraceRecorder.block):
+        block = records[start:start + TraceRecorder.block]
+        # stable, so the samples of a node stay in time order
+        order = np.argsort(block['node'], kind='stable')
+        block = block[order]
+        nodes, first, count = np.unique(block['node'], return_index=True,
+                                        return_counts=True)
+        for node, i, n in zip(nodes, first, count):
+            at = cursor[node]
+            times[at:at + n] = block['time'][i:i + n]
+            xyz[at:at + n, 0] = block['x'][i:i + n]
+            xyz[at:at + n, 1] = block['y'][i:i + n]
+            xyz[at:at + n, 2] = block['z'][i:i + n]
+            cursor[node] += n
+    times.flush()
+    xyz.flush()
+    del times, xyz, records
+
+
+def is_trace(path):
+    """:return: whether path is a binary trace"""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class MobilityTrace(object):
+    """Memory-mapped trace file"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise Exception('%s is not a mobility trace' % path)
+            size, = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(size).decode())
+        self.names = header['nodes']
+        self.counts = header['counts']
+        self.index = dict((name, idx) for idx, name in enumerate(self.names))
+        total = sum(self.counts)
+        time_offset = len(MAGIC) + 8 + size
+        self.starts = np.concatenate(([0], np.cumsum(self.counts)))
+        self.times = self.xyz = None
+        if total:
+            self.times = np.memmap(path, dtype='<f8', mode='r',
+                                   offset=time_offset, shape=(total,))
+            self.xyz = np.memmap(path, dtype='<f4', mode='r',
+                                 offset=time_offset + 8 * total,
+                                 shape=(total, 3))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def get(self, name):
+        """:return: time and position columns of a node (no copy)"""
+        idx = self.index[name]
+        start, end = self.starts[idx], self.starts[idx + 1]
+        if self.times is None:
+            return np.empty(0), np.empty((0, 3), dtype=np.float32)
+        return self.times[start:end], self.xyz[start:end]
+
+
+class TraceScheduler(object):
+    """Merges time-ordered per-node samples. Each node has a cursor and a
+    single entry in the heap, keyed by the time of its next sample, so
+    every sample costs O(log n)"""
+
+    def __init__(self):
+        self.heap = []
+        self.streams = []
+
+    def add(self, key, times, positions):
+        """:param key: what pop_due returns with the positions
+        :param times: sample times (sequence or array)
+        :param positions: a position per sample"""
+        count = min(len(times), len(positions))
+        if count:
+            idx = len(self.streams)
+            self.streams.append([key, times, positions, count, 0])
+            heapq.heappush(self.heap, (float(times[0]), idx))
+
+    def __len__(self):
+        return len(self.heap)
+
+    def next_time(self):
+        """:return: time of the next sample, None when all were replayed"""
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, time_):
+        """:return: (key, position) of the samples due at time_, in order"""
+        due = []
+        heap = self.heap
+        while heap and heap[0][0] <= time_:
+            _, idx = heap[0]
+            stream = self.streams[idx]
+            key, times, positions, count, cursor = stream
+            due.append((key, positions[cursor]))
+            cursor += 1
+            stream[4] = cursor
+            if cursor < count:
+                heapq.heapreplace(heap, (float(times[cursor]), idx))
+            else:
+                heapq.heappop(heap)
+        return due
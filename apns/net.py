@@ -17,7 +17,9 @@ from numpy.compat import unicode
 from six import string_types
 
 from apns.clean import Cleanup
+from apns.channelEquation import ChannelEquation
 from apns.cli import CLI
+from apns.clock import SimClock
 from apns.docker import Docker, DockerAP, DockerSta, DockerWLC
 from apns.energy import Energy
 from apns.link import (Link, TCLink, TCULink, Intf, IntfWireless, wmediumd,
@@ -28,6 +30,7 @@ from apns.link import (Link, TCLink, TCULink, Intf, IntfWireless, wmediumd,
 from apns.log import info, error, debug, output, warn
 from apns.mobility import Tracked as TrackedMob, model as MobModel, \
     Mobility as mob, ConfigMobility, ConfigMobLinks
+from apns.mobilityTrace import TraceRecorder
 from apns.module import WifiEmu
 from apns.node import (Node, Controller, OVSBridge, Host, OVSKernelSwitch,
                              OVSAP, AP, Station, physicalAP,
@@ -35,12 +38,13 @@ from apns.node import (Node, Controller, OVSBridge, Host, OVSKernelSwitch,
 from apns.nodelib import NAT
 from apns.plot import Plot2D, Plot3D, PlotGraph
 from apns.propagationModels import PropagationModel as ppm
+from apns.randomStreams import RandomStreams
 from apns.telemetry import parseData, telemetry as run_telemetry
 from apns.term import cleanUpScreens, makeTerms
 from apns.util import (quietRun, fixLimits, macColonHex,
                              ipStr, ipParse, ipAdd,
                              waitListening, BaseString, numCores, netParse)
-from apns.wmediumdConnector import error_prob, interference
+from apns.wmediumdConnector import error_prob, interference, w_server
 
 
 class Wmnet(object):
@@ -192,6 +196,7 @@ class Wmnet(object):
         self.mob_stop_time = 0
         self.mob_rep = 1
         self.seed = 1
+        RandomStreams.set_seed(self.seed)
         self.min_v = 1
         self.max_v = 10
         self.min_x = 0
@@ -205,6 +210,7 @@ class Wmnet(object):
         self.n_groups = 1
         self.wlinks = []
         self.pointlist = []
+        self.mob_process = False
         self.initial_mediums = []
         self.nameToNode = {}  # name to Node (Host/Switch) objects
         self.bridge_with = bridge_with
@@ -623,48 +629,50 @@ class Wmnet(object):
            returns: added station"""
         # Default IP and MAC addresses
         sta_array = []
-        for i in range(amount):
-            defaults = {'ip': ipAdd(self.nextIP,
-                                    ipBaseNum=self.ipBaseNum,
-                                    prefixLen=self.prefixLen) +
-                              '/{}'.format(self.prefixLen),
-                        # 'ip6': ipAdd6(self.nextIP6,
-                        #               ipBaseNum=self.ip6BaseNum,
-                        #               prefixLen=self.prefixLen6) +
-                        #        '/{}'.format(self.prefixLen6),
-                        'channel': self.channel,
-                        'band': self.band,
-                        'freq': self.freq,
-                        'mode': self.mode,
-                        'encrypt': self.encrypt,
-                        'passwd': self.passwd,
-                        'ieee80211w': self.ieee80211w
-                        }
-            defaults.update(params)
-            name = "sta" + str(self.next_sta)
-            debug("\naddSta: ++++++++++ %s ++++++++++\n" % name)
-            self.next_sta += 1
-
-            if self.autoSetPositions and 'position' not in params:
-                defaults['position'] = [round(self.nextPos_sta, 2), 0, 0]
-            if self.autoPinCpus:
-                defaults['cores'] = self.nextCore
-                self.nextCore = (self.nextCore + 1) % self.numCores
-            self.nextIP += 1
-            self.nextPos_sta += 2
-
-            if not cls:
-                cls = self.station
-            sta = cls(name, **defaults)
-
-            if 'position' in params or self.autoSetPositions:
-                self.pos_to_array(sta)
-
-            self.addWlans(sta)
-            self.stations.append(sta)
-            self.nameToNode[name] = sta
-            debug("\n addSta: ---------- /%s ----------\n" % name)
-            sta_array.append(sta)
+        self.start_deferred_wmediumd()
+        with w_server.batch_updates():
+            for i in range(amount):
+                defaults = {'ip': ipAdd(self.nextIP,
+                                        ipBaseNum=self.ipBaseNum,
+                                        prefixLen=self.prefixLen) +
+                                  '/{}'.format(self.prefixLen),
+                            # 'ip6': ipAdd6(self.nextIP6,
+                            #               ipBaseNum=self.ip6BaseNum,
+                            #               prefixLen=self.prefixLen6) +
+                            #        '/{}'.format(self.prefixLen6),
+                            'channel': self.channel,
+                            'band': self.band,
+                            'freq': self.freq,
+                            'mode': self.mode,
+                            'encrypt': self.encrypt,
+                            'passwd': self.passwd,
+                            'ieee80211w': self.ieee80211w
+                            }
+                defaults.update(params)
+                name = "sta" + str(self.next_sta)
+                debug("\naddSta: ++++++++++ %s ++++++++++\n" % name)
+                self.next_sta += 1
+
+                if self.autoSetPositions and 'position' not in params:
+                    defaults['position'] = [round(self.nextPos_sta, 2), 0, 0]
+                if self.autoPinCpus:
+                    defaults['cores'] = self.nextCore
+                    self.nextCore = (self.nextCore + 1) % self.numCores
+                self.nextIP += 1
+                self.nextPos_sta += 2
+
+                if not cls:
+                    cls = self.station
+                sta = cls(name, **defaults)
+
+                if 'position' in params or self.autoSetPositions:
+                    self.pos_to_array(sta)
+
+                self.addWlans(sta)
+                self.stations.append(sta)
+                self.nameToNode[name] = sta
+                debug("\n addSta: ---------- /%s ----------\n" % name)
+                sta_array.append(sta)
         return sta_array
 
     def delSta(self, station):
@@ -680,51 +688,52 @@ class Wmnet(object):
            returns: added accesspoint
            side effect: increments listenPort var ."""
         ap_array = []
-        for i in range(amount):
-            defaults = {'listenPort': self.listenPort,
-                        'inNamespace': self.inNamespace,
-                        'ssid': self.ssid,
-                        'channel': self.channel,
-                        'band': self.band,
-                        'freq': self.freq,
-                        'mode': self.mode,
-                        'encrypt': self.encrypt,
-                        'passwd': self.passwd,
-                        'ieee80211w': self.ieee80211w,
-                        'wlans': self.ap_wlans
-                        }
-            name = "ap" + str(self.next_ap)
-            info("%s " % name )
-            debug("\n++++++++++ %s ++++++++++\n" % name)
-            self.nextIP = self.next_ap*20 - 19
-            self.next_ap += 1
-            if self.client_isolation:
-                defaults['client_isolation'] = True
-            if self.json_file:
-                defaults['json'] = self.json_file
-            defaults.update(params)
-            if self.autoSetPositions:
-                defaults['position'] = [round(self.nextPos_ap, 2), 50, 0]
-                self.nextPos_ap += 1
-            wlan = None
-            if cls and isinstance(cls, physicalAP):
-                wlan = params.pop('phywlan', {})
-                cls = self.accessPoint
-            if not cls:
-                cls = self.accessPoint
-            ap = cls(name, **defaults)
-            if not self.inNamespace and self.listenPort:
-                self.listenPort += 1
-            self.nameToNode[name] = ap
-            if wlan:
-                ap.params['phywlan'] = wlan
-            if 'position' in params or self.autoSetPositions:
-                self.pos_to_array(ap)
-            self.addWlans(ap)
-            self.aps.append(ap)
-            debug("\n--------- /%s ----------\n" % name)
-            ap_array.append(ap)
-            info("")
+        with w_server.batch_updates():
+            for i in range(amount):
+                defaults = {'listenPort': self.listenPort,
+                            'inNamespace': self.inNamespace,
+                            'ssid': self.ssid,
+                            'channel': self.channel,
+                            'band': self.band,
+                            'freq': self.freq,
+                            'mode': self.mode,
+                            'encrypt': self.encrypt,
+                            'passwd': self.passwd,
+                            'ieee80211w': self.ieee80211w,
+                            'wlans': self.ap_wlans
+                            }
+                name = "ap" + str(self.next_ap)
+                info("%s " % name )
+                debug("\n++++++++++ %s ++++++++++\n" % name)
+                self.nextIP = self.next_ap*20 - 19
+                self.next_ap += 1
+                if self.client_isolation:
+                    defaults['client_isolation'] = True
+                if self.json_file:
+                    defaults['json'] = self.json_file
+                defaults.update(params)
+                if self.autoSetPositions:
+                    defaults['position'] = [round(self.nextPos_ap, 2), 50, 0]
+                    self.nextPos_ap += 1
+                wlan = None
+                if cls and isinstance(cls, physicalAP):
+                    wlan = params.pop('phywlan', {})
+                    cls = self.accessPoint
+                if not cls:
+                    cls = self.accessPoint
+                ap = cls(name, **defaults)
+                if not self.inNamespace and self.listenPort:
+                    self.listenPort += 1
+                self.nameToNode[name] = ap
+                if wlan:
+                    ap.params['phywlan'] = wlan
+                if 'position' in params or self.autoSetPositions:
+                    self.pos_to_array(ap)
+                self.addWlans(ap)
+                self.aps.append(ap)
+                debug("\n--------- /%s ----------\n" % name)
+                ap_array.append(ap)
+                info("")
         return ap_array
 
     def delAP(self, ap):
@@ -1039,6 +1048,7 @@ class Wmnet(object):
 
     def stop(self):
         self.stop_graph_params()
+        TraceRecorder.stop_recording()
         # info('--- Removing NAT rules of %i SAPs\n' % len(self.SAPswitches))
         # for SAPswitch in self.SAPswitches:
         #     self.removeSAPNAT(self.SAPswitches[SAPswitch])
@@ -1251,6 +1261,7 @@ class Wmnet(object):
                     if hasattr(node, 'position'):
                         mob.stations.append(node)
 
+        self.start_deferred_wmediumd()
         if self.config4addr or self.configWiFiDirect or self.wmediumd_mode == error_prob:
             # sync with the current 2nd interface type
             for id, link in enumerate(self.wlinks):
@@ -1766,6 +1777,8 @@ class Wmnet(object):
                 self.mob_start_time = kwargs.get(key)
             elif key in self.__dict__.keys():
                 setattr(self, key, kwargs.get(key))
+        # shadowing and mobility draws derive from the scenario seed
+        RandomStreams.set_seed(self.seed)
 
     def startMobility(self, **kwargs):
         for key in kwargs:
@@ -1794,7 +1807,7 @@ class Wmnet(object):
         args = ['stations', 'aps', 'draw', 'seed',
                 'mob_start_time', 'mob_stop_time',
                 'links', 'mob_model', 'mob_rep', 'reverse',
-                'ac_method', 'pointlist', 'n_groups']
+                'ac_method', 'pointlist', 'n_groups', 'mob_process']
         args += float_args
         for arg in args:
             if arg in float_args:
@@ -1816,10 +1829,12 @@ class Wmnet(object):
                  ppm=ppm)
 
     def init_wmediumd(self):
-        self.start_wmediumd()
+        if not w_server.connected:
+            self.start_wmediumd()
         if self.wmediumd_mode != error_prob:
-            for sta in self.stations:
-                sta.set_pos_wmediumd(sta.position)
+            with w_server.batch_updates():
+                for sta in self.stations:
+                    sta.set_pos_wmediumd(sta.position)
         for sta in self.stations:
             if sta in self.aps:
                 self.stations.remove(sta)
@@ -1854,13 +1869,30 @@ class Wmnet(object):
             phyAP(node, wlan)
 
     def runWmediumd(self):
-        """Run Wmediumd"""
+        """Run Wmediumd, in the interference mode once the APs are added
+        (see start_deferred_wmediumd)"""
         if self.link == wmediumd:
             self.wmediumd_mode()
             if not self.configWiFiDirect and not self.config4addr \
-                    and self.wmediumd_mode != error_prob:
+                    and self.wmediumd_mode != error_prob \
+                    and self.wmediumd_mode != interference:
                 self.run_wmediumd()
 
+    def start_deferred_wmediumd(self):
+        """Starts wmediumd in the interference mode, if not running yet,
+        with the APs (and stations) added so far in its configuration.
+        Called before the first stations are added, so they are registered
+        in bulk, or when building"""
+        if self.link == wmediumd and self.wmediumd_mode == interference \
+                and not w_server.connected:
+            self.start_wmediumd()
+            # their positions and tx powers are in the configuration
+            with w_server.batch_updates():
+                for node in self.aps + self.stations:
+                    for intf in node.wintfs.values():
+                        if getattr(intf, 'wmIface', None) is not None:
+                            intf.setGainWmediumd(intf.antennaGain)
+
     def configureWmediumd(self):
         """Configure WiFi Nodes"""
         params = {}
@@ -1949,24 +1981,81 @@ class Wmnet(object):
     def stop_simulation():
         """Pause the simulation"""
         mob.pause_simulation = True
+        SimClock.pause()
 
     @staticmethod
     def start_simulation():
         """Start the simulation"""
         mob.pause_simulation = False
+        SimClock.resume()
 
     @staticmethod
     def setChannelEquation(**params):
-        """Set Channel Equation
+        """Set Channel Equation, bw and loss ones replace the signal tables
         :params bw: bandwidth (mbps)
         :params delay: delay (ms)
         :params latency: latency (ms)
         :params loss: loss (%)"""
+        # compiled, and checked, once here
+        if 'bw' in params:
+            IntfWireless.get_bw_equation(params['bw'])
+        for key in ['delay', 'latency', 'loss']:
+            if key in params:
+                ChannelEquation.get(params[key])
+        if 'bw' in params or 'loss' in params:
+            IntfWireless.rate_engine = False
         IntfWireless.eqBw = params.get('bw', IntfWireless.eqBw)
         IntfWireless.eqDelay = params.get('delay', IntfWireless.eqDelay)
         IntfWireless.eqLatency = params.get('latency', IntfWireless.eqLatency)
         IntfWireless.eqLoss = params.get('loss', IntfWireless.eqLoss)
 
+    @staticmethod
+    def setSpatialIndex(enable=True, cell_size=None):
+        """Grid index used to find the APs in range of a moving station
+        :params enable: disable to check every AP, every time
+        :params cell_size: cell size (m), defaults to the largest AP range"""
+        mob.use_spatial_index = enable
+        mob.spatial_cell_size = cell_size
+        mob.spatial_index = None
+
+    @staticmethod
+    def setSimClock(tick=None, dilation=None, stepped=False, headless=None):
+        """Clock the mobility drivers schedule against
+        :params tick: seconds between mobility steps, None for the default
+        of each driver (0.1s for tracked mobility, 0.5s for models)
+        :params dilation: simulated seconds per wall-clock second
+        :params stepped: run the steps back to back, as fast as possible
+        :params headless: compute RSSI, range and association without
+        touching iw, wpa_supplicant, tc or wmediumd. Defaults to True
+        when the clock does not follow the wall clock"""
+        mob.tick_interval = tick
+        mob.dilation = dilation
+        mob.stepped = stepped
+        if headless is None:
+            headless = bool(stepped or dilation)
+        mob.headless = headless
+
+    @staticmethod
+    def startTraceRecording(file_):
+        """Records the positions of all the nodes, whatever moves them,
+        into a binary trace ReplayingMobility(net, trace=file_) replays"""
+        TraceRecorder.start_recording(file_)
+
+    @staticmethod
+    def stopTraceRecording():
+        """Writes the trace being recorded"""
+        TraceRecorder.stop_recording()
+
+    @staticmethod
+    def getClockReport():
+        """Ticks, overruns and per-tick lateness of the mobility clock"""
+        return mob.clock.report() if mob.clock else {}
+
+    @staticmethod
+    def getAssociationStats():
+        """Stations evaluated/skipped per second by the association thread"""
+        return dict(mob.association_stats)
+
     @staticmethod
     def stop_graph_params():
         """Stop the graph"""
@@ -69,7 +69,9 @@ import matplotlib.pyplot as plt
 
 from apns.link import WirelessIntf, physicalMesh, ITSLink, Intf, TCIntf, OVSIntf, Link
 from apns.log import info, error, warn, debug
+from apns.mobilityTrace import TraceRecorder
 from apns.moduledeps import moduleDeps, pathCheck, TUN
+from apns.propagationModels import PropagationModel as ppm
 from apns.util import (errRun, errFail, getincrementaldecoder,
                              quietRun, which, moveIntf, isShellBuiltin,
                              numCores, retry, mountCgroups, BaseString, decode,
@@ -1677,16 +1679,20 @@ class Node_WiFi(Node):
         self.circle.set_radius(self.get_max_radius())
 
     def set_pos_wmediumd(self, pos):
-        """Set Position for wmediumd"""
-        if self.lastpos != pos:
+        """Set Position for wmediumd, once it runs"""
+        if self.lastpos != pos and w_server.connected:
             self.lastpos = pos
-            for id, wmIface in enumerate(self.wmIfaces):
-                w_server.update_pos(w_pos(wmIface,
-                                          [(float(pos[0]) + id), float(pos[1]), float(pos[2])]))
+            with w_server.batch_updates():
+                for id, wmIface in enumerate(self.wmIfaces):
+                    w_server.update_pos(w_pos(wmIface,
+                                              [(float(pos[0]) + id), float(pos[1]), float(pos[2])]))
+                if ppm.shadowing_map is not None:
+                    ppm.shadowing_map.update_wmediumd(self.wmIfaces, pos)
 
     def setPosition(self, pos):
         """Set Position"""
         self.position = [float(x) for x in pos.split(',')]
+        TraceRecorder.record(self, self.position)
         self.update_graph()
 
         if wmediumd_mode.mode == w_cst.INTERFERENCE_MODE:
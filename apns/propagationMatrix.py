@@ -0,0 +1,137 @@
+"""Distance and RSSI between every station interface and every AP
+interface, computed in one batch per mobility pass."""
+
+import numpy as np
+
+from apns.propagationModels import PropagationModel as ppm, \
+    PropagationModelArray
+
+
+class IntfArrays(object):
+    """Propagation parameters of a list of interfaces, one array per
+    attribute, shaped for broadcasting"""
+    attrs = ['antennaGain', 'antennaHeight', 'txpower', 'freq', 'band']
+
+    def __init__(self, intfs, shape):
+        self.params = [self.get_params(intf) for intf in intfs]
+        for idx, attr in enumerate(self.attrs):
+            values = [self.to_float(params[idx]) for params in self.params]
+            setattr(self, attr, np.array(values, dtype=float).reshape(shape))
+
+    @classmethod
+    def get_params(cls, intf):
+        return tuple(getattr(intf, attr, None) for attr in cls.attrs)
+
+    @staticmethod
+    def to_float(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return np.nan
+
+
+class PropagationMatrix(object):
+    """Snapshot of station/AP geometry taken at the beginning of a pass.
+    Lookups fall back to the scalar code whenever the snapshot cannot
+    vouch for giving the very same answer: node or interface parameters
+    changed since, or the value sits on an int() truncation boundary."""
+
+    def __init__(self, intfs, ap_intfs):
+        self.intfs = list(intfs)
+        self.ap_intfs = list(ap_intfs)
+        self.rows = {intf: idx for idx, intf in enumerate(self.intfs)}
+        self.cols = {}
+        self.ap_cols = {}
+        for idx, ap_intf in enumerate(self.ap_intfs):
+            self.cols[ap_intf] = idx
+            self.ap_cols.setdefault(ap_intf.node, idx)
+        self.sta_pos = self.get_positions(self.intfs)
+        self.ap_pos = self.get_positions(self.ap_intfs)
+        self.dist = self.get_distances(self.sta_pos, self.ap_pos)
+        self.model = self.get_model()
+        self.sta = self.ap = self.rssi = self.unsure = None
+
+    @staticmethod
+    def get_model():
+        return (ppm.model, ppm.exp, ppm.sL, ppm.lF, ppm.pL, ppm.nFloors,
+                ppm.gRandom, ppm.floor_plan)
+
+    @staticmethod
+    def get_position(node):
+        pos = getattr(node, 'position', None)
+        try:
+            return tuple(float(p) for p in pos[:3])
+        except (TypeError, ValueError, IndexError):
+            return None
+
+    def get_positions(self, intfs):
+        pos = np.full((len(intfs), 3), np.nan)
+        for idx, intf in enumerate(intfs):
+            node_pos = self.get_position(intf.node)
+            if node_pos is not None:
+                pos[idx] = node_pos
+        return pos
+
+    @staticmethod
+    def round2(dist):
+        """round(dist, 2) as Python does it: NumPy scales by 100 before
+        rounding, which may disagree on halfway cases"""
+        dist = np.asarray(dist, dtype=float)
+        rounded = np.round(dist, 2)
+        with np.errstate(invalid='ignore'):
+            scaled = dist * 100
+            halfway = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+        for idx in zip(*np.nonzero(halfway)):
+            rounded[idx] = round(float(dist[idx]), 2)
+        return rounded
+
+    def get_distances(self, sta_pos, ap_pos):
+        """Same operations, in the same order, as Node.get_distance_to"""
+        diff = sta_pos[:, np.newaxis, :] - ap_pos[np.newaxis, :, :]
+        sq = diff ** 2
+        dist = np.sqrt(sq[..., 0] + sq[..., 1] + sq[..., 2])
+        return self.round2(dist)
+
+    def compute_rssi(self):
+        self.sta = IntfArrays(self.intfs, (-1, 1))
+        self.ap = IntfArrays(self.ap_intfs, (1, -1))
+        self.sta.position = self.sta_pos[:, np.newaxis, :]
+        self.ap.position = self.ap_pos[np.newaxis, :, :]
+        with np.errstate(all='ignore'):
+            model = PropagationModelArray(self.sta, self.ap, self.dist,
+                                          model=self.model[0])
+        self.rssi, self.unsure = model.rssi, model.unsure
+
+    def moved(self, node, pos):
+        return self.get_position(node) != tuple(pos)
+
+    def distance(self, intf, ap):
+        """Distance between intf and the AP node, None if unknown"""
+        row, col = self.rows.get(intf), self.ap_cols.get(ap)
+        if row is None or col is None:
+            return None
+        dist = self.dist[row, col]
+        if not np.isfinite(dist) or self.moved(intf.node, self.sta_pos[row]) \
+                or self.moved(ap, self.ap_pos[col]):
+            return None
+        return float(dist)
+
+    def get_rssi(self, intf, ap_intf, dist):
+        """RSSI received by intf from ap_intf, None if unknown"""
+        row, col = self.rows.get(intf), self.cols.get(ap_intf)
+        if row is None or col is None or self.model != self.get_model() \
+                or self.model[0] not in PropagationModelArray.models \
+                or (self.model[0] == 'logNormalShadowing' and
+                    ppm.shadowing_map is not None):
+            return None
+        if self.rssi is None:
+            self.compute_rssi()
+        if self.unsure[row, col] or dist != self.dist[row, col] \
+                or IntfArrays.get_params(intf) != self.sta.params[row] \
+                or IntfArrays.get_params(ap_intf) != self.ap.params[col]:
+            return None
+        if self.model[0] == 'floorPlan' and (
+                self.moved(intf.node, self.sta_pos[row])
+                or self.moved(ap_intf.node, self.ap_pos[col])):
+            return None
+        return float(self.rssi[row, col])
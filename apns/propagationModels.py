@@ -8,8 +8,13 @@
                 Two-Ray-Ground Propagation Model"""
 
 import math
-from random import gauss
-from time import sleep
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+from apns.floorPlan import FloorPlan
+from apns.randomStreams import RandomStreams
 
 
 class PropagationModel(object):
@@ -24,6 +29,8 @@ class PropagationModel(object):
     variance = 2  # variance
     noise_th = -91
     cca_threshold = -90
+    shadowing_map = None  # ShadowingMap giving gRandom at node positions
+    floor_plan = None  # FloorPlan (or its file) of the floorPlan model
 
     def __init__(self, intf, apintf, dist=0):
         if self.model in dir(self):
@@ -35,6 +42,30 @@ class PropagationModel(object):
         cls.cca_threshold = cca_th
         for arg in kwargs:
             setattr(cls, arg, kwargs.get(arg))
+        RangeCache.clear()
+
+    @staticmethod
+    def get_gauss(intf, mean, variance):
+        """Shadowing drawn from the stream of the node, see RandomStreams,
+        or read from the shadowing map at the node position"""
+        if ppm.shadowing_map is not None:
+            return mean + ppm.shadowing_map.get(intf.node.position)
+        stream = RandomStreams.get(intf.node.name, purpose='shadowing')
+        return stream.normal(mean, variance)
+
+    @classmethod
+    def get_floor_plan(cls):
+        if not isinstance(cls.floor_plan, FloorPlan):
+            cls.floor_plan = FloorPlan(file_=cls.floor_plan)
+        return cls.floor_plan
+
+    @classmethod
+    def get_gRandom(cls, intf):
+        """gRandom of the last range calculation, or of the node position
+        when there is a shadowing map"""
+        if cls.shadowing_map is None:
+            return cls.gRandom
+        return round(cls.shadowing_map.get(intf.node.position), 2)
 
     def path_loss(self, intf, dist):
         """Path Loss Model:
@@ -127,7 +158,7 @@ class PropagationModel(object):
         gr = intf.antennaGain
         pt = ap_intf.txpower
         gt = ap_intf.antennaGain
-        gRandom = self.gRandom
+        gRandom = self.get_gRandom(intf)
         gains = pt + gt + gr
         ref_d = 1
 
@@ -139,6 +170,26 @@ class PropagationModel(object):
 
         return self.rssi
 
+    def floorPlan(self, intf, ap_intf, dist):
+        """Floor Plan (multi-wall) Propagation Loss Model: Log Distance
+        plus the attenuation of the walls of floor_plan crossed by the
+        line between the nodes"""
+        gr = intf.antennaGain
+        pt = ap_intf.txpower
+        gt = ap_intf.antennaGain
+        gains = pt + gt + gr
+        ref_d = 1
+
+        pl = self.path_loss(intf, ref_d)
+        if dist == 0: dist = 0.1
+
+        walls = self.get_floor_plan().get_loss(intf.node.position,
+                                               ap_intf.node.position)
+        pldb = 10 * self.exp * math.log10(dist / ref_d) + walls
+        self.rssi = gains - (int(pl) + int(pldb))
+
+        return self.rssi
+
     def ITU(self, intf, ap_intf, dist):
         """International Telecommunication Union (ITU) Propagation Loss Model:"""
         gr = intf.antennaGain
@@ -180,8 +231,158 @@ class PropagationModel(object):
 ppm = PropagationModel
 
 
+class ParamArrays(object):
+    """Interface parameters as NumPy arrays for the batched models, e.g.
+    ParamArrays(txpower=[14, 20], antennaGain=5, freq=2.412)"""
+
+    def __init__(self, **params):
+        for attr, value in params.items():
+            setattr(self, attr, np.asarray(value, dtype=float))
+
+
+class ModelArray(object):
+    """Base of the batched models. Every int() of the scalar model applied
+    to a computed value becomes np.trunc(). Values falling so close to an
+    integer that libm and NumPy could round them apart, or that are not
+    finite, are flagged in `unsure` so callers can fall back to the scalar
+    model for those entries only."""
+
+    def __init__(self, shape=()):
+        self.unsure = np.zeros(shape, dtype=bool)
+
+    def flag(self, value, where=True):
+        value = np.asarray(value, dtype=float)
+        with np.errstate(invalid='ignore'):
+            unsure = ~np.isfinite(value) | (np.abs(value - np.rint(value))
+                                            <= 1e-9 * np.maximum(1, np.abs(value)))
+        self.unsure = self.unsure | (unsure & where)
+        return value
+
+    def trunc(self, value, where=True):
+        return np.trunc(self.flag(value, where))
+
+    def ceil(self, value):
+        return np.ceil(self.flag(value))
+
+    def fit(self, value):
+        """unsure gets the shape of the result, not finite ones are in it"""
+        self.unsure = np.broadcast_to(self.unsure | ~np.isfinite(value),
+                                      np.shape(value)).copy()
+        return value
+
+    @staticmethod
+    def no_zero(dist):
+        return np.where(dist == 0, 0.1, dist)
+
+
+class PropagationModelArray(ModelArray):
+    """Batched counterpart of PropagationModel. Receivers (sta) and
+    transmitters (ap) are objects holding NumPy arrays named after the
+    interface attributes (antennaGain, antennaHeight, txpower, freq, band),
+    see ParamArrays, and dist is the rounded distance between them.
+    Broadcasting rules apply, so sta arrays of shape (N, 1) against ap
+    arrays of shape (1, M) give the full (N, M) matrix."""
+    models = ['friis', 'logDistance', 'logNormalShadowing', 'ITU',
+              'twoRayGround', 'young', 'floorPlan']
+
+    def __init__(self, sta, ap, dist, model=None):
+        ModelArray.__init__(self, np.shape(dist))
+        self.rssi = None
+        model = model or ppm.model
+        if model in self.models:
+            self.rssi = self.__getattribute__(model)(sta, ap, dist)
+
+    def path_loss(self, sta, dist):
+        f = sta.freq * 10 ** 9  # Convert Ghz to Hz
+        c = 299792458.0
+        L = ppm.sL
+
+        dist = self.no_zero(dist)
+
+        lambda_ = c / f  # lambda: wavelength (m)
+        denominator = lambda_ ** 2
+        numerator = (4 * math.pi * dist) ** 2 * L
+        pl = 10 * np.log10(numerator / denominator)
+
+        return self.trunc(pl)
+
+    def friis(self, sta, ap, dist):
+        gains = ap.txpower + ap.antennaGain + sta.antennaGain
+        return gains - self.path_loss(sta, dist)
+
+    def twoRayGround(self, sta, ap, dist):
+        gr = np.trunc(sta.antennaGain)
+        hr = sta.antennaHeight
+        pt = np.trunc(ap.txpower)
+        gt = np.trunc(ap.antennaGain)
+        ht = ap.antennaHeight
+        gains = pt + gt + gr
+        c = 299792458.0  # speed of light in vacuum
+        f = sta.band * 1000000  # frequency in Hz
+
+        dist = self.no_zero(dist)
+        denominator = (c / f) / 1000
+        dCross = (4 * math.pi * ht * hr) / denominator
+        numerator = (pt * gt * gr * ht ** 2 * hr ** 2)
+        far = dist >= dCross
+        pldb = self.trunc(numerator / dist ** 4, where=far)
+        unsure = self.unsure
+        near = self.friis(sta, ap, dist)
+        self.unsure = unsure | (self.unsure & ~far) | ~np.isfinite(dCross)
+        return np.where(far, gains - pldb, near)
+
+    def logDistance(self, sta, ap, dist, gRandom=0):
+        gains = ap.txpower + ap.antennaGain + sta.antennaGain
+        ref_d = 1
+
+        pl = self.path_loss(sta, ref_d)
+        dist = self.no_zero(dist)
+
+        pldb = 10 * ppm.exp * np.log10(dist / ref_d)
+        if gRandom:
+            pldb = pldb + gRandom
+        return gains - (pl + self.trunc(pldb))
+
+    def logNormalShadowing(self, sta, ap, dist):
+        return self.logDistance(sta, ap, dist, gRandom=ppm.gRandom)
+
+    def floorPlan(self, sta, ap, dist):
+        """sta and ap also hold the node positions (position array)"""
+        gains = ap.txpower + ap.antennaGain + sta.antennaGain
+        ref_d = 1
+
+        pl = self.path_loss(sta, ref_d)
+        dist = self.no_zero(dist)
+
+        walls = ppm.get_floor_plan().get_losses(sta.position, ap.position)
+        pldb = 10 * ppm.exp * np.log10(dist / ref_d) + walls
+        return gains - (pl + self.trunc(pldb))
+
+    def ITU(self, sta, ap, dist):
+        gains = ap.txpower + ap.antennaGain + sta.antennaGain
+        f = ap.freq * 10 ** 3
+        lF = ppm.lF  # Floor penetration loss factor
+
+        dist = self.no_zero(dist)
+        if ppm.pL != 0:
+            N = ppm.pL
+        else:
+            N = np.where(dist > 16, 38, 28)  # Power Loss Coefficient
+
+        pldb = 20 * np.log10(f) + N * np.log10(dist) + lF * ppm.nFloors - 28
+        return gains - self.trunc(pldb)
+
+    def young(self, sta, ap, dist):
+        cf = 0.01075  # clutter factor
+
+        dist = self.no_zero(dist)
+        return self.trunc(dist ** 4 / (ap.antennaGain * sta.antennaGain) *
+                          (ap.antennaHeight * sta.antennaHeight) ** 2 * cf)
+
+
 class SetSignalRange(object):
     range = 0
+    params = ('txpower', 'antennaGain', 'antennaHeight', 'freq', 'band')
 
     def __init__(self, intf):
         """Calculate the signal range given the propagation model"""
@@ -255,9 +456,14 @@ class SetSignalRange(object):
                                    (10 * ppm.exp))) * ref_d
         return self.range
 
+    def floorPlan(self, intf):
+        """Floor Plan Propagation Loss Model: range without walls"""
+        return self.logDistance(intf)
+
     def logNormalShadowing(self, intf):
         """Log-Normal Shadowing Propagation Loss Model"""
-        from apns.wmediumdConnector import WmediumdGRandom, w_server, wmediumd_mode
+        from apns.wmediumdConnector import WmediumdGRandom, w_cst, \
+            w_server, wmediumd_mode
 
         ref_d = 1
         txpower = int(intf.txpower)
@@ -265,13 +471,15 @@ class SetSignalRange(object):
         gains = txpower + (gain * 2)
         mean = 0
         variance = ppm.variance
-        gRandom = round(gauss(mean, variance), 2)
+        gRandom = round(ppm.get_gauss(intf, mean, variance), 2)
         ppm.gRandom = gRandom
 
-        if wmediumd_mode == 3:
-            sleep(0.002)  # noticed problem when there are multiple threads
-            w_server.update_gaussian_random(
-                WmediumdGRandom(intf.wmIface, gRandom))
+        if wmediumd_mode.mode == w_cst.INTERFERENCE_MODE and \
+                w_server.connected and hasattr(intf, 'wmIface'):
+            # queued for the wmediumd writer thread, nothing to wait for
+            with w_server.batch_updates(wait=False):
+                w_server.update_gaussian_random(
+                    WmediumdGRandom(intf.wmIface, gRandom))
 
         pl = self.path_loss(intf, ref_d) - gRandom
         numerator = -ppm.noise_th - pl + gains
@@ -298,6 +506,8 @@ class SetSignalRange(object):
 class GetPowerGivenRange(object):
     """Get tx power when the signal range is set"""
     txpower = 0
+    params = ('range', 'txpower', 'antennaGain', 'antennaHeight', 'freq',
+              'band', 'rssi')
 
     def __init__(self, intf):
         """Calculate txpower given the signal range"""
@@ -377,23 +587,30 @@ class GetPowerGivenRange(object):
 
         return self.txpower
 
+    def floorPlan(self, intf):
+        """Floor Plan Propagation Loss Model: tx power without walls"""
+        return self.logDistance(intf)
+
     def logNormalShadowing(self, intf):
         """Log-Normal Shadowing Propagation Loss Model
         distance is the range of the transmitter (m)"""
-        from apns.wmediumdConnector import WmediumdGRandom, w_server, wmediumd_mode
+        from apns.wmediumdConnector import WmediumdGRandom, w_cst, \
+            w_server, wmediumd_mode
 
         mean = 0
         ref_d = 1
         dist = intf.range
         gain = intf.antennaGain
         variance = ppm.variance
-        gRandom = round(gauss(mean, variance), 2)
+        gRandom = round(ppm.get_gauss(intf, mean, variance), 2)
         ppm.gRandom = gRandom
 
-        if wmediumd_mode == 3:
-            sleep(0.001)  # notice problem when there are many threads
-            w_server.update_gaussian_random(WmediumdGRandom(
-                intf.wmIface, gRandom))
+        if wmediumd_mode.mode == w_cst.INTERFERENCE_MODE and \
+                w_server.connected and hasattr(intf, 'wmIface'):
+            # queued for the wmediumd writer thread, nothing to wait for
+            with w_server.batch_updates(wait=False):
+                w_server.update_gaussian_random(
+                    WmediumdGRandom(intf.wmIface, gRandom))
 
         pl = self.path_loss(intf, ref_d) - gRandom
 
@@ -418,3 +635,199 @@ class GetPowerGivenRange(object):
         if self.txpower < 0: self.txpower = 1
 
         return self.txpower
+
+
+class RangeCache(object):
+    """Bounded LRU cache of SetSignalRange and GetPowerGivenRange results:
+    interfaces sharing the model and the radio parameters share them.
+    PropagationModel.set_attr clears it"""
+    maxsize = 4096
+    entries = OrderedDict()
+    hits = misses = 0
+    lock = Lock()  # the association and mobility threads share it
+
+    @staticmethod
+    def get_model():
+        return (ppm.model, ppm.noise_th, ppm.exp, ppm.sL, ppm.lF,
+                ppm.nFloors)
+
+    @classmethod
+    def get(cls, model, intf, attr):
+        """:param model: SetSignalRange or GetPowerGivenRange
+        :param attr: attribute of the model holding the result"""
+        if ppm.model == 'logNormalShadowing':  # draws gRandom every time
+            return getattr(model(intf), attr)
+        key = (model, cls.get_model(),
+               tuple(getattr(intf, param, None) for param in model.params))
+        try:
+            hash(key)
+        except TypeError:  # unhashable parameter
+            return getattr(model(intf), attr)
+        with cls.lock:
+            if key in cls.entries:
+                cls.hits += 1
+                cls.entries.move_to_end(key)
+                return cls.entries[key]
+            cls.misses += 1
+        value = getattr(model(intf), attr)
+        with cls.lock:
+            cls.entries[key] = value
+            if len(cls.entries) > cls.maxsize:
+                cls.entries.popitem(last=False)
+        return value
+
+    @classmethod
+    def get_range(cls, intf):
+        return cls.get(SetSignalRange, intf, 'range')
+
+    @classmethod
+    def get_txpower(cls, intf):
+        return cls.get(GetPowerGivenRange, intf, 'txpower')
+
+    @classmethod
+    def clear(cls):
+        with cls.lock:
+            cls.entries.clear()
+            cls.hits = cls.misses = 0
+
+
+class SetSignalRangeArray(ModelArray):
+    """Batched counterpart of SetSignalRange: intf holds arrays of
+    txpower, antennaGain, freq (and antennaHeight, band for twoRayGround).
+    logNormalShadowing uses ppm.gRandom, or the gRandom given, instead of
+    drawing one. Ranges are not rounded, so NumPy's log10 and pow may only
+    set them apart from the scalar ones in the last bit"""
+    models = ['friis', 'twoRayGround', 'logDistance', 'logNormalShadowing',
+              'ITU', 'floorPlan']
+
+    def __init__(self, intf, model=None, gRandom=None):
+        ModelArray.__init__(self)
+        self.gRandom = ppm.gRandom if gRandom is None else gRandom
+        self.range = None
+        model = model or ppm.model
+        if model in self.models:
+            with np.errstate(all='ignore'):
+                self.range = self.fit(self.__getattribute__(model)(intf))
+
+    @staticmethod
+    def get_gains(intf):
+        return np.trunc(intf.txpower) + (np.trunc(intf.antennaGain) * 2)
+
+    def friis(self, intf):
+        f = intf.freq * 10 ** 9
+        gains = self.get_gains(intf)
+        c = 299792458.0
+        L = ppm.sL
+
+        lambda_ = c / f  # lambda: wavelength (m)
+        denominator = lambda_ ** 2
+        return np.power(10, ((-ppm.noise_th + gains +
+                               10 * np.log10(denominator)) /
+                              10 - math.log10((4 * math.pi) ** 2 * L)) / 2)
+
+    @staticmethod
+    def path_loss(intf, dist):
+        f = intf.freq * 10 ** 9  # Convert Ghz to Hz
+        c = 299792458.0
+        lambda_ = c / f  # lambda: wavelength (m)
+        denominator = lambda_ ** 2
+        numerator = (4 * math.pi * dist) ** 2 * ppm.sL
+        return 10 * np.log10(numerator / denominator)
+
+    def twoRayGround(self, intf):
+        gt = np.trunc(intf.antennaGain)
+        ht = intf.antennaHeight
+        pt = np.trunc(intf.txpower)
+        c = 299792458.0  # speed of light in vacuum
+        f = intf.band * 1000000  # frequency in Hz
+        gains = pt + gt
+
+        denominator = (c / f) / 1000
+        dCross = (4 * math.pi * ht * ht) / denominator
+        numerator = (pt * gt * gt * ht ** 2 * ht ** 2)
+        return (numerator / (gains - ppm.noise_th) / ppm.sL) * dCross
+
+    def logDistance(self, intf, gRandom=0):
+        ref_d = 1
+        pl = self.path_loss(intf, ref_d) - gRandom
+        return np.power(10, ((-ppm.noise_th - pl + self.get_gains(intf)) /
+                              (10 * ppm.exp))) * ref_d
+
+    def logNormalShadowing(self, intf):
+        return self.logDistance(intf, gRandom=self.gRandom)
+
+    def floorPlan(self, intf):
+        return self.logDistance(intf)
+
+    def ITU(self, intf):
+        f = intf.freq * 10 ** 3
+        N = 28  # Power Loss Coefficient
+        lF = ppm.lF  # Floor penetration loss factor
+
+        return np.power(10, ((-ppm.noise_th + self.get_gains(intf) -
+                               20 * np.log10(f) - lF * ppm.nFloors + 28) / N))
+
+
+class GetPowerGivenRangeArray(ModelArray):
+    """Batched counterpart of GetPowerGivenRange: intf holds arrays of
+    range, antennaGain, freq (and txpower, antennaHeight, band, rssi for
+    twoRayGround)"""
+    models = SetSignalRangeArray.models
+    path_loss = staticmethod(SetSignalRangeArray.path_loss)
+
+    def __init__(self, intf, model=None, gRandom=None):
+        ModelArray.__init__(self)
+        self.gRandom = ppm.gRandom if gRandom is None else gRandom
+        self.txpower = None
+        model = model or ppm.model
+        if model in self.models:
+            with np.errstate(all='ignore'):
+                txpower = self.__getattribute__(model)(intf)
+            self.txpower = self.fit(np.where(txpower < 0, 1, txpower))
+
+    def friis(self, intf):
+        dist = intf.range
+        f = intf.freq * 10 ** 9
+        c = 299792458.0
+        lambda_ = c / f  # lambda: wavelength (m)
+        denominator = lambda_ ** 2
+
+        return 10 * (np.log10((4 * math.pi) ** 2 * ppm.sL * dist ** 2)) + \
+            ppm.noise_th - 10 * np.log10(denominator) - (intf.antennaGain * 2)
+
+    def twoRayGround(self, intf):
+        gt = intf.antennaGain
+        ht = intf.antennaHeight
+        c = 299792458.0  # speed of light in vacuum
+        f = intf.band * 1000000  # frequency in Hz
+        gains = intf.txpower + gt
+
+        dCross = ((4 * math.pi * ht) / (c / f)) * ppm.sL
+        return (dCross * (gains - intf.rssi)) / (gt * ht ** 2)
+
+    def logDistance(self, intf):
+        ref_d = 1
+        pl = self.path_loss(intf, ref_d)
+        numerator = np.power(intf.range / ref_d, 10 * ppm.exp) * \
+            np.power(10., pl)
+        denominator = float(10 ** - ppm.noise_th)
+
+        return self.ceil(np.log10(numerator / denominator) -
+                         (intf.antennaGain * 2))
+
+    def logNormalShadowing(self, intf):
+        ref_d = 1
+        pl = self.path_loss(intf, ref_d) - self.gRandom
+
+        return 10 * ppm.exp * np.log10(intf.range / ref_d) + ppm.noise_th + \
+            pl - (intf.antennaGain * 2)
+
+    def floorPlan(self, intf):
+        return self.logDistance(intf)
+
+    def ITU(self, intf):
+        f = intf.freq * 10 ** 3
+        N = 28  # Power Loss Coefficient
+
+        return N * np.log10(intf.range) + ppm.noise_th + 20 * np.log10(f) + \
+            ppm.lF * ppm.nFloors - 28 - (intf.antennaGain * 2)
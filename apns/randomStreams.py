@@ -0,0 +1,123 @@
+"""Reproducible random streams, one per node.
+
+Every node draws from its own numpy Generator, derived from the scenario
+seed and the node name. What a node draws does not depend on the other
+nodes, on how many they are or on the order the draws are made in, so
+trajectories and shadowing stay the same when nodes are added, removed
+or generated in chunks or in another process."""
+
+import numpy as np
+
+
+class RandomStreams(object):
+    """Registry of the per-node streams of the running scenario"""
+    seed = None
+    streams = {}  # (purpose, name): Generator
+
+    @classmethod
+    def set_seed(cls, seed):
+        """Restarts the streams from the scenario seed"""
+        cls.seed = seed
+        cls.streams = {}
+
+    @classmethod
+    def get_entropy(cls):
+        if cls.seed is None:
+            # no scenario seed: a random one, shared by all the streams
+            cls.seed = np.random.SeedSequence().entropy
+        return cls.seed
+
+    @classmethod
+    def get(cls, name, purpose='mobility'):
+        """:param name: node name
+        :param purpose: keeps e.g. mobility and shadowing draws apart
+        :return: numpy Generator of the node"""
+        key = (purpose, name)
+        if key not in cls.streams:
+            spawn_key = tuple(('%s/%s' % (purpose, name)).encode())
+            seq = np.random.SeedSequence(cls.get_entropy(),
+                                         spawn_key=spawn_key)
+            cls.streams[key] = np.random.default_rng(seq)
+        return cls.streams[key]
+
+
+class NodeRandom(object):
+    """Draws for arrays of node indices, each element from the stream of
+    its node. Used by the vectorized mobility models.
+
+    Numbers are drawn from each stream in blocks of `chunk` and buffered,
+    so a draw is a few array operations; a node's stream is only called
+    when its own buffer runs out. What a node gets still only depends on
+    its stream and on its own draws."""
+    chunk = 256
+
+    def __init__(self, names, purpose='mobility'):
+        self.streams = [RandomStreams.get(name, purpose) for name in names]
+        # kind: (numbers (nodes, width), next column, end column) per node
+        self.buffers = {}
+
+    def __getitem__(self, idx):
+        return self.streams[idx]
+
+    def __len__(self):
+        return len(self.streams)
+
+    def refill(self, kind, need):
+        """Keeps the numbers not used yet and draws new blocks for the
+        nodes whose buffer holds fewer than they need"""
+        values, pos, end = self.buffers[kind]
+        left = end - pos
+        short = np.flatnonzero(left < need)
+        blocks = -(-(need[short] - left[short]) // self.chunk) * self.chunk
+        end = left.copy()
+        end[short] += blocks
+        new = np.empty((len(self), end.max()))
+        if values.shape[1]:
+            cols = np.minimum(pos[:, None] + np.arange(new.shape[1]),
+                              values.shape[1] - 1)
+            new[:] = values[np.arange(len(self))[:, None], cols]
+        for node, size in zip(short.tolist(), blocks.tolist()):
+            stream = self.streams[node]
+            new[node, left[node]:end[node]] = \
+                stream.random(size) if kind == 'random' \
+                else stream.standard_normal(size)
+        self.buffers[kind] = new, np.zeros(len(self), dtype=int), end
+
+    def draw(self, idx, kind):
+        """:param kind: 'random' or 'normal' (standard)"""
+        idx = np.asarray(idx, dtype=int)
+        flat = idx.reshape(-1)
+        if not flat.size:
+            return np.empty(idx.shape)
+        if kind not in self.buffers:
+            empty = np.zeros(len(self), dtype=int)
+            self.buffers[kind] = np.empty((len(self), 0)), empty, empty
+        need = np.bincount(flat, minlength=len(self))
+        values, pos, end = self.buffers[kind]
+        if (pos + need > end).any():
+            self.refill(kind, need)
+            values, pos, end = self.buffers[kind]
+        # the k-th occurrence of a node takes its k-th next number
+        order = np.argsort(flat, kind='stable')
+        nodes = flat[order]
+        rank = np.arange(flat.size) - (np.cumsum(need) - need)[nodes]
+        out = np.empty(flat.size)
+        out[order] = values[nodes, pos[nodes] + rank]
+        self.buffers[kind] = values, pos + need, end
+        return out.reshape(idx.shape)
+
+    def random(self, idx):
+        """:param idx: node indices, any shape
+        :return: uniform samples in [0, 1), shaped as idx"""
+        return self.draw(idx, 'random')
+
+    def uniform(self, low, high, idx):
+        return self.random(idx) * (high - low) + low
+
+    def normal(self, idx, loc=0., scale=1.):
+        return self.draw(idx, 'normal') * scale + loc
+
+    def power(self, alpha, low, high, idx):
+        """Truncated power law"""
+        a = alpha + 1.
+        return ((high ** a - low ** a) * self.random(idx) + low ** a) ** (1. / a)
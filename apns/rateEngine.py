@@ -0,0 +1,97 @@
+"""Link rates from the packaged RSSI vs MCS vs PER tables (apns/data).
+
+For every RSSI, the MCS with the highest expected goodput,
+rate * (1 - PER), is picked: the link gets its goodput as bandwidth and
+its PER as loss. Tables are read once and kept as NumPy arrays, rows of
+1 dB being interpolated."""
+
+import os
+
+import numpy as np
+
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+class SignalTable(object):
+    """Best MCS, goodput (Mbps) and loss (%) per RSSI of a table"""
+
+    def __init__(self, name, columns=slice(None)):
+        """:param name: signal_table_<name> in apns/data
+        :param columns: rates of the table the mode can use"""
+        path = os.path.join(DATA, 'signal_table_' + name)
+        rates = None
+        with open(path) as f:
+            for line in f:
+                if line.startswith('# bitrate'):
+                    rates = [float(rate[:-len('Mbps')]) for rate in
+                             line.split()[2:] if rate.endswith('Mbps')]
+        data = np.loadtxt(path, comments='#', ndmin=2)
+        self.rssi = data[:, 0]
+        per = data[:, 1:len(rates) + 1]
+        # some rows hold e.g. 529 for 0.529
+        per = np.where(per > 1, per / 1000., per)
+        self.rates = np.array(rates)[columns]
+        per = per[:, columns]
+        goodput = self.rates * (1 - per)
+        rows = np.arange(len(goodput))
+        self.mcs = np.argmax(goodput, axis=1)  # column of the best rate
+        self.goodput = goodput[rows, self.mcs]
+        self.loss = per[rows, self.mcs] * 100
+
+    def get(self, rssi):
+        """:param rssi: RSSI (dBm), number or array
+        :return: goodput (Mbps) and loss (%)"""
+        return (np.interp(rssi, self.rssi, self.goodput),
+                np.interp(rssi, self.rssi, self.loss))
+
+    def get_mcs(self, rssi):
+        idx = np.clip(np.rint(np.asarray(rssi) - self.rssi[0]).astype(int),
+                      0, len(self.rssi) - 1)
+        return self.mcs[idx]
+
+
+class RateEngine(object):
+    """Bandwidth and loss of the links of the modes having a table"""
+    tables = {}  # (name, first column, last column): SignalTable
+    legacy = {'b': slice(0, 4), 'a': slice(4, 12), 'g': slice(4, 12)}
+    ht = ('n', 'n2')
+
+    @classmethod
+    def get_table(cls, mode, width=20, short_gi=False):
+        """:return: SignalTable of the mode, None if it has none"""
+        if mode in cls.legacy:
+            name, columns = 'ieee80211ax', cls.legacy[mode]
+        elif mode in cls.ht:
+            name = 'ieee80211n_%sgi%s' % ('s' if short_gi else '',
+                                          40 if width == 40 else 20)
+            columns = slice(None)
+        else:
+            return None
+        key = name, columns.start, columns.stop
+        if key not in cls.tables:
+            cls.tables[key] = SignalTable(name, columns)
+        return cls.tables[key]
+
+    @staticmethod
+    def is_short_gi(intf):
+        for intf_ in (intf, getattr(intf, 'associatedTo', None)):
+            ht_capab = getattr(intf_, 'ht_capab', None)
+            if ht_capab and 'SHORT-GI' in ht_capab:
+                return True
+        return False
+
+    @classmethod
+    def get_rate(cls, intf, rssi=None):
+        """:param rssi: RSSI of the link, intf.rssi if None
+        :return: bandwidth (Mbps) and loss (%) of the link, None if the
+        mode has no table or the RSSI is unknown"""
+        rssi = getattr(intf, 'rssi', 0) if rssi is None else rssi
+        if not rssi:
+            return None
+        table = cls.get_table(getattr(intf, 'mode', None),
+                              getattr(intf, 'band', 20), cls.is_short_gi(intf))
+        if table is None:
+            return None
+        bw, loss = table.get(rssi)
+        return max(float(bw), 0.1), float(loss)
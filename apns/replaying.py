@@ -1,42 +1,72 @@
+import os
 import random
+import tempfile
 from threading import Thread as thread
-from time import time, sleep
+from time import sleep
 
-from pylab import math, cos, sin
+import math
+from math import cos, sin
+
+import numpy as np
 
 from apns.log import info
 from apns.mobility import Mobility, ConfigMobLinks
+from apns.mobilityTrace import MobilityTrace, TraceScheduler, is_trace
 from apns.node import Station, AP
 from apns.plot import PlotGraph
+from apns.traceImport import import_trace
+from apns.wmediumdConnector import w_server
 
 
 class ReplayingMobility(Mobility):
     timestamp = False
     net = None
 
-    def __init__(self, net, nodes=None):
+    def __init__(self, net, nodes=None, trace=None):
+        """:param trace: binary trace (see TraceRecorder), ns-2 setdest,
+        BonnMotion or SUMO FCD file replayed instead of the positions in
+        node.p"""
         self.net = net
+        self.trace = trace
         Mobility.thread_ = thread(name='replayingMobility', target=self.mobility,
                                   args=(nodes,))
         Mobility.thread_.daemon = True
         Mobility.thread_._keep_alive = True
         Mobility.thread_.start()
 
-    def timestamp_(self, node, time_):
-        if time_ >= float(node.time[0]):
-            pos = node.p[0]
-            del node.p[0]
-            del node.time[0]
-            self.set_pos(node, pos)
-
-    def notimestamp_(self, node, time_):
-        if time_ >= node.currentTime:
-            for n in range(0, node.params['speed']):
-                if len(node.p) > 0:
-                    pos = node.p[0]
-                    del node.p[0]
-                    node.currentTime += node.timestamp
-                    self.set_pos(node, pos)
+    @staticmethod
+    def load_trace(path):
+        """Memory-maps a binary trace, ns-2, BonnMotion and SUMO traces are
+        imported first (see traceImport)"""
+        if is_trace(path):
+            return MobilityTrace(path)
+        fd, dst = tempfile.mkstemp(suffix='.trace')
+        os.close(fd)
+        import_trace(path, dst)
+        trace = MobilityTrace(dst)
+        os.remove(dst)  # stays mapped until the replay ends
+        return trace
+
+    def get_scheduler(self, nodes):
+        """Merges the positions of all the nodes by time"""
+        scheduler = TraceScheduler()
+        if self.trace:
+            trace = self.load_trace(self.trace)
+            for node in nodes:
+                if node.name in trace:
+                    scheduler.add(node, *trace.get(node.name))
+            return scheduler
+        for node in nodes:
+            if not getattr(node, 'p', None):
+                continue
+            if self.timestamp:
+                scheduler.add(node, node.time, node.p)
+            else:
+                # node.params['speed'] positions every second
+                speed = node.params['speed']
+                steps = np.arange(len(node.p)) // max(1, int(speed))
+                scheduler.add(node, 1. / speed + steps, node.p)
+        return scheduler
 
     def mobility(self, nodes):
         if nodes is None:
@@ -53,35 +83,80 @@ class ReplayingMobility(Mobility):
             self.net.isReplaying = False
             self.net.check_dimension(nodes)
 
-        currentTime = time()
         for node in nodes:
             if 'speed' not in node.params:
                 node.params['speed'] = 1.0
-            node.currentTime = 1 / node.params['speed']
-            node.timestamp = float(1.0 / node.params['speed'])
             if hasattr(node, 'time'):
                 self.timestamp = True
 
-        calc_pos = self.timestamp_ if self.timestamp else self.notimestamp_
-
-        while self.thread_._keep_alive:
-            time_ = time() - currentTime
-            if len(nodes) == 0:
-                break
-            for node in nodes:
-                if hasattr(node, 'p'):
-                    calc_pos(node, time_)
-                    if len(node.p) == 0:
-                        nodes.remove(node)
-                    ConfigMobLinks()
-                    if self.net.draw:
-                        node.update_2d()
+        scheduler = self.get_scheduler(nodes)
+        clock = self.get_clock(0.1, 'replayingMobility')
+        time_ = 0
+        while self.thread_._keep_alive and scheduler:
+            moved = []
+            with w_server.batch_updates(wait=False):
+                for node, pos in scheduler.pop_due(time_):
+                    if self.trace:
+                        pos = tuple(round(float(p), 2) for p in pos)
+                    self.set_pos(node, pos)
+                    moved.append(node)
+            if self.net.draw:
+                for node in set(moved):
+                    node.update_2d()
+            ConfigMobLinks()
             if self.net.draw:
                 PlotGraph.pause()
+            time_ = clock.wait_tick(scheduler.next_time())
+        clock.log_report()
+
+
+class Samples(object):
+    """Row i of parallel per-station lists (e.g. sta.bw, sta.loss)"""
+
+    def __init__(self, *columns):
+        self.columns = columns
+
+    def __len__(self):
+        return min(len(column) for column in self.columns)
 
+    def __getitem__(self, idx):
+        return tuple(column[idx] for column in self.columns)
 
-class ReplayingBandwidth(Mobility):
+
+class ReplayingTc(Mobility):
+    """Replays per-station tc traces: the samples of all the stations are
+    merged on a heap and the thread sleeps until the next one is due.
+    Samples falling in the same tick are coalesced, so each interface
+    gets a single tc change per tick"""
     net = None
+    tick = 0.01  # seconds
+
+    def replay(self, name, columns, apply):
+        """:param name: thread name
+        :param columns: station attributes holding the samples
+        :param apply: called with the station and the last values of a tick"""
+        scheduler = TraceScheduler()
+        for sta in self.net.stations:
+            if hasattr(sta, 'time'):
+                samples = Samples(*[getattr(sta, col) for col in columns])
+                scheduler.add(sta, sta.time, samples)
+        self.events = self.updates = 0
+        clock = self.get_clock(self.tick, name, shared=False)
+        while self.thread_._keep_alive and scheduler:
+            due = scheduler.next_time()
+            tick = clock.interval
+            time_ = clock.wait_tick(max(due, math.ceil(due / tick) * tick))
+            latest = {}
+            for sta, values in scheduler.pop_due(time_):
+                latest[sta] = values
+                self.events += 1
+            for sta, values in latest.items():
+                apply(sta, *values)
+            self.updates += len(latest)
+        clock.log_report()
+
+
+class ReplayingBandwidth(ReplayingTc):
 
     def __init__(self, net):
         self.net = net
@@ -90,30 +165,16 @@ class ReplayingBandwidth(Mobility):
         Mobility.thread_._keep_alive = True
         Mobility.thread_.start()
 
+    @staticmethod
+    def set_throughput(sta, bw):
+        sta.wintfs[0].config_tc(bw=bw, loss=0, latency=0)
+
     def throughput(self):
-        currentTime = time()
-        stations = self.net.stations
-        while self.thread_._keep_alive:
-            if len(stations) == 0:
-                break
-            time_ = time() - currentTime
-            for sta in stations:
-                if hasattr(sta, 'time'):
-                    if time_ >= sta.time[0]:
-                        sta.wintfs[0].config_tc(bw=sta.throughput[0], loss=0, latency=0)
-                        # pos = '%d, %d, %d' % (sta.throughput[0], sta.throughput[0], 0)
-                        # self.moveStationTo(sta, pos)
-                        del sta.throughput[0]
-                        del sta.time[0]
-                        # info('%s\n' % sta.time[0])
-                    if len(sta.time) == 1:
-                        stations.remove(sta)
-            # time.sleep(0.001)
+        self.replay('replayingBandwidth', ['throughput'], self.set_throughput)
         info("\nReplaying Process Finished!")
 
 
-class ReplayingNetworkConditions(Mobility):
-    net = None
+class ReplayingNetworkConditions(ReplayingTc):
 
     def __init__(self, net, **kwargs):
         self.net = net
@@ -122,46 +183,55 @@ class ReplayingNetworkConditions(Mobility):
         Mobility.thread_._keep_alive = True
         Mobility.thread_.start()
 
-    def behavior(self):
-        seconds = 5
+    @staticmethod
+    def set_conditions(sta, bw, loss, latency):
+        if sta.wintfs[0].associatedTo:
+            sta.wintfs[0].config_tc(bw=bw, loss=loss, latency=latency)
+
+    def behavior(self, seconds=5):
         info('Replaying process starting in %s seconds\n' % seconds)
         sleep(seconds)
         info('Replaying process has been started\n')
-        currentTime = time()
-        stations = self.net.stations
-        for sta in stations:
+        for sta in self.net.stations:
             sta.wintfs[0].freq = sta.wintfs[0].get_freq()
-        while self.thread_._keep_alive:
-            if len(stations) == 0:
-                break
-            time_ = time() - currentTime
-            for sta in stations:
-                if hasattr(sta, 'time'):
-                    if time_ >= sta.time[0]:
-                        if sta.wintfs[0].associatedTo:
-                            bw = sta.bw[0]
-                            loss = sta.loss[0]
-                            latency = sta.latency[0]
-                            sta.wintfs[0].config_tc(bw=bw, loss=loss, latency=latency)
-                        del sta.bw[0]
-                        del sta.loss[0]
-                        del sta.latency[0]
-                        del sta.time[0]
-                    if len(sta.time) == 0:
-                        stations.remove(sta)
-            sleep(0.001)
+        self.replay('replayingNetConditions', ['bw', 'loss', 'latency'],
+                    self.set_conditions)
         info('Replaying process has finished!')
 
 
-class ReplayingRSSI(Mobility):
+class DistanceTable(object):
+    """RSSI -> distance lookup table of a propagation model. log10 of the
+    distance is linear in the RSSI for the models of ReplayingRSSI, so it
+    is what gets interpolated"""
+    floor = -150  # dBm
+    step = 0.1  # dB
+
+    def __init__(self, model, gains):
+        """:param model: distance given an array of RSSIs
+        :param gains: txpower plus antenna gains, the highest RSSI"""
+        self.rssi = np.arange(min(self.floor, gains - 1), gains + self.step,
+                              self.step)
+        self.log_dist = np.log10(model(self.rssi))
+
+    def get(self, rssi):
+        return 10 ** np.interp(rssi, self.rssi, self.log_dist)
+
+
+class ReplayingRSSI(ReplayingTc):
     print_bw = False
     print_loss = False
     print_latency = False
     print_distance = False
     net = None
+    models = ('friis', 'logDistance', 'ITU')
 
     def __init__(self, net, ppm='friis', n=32, **kwargs):
+        if ppm not in self.models:
+            raise Exception('ReplayingRSSI supports %s' % ', '.join(self.models))
         self.net = net
+        self.ppm, self.n = ppm, n
+        self.ang = {}
+        self.tables = {}
         for key in kwargs:
             setattr(self, key, kwargs[key])
 
@@ -172,51 +242,49 @@ class ReplayingRSSI(Mobility):
         Mobility.thread_.start()
 
     def rssi(self, ppm, n):
-        currentTime = time()
-        staList = self.net.stations
-        ang = {}
-        for sta in staList:
-            ang[sta] = random.uniform(0, 360)
-            sta.wintfs[0].freq = sta.wintfs[0].get_freq()
-        while self.thread_._keep_alive:
-            if len(staList) == 0:
-                break
-            time_ = time() - currentTime
-            for sta in staList:
-                if hasattr(sta, 'time'):
-                    if time_ >= sta.time[0]:
-                        ap = sta.wintfs[0].associatedTo.node  # get AP
-                        sta.wintfs[0].rssi = sta.rssi[0]
-                        if ap:
-                            rssi = sta.rssi[0]
-                            dist = self.calc_dist(sta, ap, rssi, ppm, n)
-                            self.set_pos(sta, ap, dist, ang[sta])
-                            sta.wintfs[0].configWLink(dist)
-                        del sta.rssi[0]
-                        del sta.time[0]
-                    if len(sta.time) == 0:
-                        staList.remove(sta)
-            sleep(0.01)
+        self.ppm, self.n = ppm, n
+        for sta in self.net.stations:
+            self.ang[sta] = random.uniform(0, 360)
+            intf = sta.wintfs[0]
+            intf.freq = intf.get_freq()
+            if intf.associatedTo:
+                self.get_table(sta, intf.associatedTo.node, ppm, n)
+        self.replay('replayingRSSI', ['rssi'], self.set_rssi)
+
+    def set_rssi(self, sta, rssi):
+        intf = sta.wintfs[0]
+        intf.rssi = rssi
+        if intf.associatedTo:
+            ap = intf.associatedTo.node
+            dist = self.calc_dist(sta, ap, rssi, self.ppm, self.n)
+            self.set_pos(sta, ap, dist, self.ang[sta])
+            intf.configWLink(dist)
 
     def set_pos(self, sta, ap, dist, ang):
+        """Only the link to the AP the RSSI comes from is updated (by
+        set_rssi): scanning the other APs would replace the replayed RSSI"""
         x = float('%.2f' % (dist * cos(ang) + int(ap.position[0])))
         y = float('%.2f' % (dist * sin(ang) + int(ap.position[1])))
         sta.position = x, y, 0
-        ConfigMobLinks(sta)
         if self.net.draw:
             try:
                 sta.update_2d()
             except:
                 pass
-        # sta.verifyingNodes(sta)
 
-    def calc_dist(self, sta, ap, rssi, ppm, n=32.0):
+    def get_table(self, sta, ap, ppm, n):
         pT = ap.wintfs[0].txpower
         gT = ap.wintfs[0].antennaGain
         gR = sta.wintfs[0].antennaGain
-        if ppm in dir(self):
-            dist = self.__getattribute__(ppm)(sta, ap, pT, gT, gR, rssi, n)
-            return int(dist)
+        key = ppm, pT, gT, gR, sta.wintfs[0].freq, n
+        if key not in self.tables:
+            model = getattr(self, ppm)
+            self.tables[key] = DistanceTable(
+                lambda rssi: model(sta, ap, pT, gT, gR, rssi, n), pT + gT + gR)
+        return self.tables[key]
+
+    def calc_dist(self, sta, ap, rssi, ppm, n=32.0):
+        return int(self.get_table(sta, ap, ppm, n).get(rssi))
 
     @classmethod
     def pathLoss(cls, sta, ap, dist, wlan=0):
@@ -0,0 +1,104 @@
+"""Spatially correlated log-normal shadowing.
+
+Instead of a new gauss(mean, variance) per range calculation, shadowing
+is read from a grid of correlated values covering the scenario. The grid
+is drawn once from the scenario seed (see RandomStreams) by filtering
+white noise in the frequency domain (circulant embedding), which gives
+the isotropic exponential correlation exp(-d / decorrelation) of the
+Gudmundson model, d being the euclidean distance. Values between grid
+points are interpolated (bilinear in 2D, trilinear in 3D), so a node
+that does not move keeps its shadowing and one that moves sees it change
+smoothly. Once wmediumd runs, the shadowing at the new position of a
+node is sent along with it (see Node.set_pos_wmediumd)."""
+
+from itertools import product
+
+import numpy as np
+
+from apns.randomStreams import RandomStreams
+
+
+class ShadowingMap(object):
+    """Shadowing (dB) over a 2D or 3D area, set with
+    net.setPropagationModel(model='logNormalShadowing',
+                            shadowing_map=ShadowingMap((100, 100)))"""
+    # the grid is embedded in a periodic one this many decorrelation
+    # distances larger, where points wrap around at most exp(-6) alike
+    margin = 6.
+
+    def __init__(self, size, step=1., decorrelation=10., sigma=None,
+                 origin=None, name='map'):
+        """:param size: x, y (and z) lengths of the area (m)
+        :param step: grid spacing (m)
+        :param decorrelation: distance the correlation falls to 1/e at (m)
+        :param sigma: standard deviation (dB), ppm.variance if None
+        :param origin: lowest corner of the area, (0, 0[, 0]) if None
+        :param name: maps with other names draw other values"""
+        self.size = np.asarray(size, dtype=float)
+        self.step = float(step)
+        self.decorrelation = float(decorrelation)
+        self.sigma = sigma
+        self.origin = np.zeros(len(self.size)) if origin is None \
+            else np.asarray(origin, dtype=float)
+        self.name = name
+        self.shape = tuple(int(np.ceil(length / self.step)) + 1
+                           for length in self.size)
+        self.grid = None
+
+    def get_grid(self):
+        """Drawn on first use, once the scenario seed is known"""
+        if self.grid is None:
+            from apns.propagationModels import PropagationModel as ppm
+            sigma = ppm.variance if self.sigma is None else self.sigma
+            rng = RandomStreams.get(self.name, purpose='shadowingMap')
+            pad = int(np.ceil(self.margin * self.decorrelation / self.step))
+            shape = tuple(n + min(n - 1, pad) for n in self.shape)
+            # distances on the periodic grid, then their correlation
+            dist2 = 0.
+            for axis, n in enumerate(shape):
+                idx = np.minimum(np.arange(n), n - np.arange(n)) * self.step
+                dist2 = np.add.outer(dist2, idx ** 2) if axis else idx ** 2
+            spectrum = np.fft.rfftn(np.exp(-np.sqrt(dist2) /
+                                          self.decorrelation)).real
+            # negative eigenvalues left by the truncated embedding
+            spectrum = np.maximum(spectrum, 0)
+            noise = np.fft.rfftn(rng.standard_normal(shape))
+            grid = np.fft.irfftn(noise * np.sqrt(spectrum), s=shape)
+            # variance of the field: the mean of the eigenvalues
+            norm = np.fft.irfftn(spectrum, s=shape).flat[0]
+            grid = grid[tuple(slice(n) for n in self.shape)]
+            self.grid = grid * sigma / np.sqrt(norm)
+        return self.grid
+
+    def sample(self, positions):
+        """:param positions: array of positions, one per row
+        :return: shadowing at every position, the border value outside"""
+        grid = self.get_grid()
+        pos = np.asarray(positions, dtype=float).reshape(-1, len(self.size))
+        shape = np.array(self.shape)
+        coords = np.clip((pos - self.origin) / self.step, 0, shape - 1)
+        low = np.minimum(np.floor(coords).astype(int),
+                         np.maximum(shape - 2, 0))
+        frac = coords - low
+        values = np.zeros(len(pos))
+        for corner in product((0, 1), repeat=len(shape)):
+            corner = np.array(corner)
+            weight = np.prod(np.where(corner, frac, 1 - frac), axis=1)
+            idx = np.minimum(low + corner, shape - 1)
+            values += weight * grid[tuple(idx.T)]
+        return values
+
+    def get(self, position):
+        """:return: shadowing at a node position"""
+        return float(self.sample([float(p) for p in
+                                  position[:len(self.size)]])[0])
+
+    def update_wmediumd(self, wmIfaces, position):
+        """Sends the shadowing at a node position to wmediumd, as the
+        gaussian random value of its interfaces
+        :param wmIfaces: wmediumd references of the interfaces of the node
+        :param position: position of the node"""
+        from apns.wmediumdConnector import WmediumdGRandom, w_server
+        gRandom = round(self.get(position), 2)
+        for wmIface in wmIfaces:
+            w_server.update_gaussian_random(WmediumdGRandom(wmIface, gRandom))
@@ -0,0 +1,121 @@
+"""Uniform grid used to answer "which APs can reach this station" without
+walking every AP interface on every mobility tick."""
+
+from math import floor
+
+
+class SpatialGrid(object):
+    """Buckets AP interfaces by the x/y cells covered by their signal range.
+    A station only has to be checked against the interfaces registered in
+    the cell it stands in; every interface outside that bucket is
+    guaranteed to be out of range."""
+
+    cell_size = None  # meters, None: size of the largest AP range
+    margin = 0.01  # get_distance_to() rounds to centimeters
+
+    def __init__(self, cell_size=None):
+        if cell_size is None:
+            cell_size = SpatialGrid.cell_size
+        self.cell_size = float(cell_size) if cell_size else None
+        self.cells = {}  # (i, j) -> set of ap intfs
+        self.entries = {}  # ap intf -> (pos, range, cells)
+        self.unplaced = set()  # ap intfs without position: always checked
+        self.order = {}  # ap intf -> (ap, sort key)
+        self.aps = ()
+
+    @staticmethod
+    def ap_intfs(ap):
+        from apns.link import adhoc, mesh
+        for ap_intf in ap.wintfs.values():
+            if not isinstance(ap_intf, adhoc) and not isinstance(ap_intf, mesh):
+                yield ap_intf
+
+    @staticmethod
+    def get_position(node):
+        pos = getattr(node, 'position', None)
+        if pos is None:
+            return None
+        return float(pos[0]), float(pos[1]), float(pos[2])
+
+    def get_cell(self, x, y):
+        return int(floor(x / self.cell_size)), int(floor(y / self.cell_size))
+
+    def get_cells(self, pos, range_):
+        reach = range_ + self.margin
+        i0, j0 = self.get_cell(pos[0] - reach, pos[1] - reach)
+        i1, j1 = self.get_cell(pos[0] + reach, pos[1] + reach)
+        return [(i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)]
+
+    def remove(self, ap_intf):
+        self.unplaced.discard(ap_intf)
+        entry = self.entries.pop(ap_intf, None)
+        if entry:
+            for cell in entry[2]:
+                bucket = self.cells[cell]
+                bucket.discard(ap_intf)
+                if not bucket:
+                    del self.cells[cell]
+
+    def insert(self, ap_intf, pos, range_):
+        cells = self.get_cells(pos, range_)
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(ap_intf)
+        self.entries[ap_intf] = (pos, range_, cells)
+
+    def update(self, ap_intf):
+        """Re-bucket an interface if its AP moved or its range changed"""
+        pos = self.get_position(ap_intf.node)
+        if pos is None:
+            if ap_intf not in self.unplaced:
+                self.remove(ap_intf)
+                self.unplaced.add(ap_intf)
+            return
+        range_ = float(ap_intf.range)
+        entry = self.entries.get(ap_intf)
+        if entry and entry[0] == pos and entry[1] == range_:
+            return
+        self.remove(ap_intf)
+        self.insert(ap_intf, pos, range_)
+
+    def set_cell_size(self, aps):
+        ranges = [float(ap_intf.range) for ap in aps
+                  for ap_intf in self.ap_intfs(ap)]
+        self.cell_size = max(max(ranges) if ranges else 0, 1.0)
+
+    def sync(self, aps):
+        """Brings the grid in line with the current list of APs, their
+        positions and ranges"""
+        aps = tuple(aps)
+        if aps != self.aps:
+            if self.cell_size is None:
+                self.set_cell_size(aps)
+            order = {}
+            for idx, ap in enumerate(aps):
+                for wlan, ap_intf in enumerate(self.ap_intfs(ap)):
+                    order[ap_intf] = (ap, (idx, wlan))
+            for ap_intf in set(self.order) - set(order):
+                self.remove(ap_intf)
+            self.order, self.aps = order, aps
+        for ap_intf in self.order:
+            self.update(ap_intf)
+
+    def candidates(self, node):
+        """AP interfaces that may be in range of node, sorted the same way
+        as the brute-force pass visits them
+        :param node: station"""
+        pos = self.get_position(node)
+        if pos is None:
+            found = self.order
+        else:
+            found = self.cells.get(self.get_cell(pos[0], pos[1]), ())
+            if self.unplaced:
+                found = set(found) | self.unplaced
+        order = self.order
+        return [(order[ap_intf][0], ap_intf) for ap_intf in
+                sorted(found, key=lambda ap_intf: order[ap_intf][1])]
+
+    def __len__(self):
+        return len(self.order)
+
+    def __contains__(self, ap_intf):
+        return ap_intf in self.order
@@ -0,0 +1,96 @@
+"""Package: apns
+   Stand-ins for nodes, wireless interfaces and threads, with only the
+   attributes the code under test reads. Shared by the unit tests."""
+
+from apns.link import IntfWireless
+from apns.node import Node_WiFi
+
+
+class FakeThread(object):
+    _keep_alive = True
+
+
+class FakeNode(object):
+    get_distance_to = Node_WiFi.get_distance_to
+
+    def __init__(self, name='sta1', position=None, **attrs):
+        """:param attrs: any other attribute of the node"""
+        self.name = name
+        self.position = position
+        self.params = {}
+        self.wintfs = {}
+        for key, value in attrs.items():
+            setattr(self, key, value)
+
+    def __repr__(self):
+        return self.name
+
+
+class MobileNode(FakeNode):
+    """Node with the attributes read by the mobility models"""
+
+    def __init__(self, name, max_v=20, constant=3):
+        FakeNode.__init__(self, name, min_x=0, min_y=0, max_x=100,
+                          max_y=100, min_v=1, max_v=max_v,
+                          constantVelocity=constant,
+                          constantDistance=constant)
+
+
+class FakeIntf(object):
+    """Wireless interface with the defaults of IntfWireless, added to
+    the interfaces of its node"""
+    bgscan_module = None
+    active_scan = None
+    encrypt = ''
+
+    def __init__(self, node=None, range_=0, **attrs):
+        """:param attrs: any other attribute of the interface"""
+        self.node = node
+        self.range = range_
+        self.txpower, self.antennaGain, self.antennaHeight = 14, 5, 1
+        self.freq, self.band = 2.412, 20
+        self.rssi = 0
+        self.associatedTo = None
+        self.associatedStations = []
+        for key, value in attrs.items():
+            setattr(self, key, value)
+        if node is not None:
+            node.wintfs[len(node.wintfs)] = self
+
+
+class FakeTCIntf(object):
+    """Interface setting tc up with the equations of IntfWireless,
+    recording the tc parameters instead of applying them"""
+    rate_engine = True
+    eqLatency = IntfWireless.eqLatency
+    eqLoss = IntfWireless.eqLoss
+    eqBw = IntfWireless.eqBw
+    get_bw = IntfWireless.get_bw
+    get_loss = IntfWireless.get_loss
+    get_latency = IntfWireless.get_latency
+    getCustomRate = IntfWireless.getCustomRate
+    get_bw_equation = staticmethod(IntfWireless.get_bw_equation)
+
+    def __init__(self, mode='g', rssi=-70, band=20):
+        self.mode, self.rssi, self.band = mode, rssi, band
+        self.ht_capab = None
+        self.tc = None
+
+    def config_tc(self, **kwargs):
+        self.tc = kwargs
+
+
+class FakeWmediumdIntf(FakeIntf):
+    """Interface sent to wmediumd as IntfWireless sends it"""
+    sendIntfTowmediumd = IntfWireless.sendIntfTowmediumd
+    setGainWmediumd = IntfWireless.setGainWmediumd
+
+
+def wmediumd_node(name, position, macs):
+    """:return: node with an interface per MAC address, not sent to
+    wmediumd yet"""
+    node = FakeNode(name, position, wmIfaces=[])
+    for wlan, mac in enumerate(macs):
+        FakeWmediumdIntf(node, name='%s-wlan%d' % (name, wlan), mac=mac,
+                         txpower=20)
+    return node
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test the compiled channel equations."""
+
+import math
+import unittest
+
+import numpy as np
+
+from apns.channelEquation import ChannelEquation
+from apns.link import IntfWireless
+from apns.mobility import Mobility
+
+from fakeNodes import FakeTCIntf
+
+
+class testChannelEquation(unittest.TestCase):
+
+    def testSameAsEval(self):
+        for expr in [IntfWireless.eqLoss, IntfWireless.eqDelay,
+                     IntfWireless.eqLatency, 'sqrt(dist) * log10(dist + 1)',
+                     '1 if dist < 10 else dist / 10', 'min(dist, 10, 20)',
+                     'max(dist, 2, 3, 4) - min(dist, 1)']:
+            equation = ChannelEquation.get(expr)
+            self.assertIs(equation, ChannelEquation.get(expr))
+            dists = [0, 0.5, 7, 10, 33.25]
+            expected = [eval(expr, {'sqrt': math.sqrt, 'log10': math.log10,
+                                    'min': min, 'max': max},
+                             {'dist': dist}) for dist in dists]
+            self.assertEqual(expected, [equation(dist) for dist in dists])
+            np.testing.assert_allclose(expected, equation.batch(dists),
+                                       rtol=1e-15)
+
+    def testBw(self):
+        """The bw equation goes on the custom rate of the mode"""
+        intf = FakeTCIntf('g')
+        for dist in [0, 3, 12.5]:
+            self.assertEqual(eval('11' + IntfWireless.eqBw),
+                             intf.get_bw(dist))
+
+    def testInvalid(self):
+        for expr in ['__import__("os").system("true")', 'dist.real',
+                     'open("f")', 'x * 2', '"a" * dist', 'dist +']:
+            self.assertRaises(Exception, ChannelEquation, expr)
+
+    def testBatch(self):
+        """Links of many interfaces at once, as configWLink gives them"""
+        intfs = [FakeTCIntf('g', rssi=-70), FakeTCIntf('ac'),
+                 FakeTCIntf('n', rssi=-75), FakeTCIntf('g', rssi=0)]
+        dists = [5, 10, 20, 40]
+        bw, loss, latency = IntfWireless.get_wlink_params(intfs, dists)
+        for idx, intf in enumerate(intfs):
+            IntfWireless.configWLink(intf, dists[idx])
+            self.assertAlmostEqual(intf.tc['bw'], bw[idx])
+            self.assertAlmostEqual(intf.tc['loss'], loss[idx])
+            self.assertAlmostEqual(intf.tc['latency'], latency[idx])
+
+    def testPass(self):
+        """The links an association pass updates are configured at once"""
+        intfs = [FakeTCIntf('g', rssi=-70), FakeTCIntf('n', rssi=-75)]
+        mob = Mobility()
+        mob.wlinks = [(intfs[0], 5), (intfs[1], 20)]
+        mob.config_wlinks()
+        self.assertIsNone(mob.wlinks)
+        for intf, dist in zip(intfs, [5, 20]):
+            tc = intf.tc
+            IntfWireless.configWLink(intf, dist)
+            self.assertEqual(intf.tc, tc)
+
+
+if __name__ == "__main__":
+    unittest.main()
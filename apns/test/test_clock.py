@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test the simulation clock used by the mobility drivers."""
+
+import unittest
+from threading import Thread
+from time import sleep
+
+from apns.clock import SimClock
+
+
+class FakeClock(SimClock):
+    """Clock whose time only moves when it sleeps or work() is called"""
+
+    def __init__(self, *args, **kwargs):
+        self.t = 100.0
+        self.slept = []
+        super(FakeClock, self).__init__(*args, **kwargs)
+
+    def time(self):
+        return self.t
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.t += seconds
+
+    def work(self, seconds):
+        self.t += seconds
+
+
+class testSimClock(unittest.TestCase):
+
+    def testNoDrift(self):
+        """Work done within a tick is not added to the schedule"""
+        clock = FakeClock(0.5)
+        for n in range(1, 11):
+            clock.work(0.2)
+            self.assertAlmostEqual(n * 0.5, clock.wait_tick())
+            self.assertAlmostEqual(n * 0.5, clock.now())
+        self.assertEqual(0, clock.overruns)
+        self.assertAlmostEqual(0.3, clock.slept[-1])
+
+    def testOverrun(self):
+        """A slow tick is accounted and the next ones catch up"""
+        clock = FakeClock(0.1)
+        clock.wait_tick()
+        clock.work(0.35)
+        self.assertAlmostEqual(0.2, clock.wait_tick())
+        self.assertAlmostEqual(0.3, clock.wait_tick())
+        self.assertAlmostEqual(0.4, clock.wait_tick())
+        report = clock.report()
+        self.assertEqual(1, report['overruns'])
+        self.assertAlmostEqual(0.25, report['lateness_max'])
+        self.assertAlmostEqual(0.35, report['busy_max'])
+        self.assertEqual(4, len(report['last_ticks']))
+
+    def testEvents(self):
+        """Event-driven drivers wake up at the time they ask for"""
+        clock = FakeClock()
+        self.assertEqual(2.5, clock.wait_tick(2.5))
+        self.assertAlmostEqual(2.5, clock.now())
+        clock.sleep_until(4)
+        self.assertAlmostEqual(4, clock.now())
+
+    def testPause(self):
+        """Paused time is not simulation time"""
+        clock = SimClock(0.01)
+        SimClock.pause()
+        ticks = []
+        worker = Thread(target=lambda: ticks.append(clock.wait_tick()))
+        worker.daemon = True
+        worker.start()
+        sleep(0.1)
+        self.assertEqual([], ticks)
+        SimClock.resume()
+        worker.join(1)
+        self.assertEqual([0.01], ticks)
+        self.assertLess(clock.now(), 0.05)
+
+    def testInterval(self):
+        self.assertRaises(ValueError, SimClock, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
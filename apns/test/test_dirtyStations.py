@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test that the association thread only evaluates stations which moved
+   or stand near an AP that changed."""
+
+import unittest
+from threading import Thread
+from time import time, sleep
+
+from apns.mobility import Mobility
+
+from fakeNodes import FakeNode, FakeIntf, FakeThread
+
+
+class RecordingMobility(Mobility):
+
+    def __init__(self, aps, stations):
+        self.aps = aps
+        self.mobileNodes = stations
+        self.passes = []
+
+    def config_links(self, nodes):
+        self.passes.append(sorted(node.name for node in nodes))
+
+
+class testDirtyStations(unittest.TestCase):
+
+    def setUp(self):
+        Mobility.dirty = set()
+        Mobility.retry = set()
+        Mobility.ap_state = {}
+        Mobility.ap_check_interval = 0.01
+        self.ap = FakeNode('ap1', [50, 50, 0])
+        FakeIntf(self.ap, range_=20)
+        self.stas = [FakeNode('sta%d' % i, [50 + i * 10, 50, 0])
+                     for i in range(5)]
+        for sta in self.stas:
+            FakeIntf(sta)
+        self.mob = RecordingMobility([self.ap], self.stas)
+        self.mob.get_changed_aps()
+
+    def testMovedOnly(self):
+        """Only nodes handed to set_dirty are returned"""
+        self.mob.set_dirty(self.stas[3], self.stas[1])
+        nodes = self.mob.get_dirty_nodes(self.stas)
+        self.assertEqual([self.stas[1], self.stas[3]], nodes)
+        self.assertEqual([], self.mob.get_dirty_nodes(self.stas))
+
+    def testApChanged(self):
+        """Stations within the old or new range of a changed AP"""
+        self.ap.wintfs[0].txpower = 20
+        nodes = self.mob.get_dirty_nodes(self.stas)
+        self.assertEqual(['sta0', 'sta1', 'sta2'], [n.name for n in nodes])
+        self.ap.wintfs[0].range = 31
+        nodes = self.mob.get_dirty_nodes(self.stas)
+        self.assertEqual(['sta0', 'sta1', 'sta2', 'sta3'],
+                         [n.name for n in nodes])
+        self.stas[4].wintfs[0].associatedTo = self.ap.wintfs[0]
+        self.ap.wintfs[0].range = 5
+        nodes = self.mob.get_dirty_nodes(self.stas)
+        self.assertEqual(['sta0', 'sta1', 'sta2', 'sta3', 'sta4'],
+                         [n.name for n in nodes])
+
+    def testRetry(self):
+        """Stations left unassociated are evaluated again every pass"""
+        Mobility.retry = {self.stas[4]}
+        self.mob.set_dirty(self.stas[1])
+        self.assertEqual([self.stas[1], self.stas[4]],
+                         self.mob.get_dirty_nodes(self.stas))
+        self.assertEqual([self.stas[4]], self.mob.get_dirty_nodes(self.stas))
+
+    def testLoadChanged(self):
+        """With association control, stations near an AP whose associated
+        stations changed are evaluated again"""
+        ap_intf = self.ap.wintfs[0]
+        ap_intf.associatedStations.append(self.stas[0].wintfs[0])
+        self.assertEqual([], self.mob.get_dirty_nodes(self.stas))
+        self.mob.ac = 'ssf'
+        self.mob.get_changed_aps()
+        ap_intf.associatedStations.append(self.stas[1].wintfs[0])
+        self.assertEqual(['sta0', 'sta1', 'sta2'],
+                         [n.name for n in self.mob.get_dirty_nodes(self.stas)])
+        self.assertEqual([], self.mob.get_dirty_nodes(self.stas))
+
+    def testWakeUp(self):
+        """The association thread sleeps until a node moves"""
+        Mobility.ap_check_interval = 5
+        thread_ = FakeThread()
+        self.mob.thread_ = thread_
+        worker = Thread(target=self.mob.parameters)
+        worker.daemon = True
+        worker.start()
+        self.wait_passes(1)
+        self.mob.set_pos(self.stas[2], [0, 0, 0])
+        self.wait_passes(2)
+        thread_._keep_alive = False
+        self.mob.set_dirty()
+        worker.join(2)
+        self.assertFalse(worker.is_alive())
+        self.assertEqual([['sta0', 'sta1', 'sta2', 'sta3', 'sta4'],
+                          ['sta2']], self.mob.passes)
+
+    def wait_passes(self, n, timeout=2):
+        start = time()
+        while len(self.mob.passes) < n and time() - start < timeout:
+            sleep(0.001)
+
+    def tearDown(self):
+        Mobility.ap_check_interval = 1
+        Mobility.retry = set()
+
+
+if __name__ == "__main__":
+    unittest.main()
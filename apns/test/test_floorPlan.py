@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test the floor plan wall index and the floorPlan propagation model."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from random import Random
+
+import numpy as np
+
+from apns.floorPlan import FloorPlan
+from apns.propagationMatrix import PropagationMatrix
+from apns.propagationModels import PropagationModel as ppm
+
+from test_propagationMatrix import build
+
+
+PLAN = '''# office
+material partition 4.5
+wall 0 0 20 0 concrete
+wall 10 -5 10 5 partition
+wall 12 -5 12 5 2.25  # glass door
+'''
+
+
+def get_walls(seed, count=300, size=120):
+    rand = Random(seed)
+    walls = []
+    for _ in range(count):
+        x, y = rand.uniform(0, size), rand.uniform(0, size)
+        length = rand.uniform(1, 15)
+        if rand.random() < 0.5:
+            walls.append((x, y, x + length, y, rand.choice([3, 4.5, 12])))
+        else:
+            walls.append((x, y, x + length * 0.6, y + length * 0.8, 8.25))
+    return walls
+
+
+class testFloorPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = dict(model=ppm.model, floor_plan=ppm.floor_plan)
+
+    def tearDown(self):
+        for attr, value in self.saved.items():
+            setattr(ppm, attr, value)
+
+    def testLoad(self):
+        dir_ = tempfile.mkdtemp()
+        try:
+            path = os.path.join(dir_, 'office.walls')
+            with open(path, 'w') as f:
+                f.write(PLAN)
+            plan = FloorPlan(file_=path)
+        finally:
+            shutil.rmtree(dir_)
+        self.assertEqual(3, len(plan))
+        self.assertEqual(0, plan.get_loss((5, 2, 0), (9, 3, 0)))
+        self.assertEqual(4.5, plan.get_loss((5, 2, 0), (11, 3, 0)))
+        self.assertEqual(6.75, plan.get_loss((5, 2, 0), (15, 3, 0)))
+        self.assertEqual(18.75, plan.get_loss((5, -2, 0), (15, 3, 0)))
+
+    def testIndex(self):
+        """The grid finds every wall a brute force search does"""
+        walls = get_walls(1)
+        plan = FloorPlan(walls, cell=4)
+        rand = Random(2)
+        all_walls = list(range(len(walls)))
+        for _ in range(300):
+            p = (rand.uniform(-10, 130), rand.uniform(-10, 130))
+            q = (rand.uniform(-10, 130), rand.uniform(-10, 130))
+            crossed = plan.crossings(np.array(p), np.array(q), all_walls)
+            self.assertTrue(set(np.nonzero(crossed)[0]) <=
+                            plan.candidates(p, q))
+            self.assertEqual(sum(walls[idx][4] for idx in
+                                 np.nonzero(crossed)[0]),
+                             plan.get_loss(p, q))
+
+    def testBatch(self):
+        plan = FloorPlan(get_walls(3))
+        rand = Random(4)
+        src = np.array([[rand.uniform(0, 120), rand.uniform(0, 120), 0]
+                        for _ in range(30)])
+        dst = np.array([[rand.uniform(0, 120), rand.uniform(0, 120), 0]
+                        for _ in range(10)])
+        losses = plan.get_losses(src[:, np.newaxis], dst[np.newaxis])
+        self.assertEqual((30, 10), losses.shape)
+        for i in range(30):
+            for j in range(10):
+                self.assertEqual(plan.get_loss(src[i], dst[j]), losses[i, j])
+
+    def testModel(self):
+        """The batched model matches the scalar one"""
+        ppm.model = 'floorPlan'
+        ppm.floor_plan = FloorPlan(get_walls(5))
+        stas, aps = build(6)
+        matrix = PropagationMatrix(stas, aps)
+        found = 0
+        for sta in stas:
+            for ap in aps:
+                dist = sta.node.get_distance_to(ap.node)
+                rssi = matrix.get_rssi(sta, ap, dist)
+                if rssi is not None:
+                    found += 1
+                    self.assertEqual(float(ppm(sta, ap, dist).rssi), rssi)
+        self.assertGreater(found, 0.9 * len(stas) * len(aps))
+        wall_free = ppm(stas[0], aps[0], 50).rssi
+        ppm.model = 'logDistance'
+        self.assertGreaterEqual(ppm(stas[0], aps[0], 50).rssi, wall_free)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test faster-than-real-time mobility with analytical association."""
+
+import unittest
+from time import time
+
+from apns.clock import VirtualClock
+from apns.link import master, managed
+from apns.mobility import Mobility, model
+from apns.propagationModels import PropagationModel as ppm
+
+from fakeNodes import FakeNode, FakeThread
+
+
+def add_intf(node, cls, **params):
+    intf = cls.__new__(cls)
+    intf.node = node
+    intf.name = '%s-wlan0' % node.name
+    intf.antennaGain, intf.antennaHeight = 5.0, 1.0
+    intf.txpower, intf.freq, intf.band = 14, 2.412, 20
+    intf.channel, intf.mode, intf.ssid = 1, 'g', 'ssid'
+    intf.encrypt, intf.ieee80211r = '', None
+    intf.bgscan_module, intf.active_scan = None, None
+    intf.associatedTo, intf.rssi = None, 0
+    intf.apsInRange, intf.stationsInRange = {}, {}
+    intf.associatedStations = []
+    for key, value in params.items():
+        setattr(intf, key, value)
+    node.wintfs[0] = intf
+    return intf
+
+
+class testHeadless(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = (Mobility.headless, Mobility.thread_, Mobility.aps,
+                      Mobility.stations, Mobility.mobileNodes, ppm.model)
+        Mobility.headless = True
+        Mobility.thread_ = FakeThread()
+        Mobility.ap_state = None
+        Mobility.dirty = set()
+        ppm.model = 'logDistance'
+
+    def tearDown(self):
+        (Mobility.headless, Mobility.thread_, Mobility.aps,
+         Mobility.stations, Mobility.mobileNodes, ppm.model) = self.saved
+        Mobility.clock = None
+
+    def testSteppedRandomWalk(self):
+        """An hour of random walk runs in a few seconds and associations
+        follow the positions"""
+        aps = []
+        for i, pos in enumerate([(25, 25, 0), (75, 75, 0)]):
+            ap = FakeNode('ap%d' % (i + 1), pos)
+            add_intf(ap, master, range=30, freq=2.412 + i * 0.025)
+            aps.append(ap)
+        stas = []
+        for i in range(20):
+            sta = FakeNode('sta%d' % i)
+            add_intf(sta, managed, range=30)
+            sta.constantVelocity = sta.constantDistance = 5
+            stas.append(sta)
+
+        mob = model.__new__(model)
+        clock = VirtualClock(1, name='test')
+        start = time()
+        mob.models(stations=stas, aps=aps, stat_nodes=aps, mob_nodes=stas,
+                   seed=10, mob_model='RandomWalk', mob_stop_time=3600,
+                   clock=clock)
+        self.assertLess(time() - start, 30)
+        self.assertEqual(3601, clock.tick)
+        self.assertAlmostEqual(3601, clock.now())
+
+        for sta in stas:
+            intf = sta.wintfs[0]
+            in_range = [ap.wintfs[0] for ap in aps
+                        if sta.get_distance_to(ap) <= ap.wintfs[0].range]
+            if in_range:
+                self.assertIn(intf.associatedTo, in_range)
+                self.assertEqual(intf.freq, intf.associatedTo.freq)
+                self.assertIn(intf, intf.associatedTo.associatedStations)
+                self.assertLess(intf.rssi, 0)
+            else:
+                self.assertIsNone(intf.associatedTo)
+                self.assertEqual(0, intf.rssi)
+        associated = sum(len(ap.wintfs[0].associatedStations) for ap in aps)
+        self.assertEqual(associated, sum(1 for sta in stas
+                                         if sta.wintfs[0].associatedTo))
+
+    def testDilation(self):
+        """Dilated clocks sleep a fraction of the simulated time"""
+        clock = VirtualClock(0.5, dilation=50)
+        start = time()
+        for _ in range(10):
+            clock.wait_tick()
+        self.assertLess(time() - start, 1)
+        self.assertGreaterEqual(clock.now(), 5)
+
+    def testEncryptedAssociation(self):
+        """An associated station does not hop to another WPA AP"""
+        ap1, ap2, sta = FakeNode('ap1'), FakeNode('ap2'), FakeNode('sta')
+        ap1_intf = add_intf(ap1, master, encrypt='wpa2')
+        ap2_intf = add_intf(ap2, master, encrypt='wpa2')
+        sta_intf = add_intf(sta, managed, encrypt='wpa2')
+        Mobility.associate_analytic(sta_intf, ap1_intf)
+        Mobility.associate_analytic(sta_intf, ap2_intf)
+        self.assertIs(ap1_intf, sta_intf.associatedTo)
+        self.assertEqual([], ap2_intf.associatedStations)
+
+
+if __name__ == "__main__":
+    unittest.main()
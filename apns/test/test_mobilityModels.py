@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test the chunked lookahead of the stochastic mobility models."""
+
+import unittest
+
+import numpy as np
+
+from apns.mobility import RandomWaypoint, RandomWalk, RandomDirection, \
+    TruncatedLevyWalk, get_steps
+from apns.randomStreams import RandomStreams
+
+from fakeNodes import MobileNode
+
+
+def get_models(nodes):
+    return [RandomWaypoint(nodes, wt_min=1, wt_max=5), RandomWalk(nodes),
+            RandomDirection(nodes, (100, 100)), TruncatedLevyWalk(nodes)]
+
+
+class testLookahead(unittest.TestCase):
+
+    def setUp(self):
+        self.nodes = [MobileNode('sta%d' % i) for i in range(10)]
+
+    def frames(self, n, idx, seed=7):
+        RandomStreams.set_seed(seed)
+        mob = iter(get_models(self.nodes)[idx])
+        return np.array([np.array(next(mob)) for _ in range(n)])
+
+    def testBitIdentical(self):
+        """Chunks hold the same steps as frame by frame iteration"""
+        for idx in range(4):
+            expected = self.frames(100, idx)
+            RandomStreams.set_seed(7)
+            chunks = get_models(self.nodes)[idx].chunks(16)
+            steps = [next(chunks).copy() for _ in range(7)]
+            got = np.concatenate(steps)[:100]
+            self.assertEqual((16, 10, 2), steps[0].shape)
+            np.testing.assert_array_equal(expected, got)
+
+    def testBufferReused(self):
+        RandomStreams.set_seed(7)
+        chunks = RandomWalk(self.nodes).chunks(4)
+        self.assertIs(next(chunks), next(chunks))
+
+    def testRoundedSteps(self):
+        """Rounding a chunk at once gives the per coordinate rounding"""
+        expected = self.frames(50, 0)
+        RandomStreams.set_seed(7)
+        steps = get_steps(get_models(self.nodes)[0], lookahead=8)
+        for xy in expected:
+            self.assertEqual([[round(x, 2), round(y, 2)] for x, y in xy],
+                             next(steps))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test mobility models generated in a separate process."""
+
+import unittest
+
+import numpy as np
+
+from apns.mobility import get_model
+from apns.mobilityProcess import MobilityProcess, SharedPositions
+from apns.randomStreams import RandomStreams
+
+from fakeNodes import MobileNode
+
+
+class testMobilityProcess(unittest.TestCase):
+
+    def setUp(self):
+        self.nodes = [MobileNode('sta%d' % i, max_v=5, constant=2)
+                      for i in range(5)]
+
+    def expected(self, mob_model, steps, **kwargs):
+        RandomStreams.set_seed(10)
+        mob = iter(get_model(mob_model, self.nodes, **kwargs))
+        return [np.array(next(mob)) for _ in range(steps)]
+
+    def testSameSteps(self):
+        """Steps read from shared memory match the in-process generator"""
+        for mob_model in ['RandomWalk', 'RandomDirection']:
+            expected = self.expected(mob_model, 20)
+            mob = MobilityProcess(self.nodes, mob_model, 10, slots=3)
+            try:
+                for n, xy in enumerate(mob):
+                    np.testing.assert_array_equal(expected[n], xy)
+                    if n == len(expected) - 1:
+                        break
+            finally:
+                mob.stop()
+            self.assertFalse(mob.process.is_alive())
+
+    def testLatest(self):
+        """The generator stays at most slots - 1 steps ahead"""
+        mob = MobilityProcess(self.nodes, 'RandomWalk', 10, slots=4)
+        try:
+            xy = mob.next_frame(timeout=5)
+            self.assertEqual((5, 2), xy.shape)
+            mob.process.join(0.5)
+            seq, last = mob.latest()
+            self.assertEqual(3, seq)
+            self.assertFalse(np.array_equal(xy, last))
+            mob.next_frame(timeout=5)
+            mob.process.join(0.5)
+            self.assertEqual(4, mob.latest()[0])
+        finally:
+            mob.stop()
+
+    def testSharedPositions(self):
+        owner = SharedPositions(2, slots=2)
+        reader = SharedPositions(2, slots=2, name=owner.name)
+        self.assertEqual((0, None), reader.latest())
+        for n in range(3):
+            owner.write([[n, n], [n, -n]])
+        seq, xy = reader.latest()
+        self.assertEqual(3, seq)
+        self.assertEqual([[2, 2], [2, -2]], xy.tolist())
+        self.assertEqual([[1, 1], [1, -1]], reader.frame(1).tolist())
+        reader.close()
+        owner.close()
+
+    def testLatestOverwritten(self):
+        """A frame overwritten while it is copied is read again"""
+        owner = SharedPositions(1, slots=2)
+        reader = SharedPositions(1, slots=2, name=owner.name)
+        owner.write([[0, 0]])
+        frame = reader.frame
+        writes = [[[1, 1]], [[2, 2]]]
+
+        def overwritten(seq):
+            if writes:  # the writer fills both slots meanwhile
+                owner.write(writes.pop(0))
+                owner.write(writes.pop(0))
+            return frame(seq)
+
+        reader.frame = overwritten
+        seq, xy = reader.latest()
+        self.assertEqual(3, seq)
+        self.assertEqual([[2, 2]], xy.tolist())
+        reader.close()
+        owner.close()
+
+    def testUnknownModel(self):
+        self.assertRaises(Exception, MobilityProcess, self.nodes, 'foo', 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
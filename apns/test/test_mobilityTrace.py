@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test recording and replaying binary mobility traces."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from apns.mobility import Mobility
+from apns.mobilityTrace import TraceRecorder, MobilityTrace, TraceScheduler
+
+
+class FakeThread(object):
+    _keep_alive = False
+
+
+class FakeNode(object):
+
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeClock(object):
+    t = 0.
+
+    def now(self):
+        return self.t
+
+
+class testMobilityTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'run.trace')
+        self.block = TraceRecorder.block
+
+    def tearDown(self):
+        TraceRecorder.block = self.block
+        TraceRecorder.stop_recording()
+        shutil.rmtree(self.dir)
+
+    def testRecordSetPos(self):
+        """Positions set by a mobility driver land in per-node columns"""
+        TraceRecorder.block = 4  # several spool blocks
+        saved = Mobility.thread_, Mobility.clock
+        Mobility.thread_, Mobility.clock = FakeThread(), FakeClock()
+        nodes = [FakeNode('sta%d' % i) for i in range(3)]
+        mob = Mobility()
+        TraceRecorder.start_recording(self.path)
+        try:
+            for step in range(5):
+                Mobility.clock.t = step * 0.5
+                for i, node in enumerate(nodes[:step + 1]):
+                    mob.set_pos(node, (step, i + 0.25, 0.0))
+        finally:
+            Mobility.thread_, Mobility.clock = saved
+        recorder = TraceRecorder.stop_recording()
+        self.assertEqual([5, 4, 3], recorder.counts)
+        self.assertFalse(os.path.exists(self.path + '.spool'))
+
+        trace = MobilityTrace(self.path)
+        self.assertEqual(['sta0', 'sta1', 'sta2'], trace.names)
+        times, xyz = trace.get('sta1')
+        self.assertEqual([0.5, 1, 1.5, 2], times.tolist())
+        self.assertEqual([[1, 1.25, 0], [2, 1.25, 0], [3, 1.25, 0],
+                          [4, 1.25, 0]], xyz.tolist())
+        self.assertIsInstance(times, np.memmap)
+        self.assertEqual(5, len(trace.get('sta0')[0]))
+
+    def testScheduler(self):
+        """Samples of all the nodes come out in time order"""
+        scheduler = TraceScheduler()
+        scheduler.add('a', [0, 1, 2], ['a0', 'a1', 'a2'])
+        scheduler.add('b', np.array([0.5, 1, 3]), ['b0', 'b1', 'b2'])
+        scheduler.add('c', [], [])
+        self.assertEqual(2, len(scheduler))
+        self.assertEqual([('a', 'a0')], scheduler.pop_due(0))
+        self.assertEqual(0.5, scheduler.next_time())
+        self.assertEqual([('b', 'b0'), ('a', 'a1'), ('b', 'b1')],
+                         scheduler.pop_due(1))
+        self.assertEqual([('a', 'a2'), ('b', 'b2')], scheduler.pop_due(10))
+        self.assertIsNone(scheduler.next_time())
+        self.assertFalse(scheduler)
+
+    def testEmpty(self):
+        TraceRecorder.start_recording(self.path)
+        TraceRecorder.stop_recording()
+        self.assertEqual([], MobilityTrace(self.path).names)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test the array API of the propagation models against the scalar
+   models."""
+
+import math
+import unittest
+from random import Random
+
+import numpy as np
+
+from apns.propagationModels import PropagationModel as ppm, \
+    PropagationModelArray, SetSignalRange, SetSignalRangeArray, \
+    GetPowerGivenRange, GetPowerGivenRangeArray, ParamArrays
+
+from fakeNodes import FakeNode, FakeIntf
+
+
+ATTRS = ['txpower', 'antennaGain', 'antennaHeight', 'freq', 'band', 'range',
+         'rssi']
+
+
+def random_intf(rand, idx):
+    return FakeIntf(FakeNode('sta%d' % idx),
+                    txpower=rand.choice([1, 14, 20, 23, 15.5]),
+                    antennaGain=rand.choice([0, 5.0, 3.5, 7]),
+                    antennaHeight=rand.choice([1.0, 2.0, 1.5]),
+                    freq=rand.choice([2.412, 2.437, 5.18, 5.745]),
+                    band=rand.choice([20, 40]),
+                    range_=round(rand.uniform(1, 300), rand.choice([0, 2])),
+                    rssi=rand.uniform(-90, -30))
+
+
+def get_arrays(intfs):
+    return ParamArrays(**dict((attr, [getattr(intf, attr) for intf in intfs])
+                              for attr in ATTRS))
+
+
+class testPropagationArrays(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = dict(model=ppm.model, gRandom=ppm.gRandom)
+        rand = Random(3)
+        self.intfs = [random_intf(rand, idx) for idx in range(200)]
+        self.arrays = get_arrays(self.intfs)
+
+    def tearDown(self):
+        for attr, value in self.saved.items():
+            setattr(ppm, attr, value)
+
+    def assertClose(self, expected, value):
+        self.assertTrue(math.isclose(expected, value, rel_tol=1e-12),
+                        '%r != %r' % (expected, value))
+
+    def testRange(self):
+        """Ranges and tx powers are the scalar ones, up to the last bit
+        of NumPy's log10 and pow, and rounded tx powers exactly"""
+        ppm.gRandom = 1.37
+        for model in SetSignalRangeArray.models:
+            if model == 'logNormalShadowing':
+                continue  # the scalar model draws gRandom
+            ppm.model = model
+            ranges = SetSignalRangeArray(self.arrays)
+            powers = GetPowerGivenRangeArray(self.arrays)
+            for idx, intf in enumerate(self.intfs):
+                self.assertClose(SetSignalRange(intf).range, ranges.range[idx])
+                if powers.unsure[idx]:
+                    continue  # near an integer, or the scalar divides by 0
+                txpower = GetPowerGivenRange(intf).txpower
+                if isinstance(txpower, int):
+                    self.assertEqual(txpower, powers.txpower[idx])
+                else:
+                    self.assertClose(txpower, powers.txpower[idx])
+
+    def testShadowing(self):
+        ppm.model = 'logNormalShadowing'
+        intf = self.intfs[0]
+        range_ = SetSignalRange(intf).range
+        array = SetSignalRangeArray(get_arrays([intf]), gRandom=ppm.gRandom)
+        self.assertClose(range_, array.range[0])
+
+    def testRssi(self):
+        """dist, txpower and frequency arrays broadcast together"""
+        dist = np.array([0, 1, 10.5, 120])
+        ap = ParamArrays(txpower=[[14], [20]], antennaGain=5, freq=2.412)
+        sta = ParamArrays(antennaGain=5, freq=2.412)
+        rssi = PropagationModelArray(sta, ap, dist, model='friis').rssi
+        self.assertEqual((2, 4), rssi.shape)
+        self.assertEqual(6, rssi[1, 0] - rssi[0, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
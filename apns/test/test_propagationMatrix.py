@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test the batched distance/RSSI matrix against the scalar
+   propagation models."""
+
+import unittest
+from random import Random
+
+from apns.propagationMatrix import PropagationMatrix
+from apns.propagationModels import PropagationModel as ppm
+
+from fakeNodes import FakeNode, FakeIntf
+
+
+def random_intf(rand, node):
+    return FakeIntf(node, antennaGain=rand.choice([0, 5.0, 3.5, 7]),
+                    antennaHeight=rand.choice([1.0, 2.0, 1.5]),
+                    txpower=rand.choice([1, 14, 20, 23]),
+                    freq=rand.choice([2.412, 2.437, 5.18, 5.745]),
+                    band=rand.choice([20, 40]))
+
+
+def build(seed, n_stas=40, n_aps=15, size=120):
+    rand = Random(seed)
+    pos = lambda: [round(rand.uniform(0, size), rand.choice([0, 1, 3])),
+                   round(rand.uniform(0, size), 2), rand.choice([0, 1.5])]
+    stas = [random_intf(rand, FakeNode('sta', pos())) for _ in range(n_stas)]
+    aps = [random_intf(rand, FakeNode('ap', pos())) for _ in range(n_aps)]
+    # co-located and integer-spaced pairs hit the dist == 0 and
+    # truncation edge cases
+    stas[0].node.position = list(aps[0].node.position)
+    stas[1].node.position = [aps[1].node.position[0] + 10,
+                             aps[1].node.position[1], aps[1].node.position[2]]
+    return stas, aps
+
+
+class testPropagationMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = dict(model=ppm.model, exp=ppm.exp, gRandom=ppm.gRandom,
+                          pL=ppm.pL)
+
+    def tearDown(self):
+        for attr, value in self.saved.items():
+            setattr(ppm, attr, value)
+
+    def compare(self, seed):
+        stas, aps = build(seed)
+        matrix = PropagationMatrix(stas, aps)
+        for sta in stas:
+            for ap in aps:
+                dist = sta.node.get_distance_to(ap.node)
+                self.assertEqual(dist, matrix.distance(sta, ap.node))
+                rssi = matrix.get_rssi(sta, ap, dist)
+                if rssi is None:
+                    continue
+                self.assertEqual(float(ppm(sta, ap, dist).rssi), rssi)
+        return matrix
+
+    def testModels(self):
+        """Every batched model matches its scalar version"""
+        for model in ['friis', 'logDistance', 'logNormalShadowing', 'ITU',
+                      'twoRayGround']:
+            ppm.model = model
+            for seed in range(4):
+                matrix = self.compare(seed)
+                self.assertIsNotNone(matrix.rssi)
+                self.assertLess(matrix.unsure.sum(), matrix.rssi.size / 10)
+
+    def testYoung(self):
+        """Pairs the scalar model divides by zero for are left to it"""
+        ppm.model = 'young'
+        for seed in range(4):
+            matrix = self.compare(seed)
+            gains = matrix.sta.antennaGain * matrix.ap.antennaGain
+            self.assertTrue(matrix.unsure[gains == 0].all())
+            self.assertLess(matrix.unsure[gains != 0].sum(), 5)
+
+    def testParameters(self):
+        """Global model parameters are honoured"""
+        ppm.model, ppm.exp, ppm.gRandom = 'logNormalShadowing', 4.5, -1.37
+        self.compare(11)
+        ppm.model, ppm.pL = 'ITU', 31
+        self.compare(12)
+
+    def testStaleSnapshot(self):
+        """Changes after the snapshot fall back to the scalar path"""
+        ppm.model = 'logDistance'
+        stas, aps = build(3)
+        matrix = PropagationMatrix(stas, aps)
+        dist = matrix.distance(stas[2], aps[2].node)
+        self.assertIsNotNone(matrix.get_rssi(stas[2], aps[2], dist))
+        aps[2].txpower += 1
+        self.assertIsNone(matrix.get_rssi(stas[2], aps[2], dist))
+        stas[2].node.position[0] += 1
+        self.assertIsNone(matrix.distance(stas[2], aps[2].node))
+        ppm.exp = 2
+        self.assertIsNone(matrix.get_rssi(stas[3], aps[3], dist))
+
+    def testRound(self):
+        """Halfway distances round like round(x, 2)"""
+        values = [0.125, 2.675, 1.005, 0.285, 10.115, 3.14159, 99.995]
+        self.assertEqual([round(v, 2) for v in values],
+                         list(PropagationMatrix.round2(values)))
+
+
+if __name__ == "__main__":
+    unittest.main()
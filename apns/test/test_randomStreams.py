@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test the per-node random streams of mobility and shadowing."""
+
+import unittest
+
+import numpy as np
+
+from apns.mobility import get_model
+from apns.propagationModels import PropagationModel as ppm
+from apns.randomStreams import NodeRandom, RandomStreams
+
+from fakeNodes import FakeNode, MobileNode, FakeIntf
+
+
+class testRandomStreams(unittest.TestCase):
+
+    def trajectories(self, mob_model, names, steps=200, seed=3):
+        RandomStreams.set_seed(seed)
+        mob = iter(get_model(mob_model, [MobileNode(name) for name in names]))
+        frames = np.array([np.array(next(mob)) for _ in range(steps)])
+        return dict((name, frames[:, i]) for i, name in enumerate(names))
+
+    def testIndependentNodes(self):
+        """Adding nodes or reordering them leaves the other paths as is"""
+        for mob_model in ['RandomWalk', 'RandomDirection', 'RandomWayPoint',
+                          'TruncatedLevyWalk', 'GaussMarkov']:
+            few = self.trajectories(mob_model, ['sta1', 'sta2'])
+            more = self.trajectories(mob_model, ['sta3', 'sta2', 'sta4', 'sta1'])
+            for name in few:
+                np.testing.assert_array_equal(few[name], more[name])
+
+    def testSeed(self):
+        first = self.trajectories('RandomWayPoint', ['sta1', 'sta2'])
+        again = self.trajectories('RandomWayPoint', ['sta1', 'sta2'])
+        other = self.trajectories('RandomWayPoint', ['sta1', 'sta2'], seed=4)
+        np.testing.assert_array_equal(first['sta1'], again['sta1'])
+        self.assertFalse(np.array_equal(first['sta1'], other['sta1']))
+        self.assertFalse(np.array_equal(first['sta1'], first['sta2']))
+
+    def testShadowing(self):
+        """Shadowing draws only depend on the seed and the node"""
+        sta1, sta2 = FakeIntf(FakeNode('sta1')), FakeIntf(FakeNode('sta2'))
+        RandomStreams.set_seed(5)
+        values = [ppm.get_gauss(sta1, 0, 2) for _ in range(3)]
+        RandomStreams.set_seed(5)
+        ppm.get_gauss(sta2, 0, 2)
+        self.assertEqual(values, [ppm.get_gauss(sta1, 0, 2) for _ in range(3)])
+
+    def testNodeRandom(self):
+        RandomStreams.set_seed(1)
+        rng = NodeRandom(['a', 'b'])
+        draws = rng.uniform(10, 20, np.array([[0, 0], [1, 1]]))
+        self.assertEqual((2, 2), draws.shape)
+        self.assertTrue(((draws >= 10) & (draws < 20)).all())
+        RandomStreams.set_seed(1)
+        self.assertEqual(draws[1, 0], NodeRandom(['b']).uniform(10, 20, [0]))
+
+    def testBuffered(self):
+        """A node gets the same numbers however its draws are grouped
+        and whatever the other nodes draw, across buffer refills"""
+        RandomStreams.set_seed(2)
+        rng = NodeRandom(['a', 'b'])
+        rng.chunk = 16
+        once = rng.random([0] * 60)
+        RandomStreams.set_seed(2)
+        rng = NodeRandom(['b', 'a'])
+        rng.chunk = 16
+        steps = np.concatenate([rng.random([1, 0, 0, 1, 0][:k % 5 + 1])
+                                for k in range(30)])
+        order = [1, 0, 0, 1, 0]
+        idx = np.concatenate([order[:k % 5 + 1] for k in range(30)])
+        np.testing.assert_array_equal(once[:(idx == 1).sum()], steps[idx == 1])
+        normal = rng.normal([0, 1, 1], loc=5., scale=0.)
+        np.testing.assert_array_equal([5., 5., 5.], normal)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test the signal range and tx power cache."""
+
+import unittest
+from threading import Thread
+
+from apns.propagationModels import PropagationModel as ppm, RangeCache, \
+    SetSignalRange, GetPowerGivenRange
+
+from fakeNodes import FakeIntf
+
+
+def get_intf(txpower=14):
+    return FakeIntf(txpower=txpower, range_=50, rssi=-60)
+
+
+class testRangeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = dict(model=ppm.model, exp=ppm.exp,
+                          noise_th=ppm.noise_th, cca_threshold=ppm.cca_threshold)
+        RangeCache.clear()
+
+    def tearDown(self):
+        for attr, value in self.saved.items():
+            setattr(ppm, attr, value)
+        RangeCache.clear()
+
+    def testShared(self):
+        """Identical radios compute their range once"""
+        ppm.model = 'logDistance'
+        intfs = [get_intf() for _ in range(100)] + [get_intf(20)]
+        ranges = [RangeCache.get_range(intf) for intf in intfs]
+        self.assertEqual(SetSignalRange(intfs[0]).range, ranges[0])
+        self.assertEqual(SetSignalRange(intfs[-1]).range, ranges[-1])
+        self.assertEqual((99, 2), (RangeCache.hits, RangeCache.misses))
+        self.assertEqual(GetPowerGivenRange(intfs[0]).txpower,
+                         RangeCache.get_txpower(intfs[0]))
+
+    def testInvalidate(self):
+        ppm.model = 'logDistance'
+        intf = get_intf()
+        range_ = RangeCache.get_range(intf)
+        ppm.set_attr(ppm.noise_th, ppm.cca_threshold, exp=4)
+        self.assertFalse(RangeCache.entries)
+        self.assertLess(RangeCache.get_range(intf), range_)
+
+    def testBounded(self):
+        ppm.model = 'friis'
+        saved, RangeCache.maxsize = RangeCache.maxsize, 3
+        try:
+            for txpower in range(5):
+                RangeCache.get_range(get_intf(txpower))
+            self.assertEqual(3, len(RangeCache.entries))
+            RangeCache.get_range(get_intf(0))  # evicted
+            self.assertEqual(0, RangeCache.hits)
+        finally:
+            RangeCache.maxsize = saved
+
+    def testThreads(self):
+        """Lookups and evictions from several threads at once"""
+        ppm.model = 'friis'
+        saved, RangeCache.maxsize = RangeCache.maxsize, 4
+        errors = []
+
+        def lookup():
+            try:
+                for i in range(2000):
+                    RangeCache.get_range(get_intf(i % 6))
+            except Exception as e:
+                errors.append(e)
+
+        try:
+            threads = [Thread(target=lookup) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            RangeCache.maxsize = saved
+        self.assertEqual([], errors)
+        self.assertEqual(8000, RangeCache.hits + RangeCache.misses)
+
+
+if __name__ == "__main__":
+    unittest.main()
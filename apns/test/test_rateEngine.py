@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test the rates derived from the packaged signal tables."""
+
+import unittest
+
+import numpy as np
+
+from apns.link import IntfWireless
+from apns.rateEngine import RateEngine, SignalTable
+
+from fakeNodes import FakeTCIntf
+
+
+class testRateEngine(unittest.TestCase):
+
+    def testTables(self):
+        for name in ['ieee80211ax', 'ieee80211n_gi20', 'ieee80211n_gi40',
+                     'ieee80211n_sgi20', 'ieee80211n_sgi40']:
+            table = SignalTable(name)
+            self.assertEqual(-100, table.rssi[0])
+            self.assertTrue((table.loss >= 0).all())
+            self.assertTrue((table.loss <= 100).all())
+            # a stronger signal never gives less
+            self.assertTrue((np.diff(table.goodput) >= 0).all())
+
+    def testBestMcs(self):
+        table = RateEngine.get_table('g')
+        self.assertEqual((54, 0), table.get(-65))
+        self.assertEqual(0, table.get(-100)[0])
+        bw, loss = table.get(-88.5)
+        self.assertEqual(9, table.rates[table.get_mcs(-89)])
+        self.assertTrue(8.6 < bw < 9)
+        self.assertIs(table, RateEngine.get_table('a'))  # loaded once
+        self.assertEqual(11, RateEngine.get_table('b').get(-60)[0])
+        self.assertEqual(270, RateEngine.get_table('n', 40, True).get(-50)[0])
+
+    def testLink(self):
+        """configWLink takes bw and loss from the tables, when it can"""
+        intf = FakeTCIntf('n', rssi=-60)
+        IntfWireless.configWLink(intf, 10)
+        self.assertEqual({'bw': 117, 'loss': 0, 'latency': 0.5}, intf.tc)
+        intf.ht_capab = '[HT40+][SHORT-GI-40]'
+        intf.band = 40
+        self.assertEqual((270, 0), RateEngine.get_rate(intf))
+        for intf in [FakeTCIntf('ac'), FakeTCIntf('g', rssi=0)]:
+            self.assertIsNone(RateEngine.get_rate(intf))
+            IntfWireless.configWLink(intf, 10)
+            self.assertEqual(intf.get_bw(10), intf.tc['bw'])
+
+    def testAssociate(self):
+        """tc is set up from the RSSI of the AP associated to"""
+        intf = FakeStaIntf()
+        ap1, ap2 = FakeAP(-50), FakeAP(-85)
+        intf.configureWirelessLink(ap1)
+        self.assertEqual(-50, intf.rssi)
+        self.assertEqual(RateEngine.get_rate(intf)[0], intf.tc['bw'])
+        intf.configureWirelessLink(ap2)  # handover
+        self.assertEqual(RateEngine.get_table('g').get(-85)[0],
+                         intf.tc['bw'])
+
+
+class FakeAP(object):
+
+    def __init__(self, rssi):
+        self.rssi, self.range = rssi, 100
+        self.node = self
+        self.associatedStations = []
+
+
+class FakeStaIntf(FakeTCIntf):
+    configureWirelessLink = IntfWireless.configureWirelessLink
+    configWLink = IntfWireless.configWLink
+
+    def __init__(self):
+        FakeTCIntf.__init__(self, rssi=0)
+        self.node = self
+        self.associatedTo = None
+
+    def get_distance_to(self, node):
+        return 10
+
+    def update_client_params(self, ap_intf):
+        pass
+
+    def associate_infra(self, ap_intf):
+        self.associatedTo = ap_intf
+
+    def get_rssi(self, ap_intf, dist):
+        return ap_intf.rssi
+
+
+if __name__ == "__main__":
+    unittest.main()
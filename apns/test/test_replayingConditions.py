@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test the heap scheduled replay of bandwidth and network conditions."""
+
+import unittest
+
+from apns.mobility import Mobility
+from apns.replaying import ReplayingTc, Samples
+
+
+class FakeThread(object):
+    _keep_alive = True
+
+
+class FakeIntf(object):
+
+    def __init__(self, calls, name):
+        self.calls, self.name = calls, name
+        self.associatedTo = True
+
+    def config_tc(self, **kwargs):
+        self.calls.append((self.name, kwargs))
+
+
+class FakeStation(object):
+
+    def __init__(self, calls, name, time, bw):
+        self.name, self.time, self.throughput = name, time, bw
+        self.wintfs = {0: FakeIntf(calls, name)}
+
+
+class FakeNet(object):
+
+    def __init__(self, stations):
+        self.stations = stations
+
+
+class testReplayingTc(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = Mobility.thread_, Mobility.stepped, Mobility.clock
+        Mobility.thread_, Mobility.stepped = FakeThread(), True
+        Mobility.clock = None
+
+    def tearDown(self):
+        Mobility.thread_, Mobility.stepped, Mobility.clock = self.saved
+
+    def testSamples(self):
+        samples = Samples([1, 2, 3], [4, 5])
+        self.assertEqual(2, len(samples))
+        self.assertEqual((2, 5), samples[1])
+
+    def testCoalesce(self):
+        """Samples due in the same tick become a single tc change"""
+        calls = []
+        sta1 = FakeStation(calls, 'sta1', [0, 0.001, 0.004, 1], [1, 2, 3, 4])
+        sta2 = FakeStation(calls, 'sta2', [0.5], [10])
+        stations = [sta1, sta2]
+        replay = ReplayingTc()
+        replay.net = FakeNet(stations)
+        replay.replay('test', ['throughput'],
+                      lambda sta, bw: sta.wintfs[0].config_tc(bw=bw))
+        self.assertEqual([('sta1', {'bw': 1}), ('sta1', {'bw': 3}),
+                          ('sta2', {'bw': 10}), ('sta1', {'bw': 4})], calls)
+        self.assertEqual((5, 4), (replay.events, replay.updates))
+        # the last sample is applied and nothing is removed
+        self.assertEqual([sta1, sta2], stations)
+        self.assertEqual(4, len(sta1.time))
+        self.assertIsNone(Mobility.clock)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test the RSSI -> distance lookup tables of ReplayingRSSI."""
+
+import unittest
+
+from apns.replaying import ReplayingRSSI
+
+
+class FakeIntf(object):
+
+    def __init__(self, node, txpower=14, antennaGain=5, freq=2.412):
+        self.node, self.txpower, self.antennaGain = node, txpower, antennaGain
+        self.freq = freq
+        self.associatedTo = None
+        self.rssi = 0
+        self.links = []
+
+    def configWLink(self, dist):
+        self.links.append(dist)
+
+
+class FakeNode(object):
+
+    def __init__(self, position=(0, 0, 0)):
+        self.position = position
+        self.wintfs = {0: FakeIntf(self)}
+
+
+class FakeNet(object):
+    draw = False
+
+
+class testReplayingRSSI(unittest.TestCase):
+
+    def setUp(self):
+        self.replay = ReplayingRSSI.__new__(ReplayingRSSI)
+        self.replay.net, self.replay.tables = FakeNet(), {}
+        self.sta, self.ap = FakeNode(), FakeNode((50, 50, 0))
+        self.sta.wintfs[0].associatedTo = self.ap.wintfs[0]
+
+    def testTables(self):
+        """Interpolated distances match the closed form models"""
+        pT, gT, gR = 14, 5, 5
+        for ppm, n in (('friis', 32), ('logDistance', 32), ('ITU', 32)):
+            model = getattr(self.replay, ppm)
+            for rssi in (-90, -72.35, -50, -20.5, 10):
+                expected = model(self.sta, self.ap, pT, gT, gR, rssi, n)
+                got = self.replay.get_table(self.sta, self.ap, ppm, n).get(rssi)
+                self.assertAlmostEqual(1, got / expected, places=9)
+        self.assertEqual(3, len(self.replay.tables))
+        self.replay.calc_dist(self.sta, self.ap, -60, 'friis', 32)
+        self.assertEqual(3, len(self.replay.tables))  # reused
+
+    def testSetRssi(self):
+        """Only the associated AP link is updated"""
+        self.replay.ppm, self.replay.n = 'friis', 32
+        self.replay.ang = {self.sta: 0}
+        self.replay.set_rssi(self.sta, -60)
+        dist = self.replay.calc_dist(self.sta, self.ap, -60, 'friis', 32)
+        self.assertEqual(-60, self.sta.wintfs[0].rssi)
+        self.assertEqual([dist], self.sta.wintfs[0].links)
+        self.assertEqual((50 + dist, 50, 0), self.sta.position)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test the spatially correlated shadowing map."""
+
+import unittest
+
+import numpy as np
+
+from apns.node import Node_WiFi
+from apns.propagationModels import PropagationModel as ppm
+from apns.randomStreams import RandomStreams
+from apns.shadowingMap import ShadowingMap
+from apns.wmediumdConnector import w_server, WmediumdIntfRef
+from apns.wmediumdServer import WmediumdServer
+
+from fakeNodes import FakeNode, FakeIntf
+
+
+class testShadowingMap(unittest.TestCase):
+
+    def setUp(self):
+        RandomStreams.set_seed(5)
+
+    def tearDown(self):
+        ppm.shadowing_map = None
+
+    def testSeeded(self):
+        grid = ShadowingMap((50, 50)).get_grid()
+        RandomStreams.set_seed(5)
+        np.testing.assert_array_equal(grid, ShadowingMap((50, 50)).get_grid())
+        RandomStreams.set_seed(6)
+        self.assertFalse((grid == ShadowingMap((50, 50)).get_grid()).all())
+
+    def testCorrelation(self):
+        """Neighbours are alike, points decorrelation distances apart not"""
+        grid = ShadowingMap((400, 400), decorrelation=5, sigma=4).get_grid()
+        self.assertAlmostEqual(4, grid.std(), delta=0.4)
+        near = np.corrcoef(grid[:, :-1].ravel(), grid[:, 1:].ravel())[0, 1]
+        far = np.corrcoef(grid[:, :-25].ravel(), grid[:, 25:].ravel())[0, 1]
+        self.assertAlmostEqual(np.exp(-1 / 5.), near, delta=0.05)
+        self.assertLess(abs(far), 0.05)
+        # isotropic: 5 m apart diagonally as along an axis
+        diagonal = np.corrcoef(grid[:-3, :-4].ravel(),
+                               grid[3:, 4:].ravel())[0, 1]
+        self.assertAlmostEqual(np.exp(-1), diagonal, delta=0.05)
+
+    def testInterpolation(self):
+        shadowing = ShadowingMap((10, 10, 4), step=2)
+        grid = shadowing.get_grid()
+        self.assertEqual((6, 6, 3), grid.shape)
+        self.assertEqual(grid[1, 2, 1], shadowing.get((2, 4, 2)))
+        self.assertAlmostEqual((grid[1, 2, 1] + grid[2, 2, 1]) / 2,
+                               shadowing.get((3, 4, 2)))
+        self.assertEqual(grid[5, 5, 2], shadowing.get((50, 50, 50)))
+
+    def testPropagation(self):
+        """Range and association read the map at the node position"""
+        ppm.shadowing_map = ShadowingMap((20, 20), sigma=3)
+        intf = FakeIntf(FakeNode('sta1', (4.5, 7.25, 0)))
+        expected = ppm.shadowing_map.get(intf.node.position)
+        self.assertEqual(expected, ppm.get_gauss(intf, 0, 3))
+        self.assertEqual(expected, ppm.get_gauss(intf, 0, 3))
+        self.assertEqual(round(expected, 2), ppm.get_gRandom(intf))
+
+    def testWmediumd(self):
+        """The shadowing at a new position is sent along with it"""
+        server = WmediumdServer().start()
+        self.addCleanup(server.stop)
+        w_server.connect(server.path)
+        self.addCleanup(w_server.disconnect)
+        mac = '02:00:00:00:00:01'
+        w_server.register_interface(mac)
+        node = FakeWmediumdNode(mac)
+        node.set_pos_wmediumd([4.5, 7.25, 0])
+        self.assertNotIn('gaussian_random', server.counts)
+        ppm.shadowing_map = ShadowingMap((20, 20), sigma=3)
+        node.set_pos_wmediumd([6.5, 7.25, 0])
+        expected = round(ppm.shadowing_map.get([6.5, 7.25, 0]), 2)
+        self.assertAlmostEqual(expected, server.get('gaussian_random',
+                                                    mac)[0], places=5)
+
+
+class FakeWmediumdNode(object):
+    set_pos_wmediumd = Node_WiFi.set_pos_wmediumd
+
+    def __init__(self, mac):
+        self.lastpos = None
+        self.wmIfaces = [WmediumdIntfRef('sta1', 'sta1-wlan0', mac)]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test the grid index used by Mobility.config_links against the
+   brute-force pass over every AP."""
+
+import unittest
+from random import Random
+
+from apns.mobility import Mobility
+from apns.spatialIndex import SpatialGrid
+
+from fakeNodes import FakeNode, FakeIntf
+
+
+class RecordingMobility(Mobility):
+    """Records the decisions instead of touching real interfaces"""
+
+    def __init__(self, aps):
+        self.aps = aps
+        self.log = []
+
+    def ap_out_of_range(self, intf, ap_intf):
+        if ap_intf == intf.associatedTo:
+            self.log.append(('disconnect', intf.node.name, ap_intf.node.name))
+            intf.associatedTo = None
+            intf.rssi = 0
+        elif not intf.associatedTo:
+            intf.rssi = 0
+
+    def set_handover(self, intf, aps):
+        self.log.append(('in', intf.node.name, [ap.name for ap in aps],
+                         intf.rssi))
+
+
+def build(seed, n_aps=30, n_stas=60, size=500):
+    rand = Random(seed)
+    aps, stas = [], []
+    for i in range(n_aps):
+        ap = FakeNode('ap%d' % i, [rand.uniform(0, size),
+                                   rand.uniform(0, size), 0])
+        FakeIntf(ap, rand.choice([20, 50, 80, 120.5]), rssi=-50)
+        aps.append(ap)
+    for i in range(n_stas):
+        sta = FakeNode('sta%d' % i, [rand.uniform(0, size),
+                                     rand.uniform(0, size),
+                                     rand.uniform(0, 3)])
+        intf = FakeIntf(sta, rssi=-50)
+        if i % 3 == 0:
+            intf.associatedTo = rand.choice(aps).wintfs[0]
+        stas.append(sta)
+    return aps, stas
+
+
+class testSpatialGrid(unittest.TestCase):
+
+    def run_both(self, seed, cell_size=None, steps=5):
+        aps, stas = build(seed)
+        brute, indexed = RecordingMobility(aps), RecordingMobility(aps)
+        b_stas = [(sta, sta.wintfs[0].associatedTo) for sta in stas]
+        grid = SpatialGrid(cell_size)
+        rand = Random(seed + 1)
+        for _ in range(steps):
+            grid.sync(aps)
+            for sta, assoc in b_stas:
+                intf = sta.wintfs[0]
+                intf.associatedTo, intf.rssi = assoc, -50
+                brute.config_links_brute_force(intf)
+                intf.associatedTo, intf.rssi = assoc, -50
+                indexed.config_links_indexed(intf, grid)
+            self.assertEqual(brute.log, indexed.log)
+            for node in aps + stas:
+                node.position[0] += rand.uniform(-40, 40)
+                node.position[1] += rand.uniform(-40, 40)
+            aps[0].wintfs[0].range = rand.choice([10, 200])
+
+    def testDefaultCellSize(self):
+        """Largest range as cell size"""
+        for seed in range(5):
+            self.run_both(seed)
+
+    def testSmallCells(self):
+        """Interfaces spanning many cells"""
+        self.run_both(7, cell_size=7)
+
+    def testLargeCells(self):
+        """Every AP in one cell"""
+        self.run_both(9, cell_size=5000)
+
+    def testBoundary(self):
+        """A station exactly at range distance is in range"""
+        ap = FakeNode('ap', [0, 0, 0])
+        FakeIntf(ap, 10, rssi=-50)
+        sta = FakeNode('sta', [10, 0, 0])
+        grid = SpatialGrid(4)
+        grid.sync([ap])
+        self.assertEqual([(ap, ap.wintfs[0])], grid.candidates(sta))
+
+    def testApsChanged(self):
+        """Removed APs are dropped from the grid"""
+        aps, _ = build(3, n_stas=0)
+        grid = SpatialGrid()
+        grid.sync(aps)
+        grid.sync(aps[:10])
+        self.assertEqual(10, len(grid))
+        self.assertEqual(set(aps[i].wintfs[0] for i in range(10)),
+                         set(grid.entries))
+
+
+if __name__ == "__main__":
+    unittest.main()
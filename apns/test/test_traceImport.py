@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test the streaming ns-2, BonnMotion and SUMO trace importers."""
+
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from apns.mobilityTrace import MobilityTrace
+from apns.traceImport import Ns2Trace, BonnMotionTrace, SumoTrace, \
+    import_trace, iter_lines
+
+
+NS2 = '''$node_(0) set X_ 0.0
+$node_(0) set Y_ 0.0
+$node_(0) set Z_ 0.0
+$node_(1) set X_ 50.0
+$node_(1) set Y_ 50.0
+$node_(1) set Z_ 0.0
+$god_ set-dist 0 1 1
+$ns_ at 1.0 "$node_(0) setdest 10.0 0.0 2.0"
+$ns_ at 8.0 "$node_(0) setdest 10.0 4.0 1.0"
+'''
+
+SUMO = '''<?xml version="1.0" encoding="UTF-8"?>
+<fcd-export>
+    <timestep time="0.00">
+        <vehicle id="veh0" x="0.00" y="0.00" angle="90" speed="0"/>
+    </timestep>
+    <timestep time="2.00">
+        <vehicle id="veh0" x="4.00" y="0.00" angle="90" speed="2"/>
+        <vehicle id="veh1" x="9.00" y="9.00" z="1.50" angle="0" speed="0"/>
+    </timestep>
+</fcd-export>
+'''
+
+
+class testTraceImport(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(path, 'wt') as f:
+            f.write(data)
+        return path
+
+    def samples(self, importer):
+        samples = {}
+        importer.samples(lambda name, t, pos:
+                         samples.setdefault(name, []).append((t, pos)))
+        return samples
+
+    def testNs2(self):
+        path = self.write('scen.tcl', NS2)
+        samples = self.samples(Ns2Trace(path, step=1.))
+        self.assertEqual([(0., (50., 50., 0.))], samples['sta2'])
+        # still until 1s, 2m/s to x=10 (6s), then 1m/s up to y=4
+        self.assertEqual([(0., (0., 0., 0.)), (2., (2., 0., 0.)),
+                          (3., (4., 0., 0.)), (4., (6., 0., 0.)),
+                          (5., (8., 0., 0.)), (6., (10., 0., 0.)),
+                          (9., (10., 1., 0.)), (10., (10., 2., 0.)),
+                          (11., (10., 3., 0.)), (12., (10., 4., 0.))],
+                         samples['sta1'])
+
+    def testBonnMotion(self):
+        path = self.write('scen.movements.gz',
+                          '0.0 0.0 0.0 4.0 8.0 0.0\n'
+                          '0.0 5.0 5.0 2.0 5.0 5.0 3.0 5.0 6.0\n')
+        samples = self.samples(BonnMotionTrace(path, step=2.))
+        self.assertEqual([(0., (0., 0., 0.)), (2., (4., 0., 0.)),
+                          (4., (8., 0., 0.))], samples['sta1'])
+        self.assertEqual([(0., (5., 5., 0.)), (3., (5., 6., 0.))],
+                         samples['sta2'])
+
+    def testSumo(self):
+        path = self.write('fcd.xml', SUMO)
+        samples = self.samples(SumoTrace(path, step=0.5,
+                                         names={'veh0': 'car1'}))
+        self.assertEqual([0.0, 0.5, 1.0, 1.5, 2.0],
+                         [t for t, _ in samples['car1']])
+        self.assertEqual((3., 0., 0.), samples['car1'][3][1])
+        self.assertNotIn('veh1', samples)  # not in names
+
+    def testImport(self):
+        src = self.write('fcd.xml', SUMO)
+        dst = os.path.join(self.dir, 'fcd.trace')
+        self.assertEqual(4, import_trace(src, dst, step=1.))
+        trace = MobilityTrace(dst)
+        self.assertEqual(['veh0', 'veh1'], sorted(trace.names))
+        times, xyz = trace.get('veh1')
+        self.assertEqual([2.], times.tolist())
+        self.assertEqual([[9., 9., 1.5]], xyz.tolist())
+
+    def testTokens(self):
+        """Tokens split across read blocks are put back together"""
+        f = io.StringIO('12.5 3.25\n7 88.125 9\n')
+        self.assertEqual(['12.5', '3.25', None, '7', '88.125', '9', None],
+                         list(iter_lines(f, size=3))[:7])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test the interpolated trajectories used by tracked mobility."""
+
+import unittest
+
+import numpy as np
+
+from apns.mobility import Tracked, Trajectory
+
+
+class FakeNode(object):
+
+    def __init__(self, coord=None, start=0, end=10):
+        self.coord = coord
+        self.startTime = self.time = start
+        self.endTime = end
+
+
+class testTrajectory(unittest.TestCase):
+
+    def setUp(self):
+        self.tracked = Tracked.__new__(Tracked)
+
+    def testWaypoints(self):
+        """Waypoints are reached in order, at the end of the run"""
+        node = FakeNode(['40.0,30.0,0.0', '31.0,10.0,0.0', '31.0,30.0,0.0'],
+                        start=2, end=22)
+        path = self.tracked.set_coordinates(node)
+        self.assertEqual(np.float32, path.points.dtype)
+        self.assertEqual(3, len(path))
+        self.assertEqual(20, path.duration)
+        self.assertEqual((40.0, 30.0, 0.0), path.at(0))
+        self.assertEqual((31.0, 30.0, 0.0), path.at(20))
+        self.assertEqual((31.0, 30.0, 0.0), path.at(100))
+        leg = path.times[1]
+        self.assertEqual((31.0, 10.0, 0.0), path.at(leg))
+        self.assertEqual((35.5, 20.0, 0.0), path.at(leg / 2))
+
+    def testLegDuration(self):
+        """Each leg lasts the smallest share of displacement it covers"""
+        node = FakeNode(['0,0,0', '10,10,0', '20,0,0', '20,30,0'])
+        path = self.tracked.set_coordinates(node)
+        # x: 10/20 and 10/20, y: 10/50, 10/50, 30/50
+        legs = np.diff(path.times)
+        self.assertAlmostEqual(legs[0], legs[1])
+        self.assertAlmostEqual(legs[2] / legs[0], 3)
+
+    def testSample(self):
+        """Vectorized sampling agrees with at()"""
+        node = FakeNode(['0,0,0', '10,10,0', '20,0,0', '20,30,5'])
+        path = self.tracked.set_coordinates(node)
+        ts = np.arange(0, 10, 0.1)
+        pos = path.sample(ts)
+        self.assertEqual((100, 3), pos.shape)
+        for t, p in zip(ts, pos):
+            self.assertEqual(path.at(t), tuple(round(v, 2) for v in p))
+
+    def testTrackedSteps(self):
+        """initPos/finPos movement keeps its 0.1s steps"""
+        node = FakeNode(start=0, end=5)
+        node.position, node.moveFac = (1.0, 2.0, 0.0), (0.5, -0.25, 0.0)
+        path = self.tracked.create_coord(node, tracked=True)
+        pos = node.position
+        for step in range(50):
+            pos = tuple(round(p, 2) + round(m, 2)
+                        for p, m in zip(pos, node.moveFac))
+            self.assertEqual(pos, path.at(step * 0.1))
+
+    def testEmpty(self):
+        path = Trajectory([0], [[1, 2, 3]])
+        self.assertEqual((1, 2, 3), path.at(5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test the batched wmediumd updates against a fake server."""
+
+import socket
+import struct
+import threading
+import unittest
+
+from apns.wmediumdConnector import w_server, w_cst, w_pos, w_txpower, \
+    WmediumdIntfRef, DynamicIntfRef, WmediumdException
+
+
+POS = struct.Struct('!B6sfff')
+TXPOWER = struct.Struct('!B6si')
+ADD = struct.Struct('!B6s')
+
+
+class FakeServer(threading.Thread):
+    """Answers pos, txpower and add requests, reading as much as it can
+    before writing the responses back"""
+
+    def __init__(self, sock, code=w_cst.WUPDATE_SUCCESS):
+        threading.Thread.__init__(self, daemon=True)
+        self.sock = sock
+        self.code = code
+        self.received = []
+        self.answer = True
+        self.offset = 1  # response type - request type
+
+    def run(self):
+        data = b''
+        while True:
+            try:
+                chunk = self.sock.recv(65536)
+            except OSError:  # closed by the test
+                return
+            if not chunk:
+                return
+            data += chunk
+            if not self.answer:
+                continue
+            out = []
+            while data:
+                msgtype = data[0]
+                req = {w_cst.WSERVER_POS_UPDATE_REQUEST_TYPE: POS,
+                       w_cst.WSERVER_TXPOWER_UPDATE_REQUEST_TYPE: TXPOWER,
+                       w_cst.WSERVER_ADD_REQUEST_TYPE: ADD}[msgtype]
+                if len(data) < req.size:
+                    break
+                raw, data = data[:req.size], data[req.size:]
+                self.received.append(req.unpack(raw))
+                if req is ADD:
+                    out.append(struct.pack('!B', msgtype + self.offset) +
+                               raw + struct.pack('!iB', 7, self.code))
+                else:
+                    out.append(struct.pack('!B', msgtype + self.offset) +
+                               raw + struct.pack('!B', self.code))
+            self.sock.sendall(b''.join(out))
+
+
+class testWmediumdBatch(unittest.TestCase):
+
+    def start(self, code=w_cst.WUPDATE_SUCCESS, writer=False):
+        client, server = socket.socketpair()
+        client.settimeout(5)
+        w_server.sock, w_server.connected = client, True
+        w_server.last_sent.clear()
+        self.server = FakeServer(server, code)
+        self.server.start()
+        self.addCleanup(server.close)
+        self.addCleanup(w_server.disconnect)
+        if writer:
+            w_server.start_writer()
+
+    def intf(self, i):
+        return WmediumdIntfRef('sta%d' % i, 'sta%d-wlan0' % i,
+                               '02:00:00:00:00:%02x' % i)
+
+    def testBatch(self):
+        self.start()
+        with w_server.batch_updates():
+            for i in range(1, 51):
+                w_server.update_pos(w_pos(self.intf(i), [i, 2., 0.]))
+            w_server.update_txpower(w_txpower(self.intf(1), 14))
+            self.assertEqual([], self.server.received)  # nothing sent yet
+        self.assertEqual(51, len(self.server.received))
+        self.assertEqual(1., self.server.received[0][2])
+        self.assertEqual(14, self.server.received[-1][2])
+        self.assertIsNone(w_server.get_batch())
+
+    def testErrors(self):
+        self.start(code=w_cst.WUPDATE_INTF_NOTFOUND)
+        with self.assertRaises(WmediumdException):
+            with w_server.batch_updates():
+                w_server.update_pos(w_pos(self.intf(1), [1., 2., 0.]))
+        self.assertIsNone(w_server.get_batch())
+
+    def testRaised(self):
+        """Updates queued before a block raises are still sent"""
+        self.start()
+        with self.assertRaises(ValueError):
+            with w_server.batch_updates():
+                w_server.update_pos(w_pos(self.intf(1), [1., 2., 0.]))
+                raise ValueError
+        self.assertEqual(1, len(self.server.received))
+        self.assertIsNone(w_server.get_batch())
+
+    def testAddFlushes(self):
+        """Requests that are not queued keep their place in the order"""
+        self.start()
+        with w_server.batch_updates():
+            w_server.update_pos(w_pos(self.intf(1), [1., 2., 0.]))
+            self.assertEqual((w_cst.WUPDATE_SUCCESS, 7),
+                             w_server.send_add('02:00:00:00:00:09'))
+            self.assertEqual(2, len(self.server.received))
+            w_server.update_pos(w_pos(self.intf(1), [3., 2., 0.]))
+        self.assertEqual([w_cst.WSERVER_POS_UPDATE_REQUEST_TYPE,
+                          w_cst.WSERVER_ADD_REQUEST_TYPE,
+                          w_cst.WSERVER_POS_UPDATE_REQUEST_TYPE],
+                         [req[0] for req in self.server.received])
+
+    def testUnbatched(self):
+        """Packed into the same buffer, each update is sent as packed"""
+        self.start()
+        w_server.update_pos(w_pos(self.intf(1), [1., 2., 0.]))
+        buffers = [id(buffer) for buffer in w_server.batch.buffers.values()]
+        w_server.update_pos(w_pos(self.intf(2), [3., 4., 0.]))
+        self.assertEqual(buffers, [id(buffer) for buffer
+                                   in w_server.batch.buffers.values()])
+        self.assertEqual([(1., 2.), (3., 4.)],
+                         [req[2:4] for req in self.server.received])
+
+    def testMaxBatch(self):
+        self.start()
+        max_batch = w_server.max_batch
+        w_server.max_batch = 10
+        try:
+            with w_server.batch_updates():
+                for i in range(25):
+                    w_server.update_pos(w_pos(self.intf(1), [i, 0., 0.]))
+                self.assertEqual(20, len(self.server.received))
+        finally:
+            w_server.max_batch = max_batch
+        self.assertEqual(25, len(self.server.received))
+
+    def testThreads(self):
+        """Threads updating at once through the writer thread: the
+        updates of every interface arrive in order"""
+        self.start(writer=True)
+
+        def move(i):
+            for x in range(100):
+                if x % 10:
+                    w_server.update_pos(w_pos(self.intf(i), [x, 0., 0.]))
+                else:
+                    with w_server.batch_updates(wait=False):
+                        w_server.update_pos(w_pos(self.intf(i), [x, 0., 0.]))
+
+        threads = [threading.Thread(target=move, args=(i,))
+                   for i in range(1, 9)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        w_server.stop_writer()  # once everything queued is sent
+        self.assertEqual(800, len(self.server.received))
+        for i in range(1, 9):
+            mac = bytes.fromhex('0200000000%02x' % i)
+            self.assertEqual(list(range(100)),
+                             [int(req[2]) for req in self.server.received
+                              if req[1] == mac])
+
+    def testFireAndForget(self):
+        self.start(code=w_cst.WUPDATE_INTF_NOTFOUND, writer=True)
+        with w_server.batch_updates(wait=False):
+            w_server.update_pos(w_pos(self.intf(1), [1., 2., 0.]))
+            future = w_server.flush_batch()
+        # nothing raised, the error is logged
+        self.assertEqual(w_cst.WUPDATE_INTF_NOTFOUND,
+                         future.result(timeout=5)[0][-1])
+
+    def testBroken(self):
+        """After a response of the wrong type the stream can not be read
+        in step anymore: the connection is lost"""
+        self.start(writer=True)
+        self.server.offset = 2
+        with self.assertRaises(WmediumdException):
+            w_server.send_add('02:00:00:00:00:09')
+        self.assertFalse(w_server.connected)
+        with self.assertRaises(WmediumdException):
+            w_server.update_pos(w_pos(self.intf(1), [1., 2., 0.]))
+        self.assertEqual(1, len(self.server.received))
+
+    def testStopTimeout(self):
+        """Stopping does not hang when wmediumd stops answering"""
+        self.start(writer=True)
+        self.server.answer = False
+        timeout, w_server.writer_timeout = w_server.writer_timeout, 0.2
+        try:
+            with w_server.batch_updates(wait=False):
+                w_server.update_pos(w_pos(self.intf(1), [1., 2., 0.]))
+                future = w_server.flush_batch()
+            w_server.stop_writer()
+        finally:
+            w_server.writer_timeout = timeout
+        self.assertIsInstance(future.exception(timeout=1), Exception)
+
+    def testBufferGrows(self):
+        self.start()
+        with w_server.batch_updates():
+            for i in range(300):
+                w_server.update_pos(w_pos(self.intf(1), [i, 0., 0.]))
+        self.assertEqual(list(range(300)),
+                         [int(req[2]) for req in self.server.received])
+
+    def testSuppressed(self):
+        """Updates within their threshold of the last one sent are not
+        sent, drifting by small steps still sends once past it"""
+        self.start()
+        w_server.counters.clear()
+        for i in range(100):
+            w_server.update_pos(w_pos(self.intf(1), [i * 0.003, 0., 0.]))
+        w_server.update_txpower(w_txpower(self.intf(1), 14))
+        w_server.update_txpower(w_txpower(self.intf(1), 14))
+        w_server.update_txpower(w_txpower(self.intf(2), 14))
+        self.assertEqual([round(0.012 * k, 3) for k in range(25)],
+                         [round(req[2], 3) for req in self.server.received
+                          if req[0] == w_cst.WSERVER_POS_UPDATE_REQUEST_TYPE])
+        self.assertEqual({'sent': 25, 'suppressed': 75},
+                         w_server.counters['pos'])
+        self.assertEqual({'sent': 2, 'suppressed': 1},
+                         w_server.counters['txpower'])
+        thresholds = dict(w_server.thresholds)
+        w_server.thresholds['pos'] = -1
+        try:
+            w_server.update_pos(w_pos(self.intf(1), [0.288, 0., 0.]))
+        finally:
+            w_server.thresholds.update(thresholds)
+        self.assertEqual(26, w_server.counters['pos']['sent'])
+
+    def testFailedNotKept(self):
+        """Updates wmediumd did not acknowledge are not suppressed after"""
+        self.start(code=w_cst.WUPDATE_INTF_NOTFOUND, writer=True)
+        intf = self.intf(1)
+        with self.assertRaises(WmediumdException):
+            w_server.update_pos(w_pos(intf, [1., 2., 0.]))
+        with w_server.batch_updates(wait=False):
+            w_server.update_pos(w_pos(intf, [1., 2., 0.]))
+            future = w_server.flush_batch()
+        future.result(timeout=5)
+        self.assertNotIn(('pos', intf.get_packed_mac()), w_server.last_sent)
+        self.server.code = w_cst.WUPDATE_SUCCESS
+        for _ in range(2):
+            w_server.update_pos(w_pos(intf, [1., 2., 0.]))
+        self.assertEqual(3, len(self.server.received))
+        self.assertEqual((1., 2., 0.),
+                         w_server.last_sent[('pos', intf.get_packed_mac())])
+
+
+class FakeIntf(object):
+
+    def __init__(self, name, mac):
+        self.name, self.mac = name, mac
+
+
+class FakeStation(object):
+
+    def __init__(self):
+        self.name = 'sta1'
+        self.wintfs = {0: FakeIntf('sta1-wlan0', '02:00:00:00:00:01'),
+                       1: FakeIntf('sta1-wlan1', '02:00:00:00:01:01')}
+
+
+class testIntfRef(unittest.TestCase):
+
+    def testCache(self):
+        """The interface and the packed MAC are kept until reset()"""
+        sta = FakeStation()
+        ref = DynamicIntfRef(sta, intf='sta1-wlan1')
+        self.assertEqual(bytes.fromhex('020000000101'), ref.get_packed_mac())
+        ref.sta_id = 3
+        sta.wintfs = {}  # not looked up again
+        self.assertEqual(bytes.fromhex('020000000101'), ref.get_packed_mac())
+        self.assertEqual('02:00:00:00:01:01', ref.get_mac())
+
+    def testRenamed(self):
+        """A renamed interface keeps its station index"""
+        sta = FakeStation()
+        ref = DynamicIntfRef(sta, intf='sta1-wlan1')
+        ref.get_packed_mac()
+        ref.sta_id = 3
+        sta.wintfs[1].name = 'sta1-mp1'
+        ref.reset(intf='sta1-mp1')
+        self.assertEqual(3, ref.sta_id)
+        self.assertEqual('sta1.sta1-mp1', ref.id())
+        self.assertEqual('02:00:00:00:01:01', ref.get_mac())
+
+    def testMacChanged(self):
+        """A new MAC address is packed again, the interface is registered
+        again"""
+        sta = FakeStation()
+        ref = DynamicIntfRef(sta, intf='sta1-wlan1')
+        ref.get_packed_mac()
+        ref.sta_id = 3
+        sta.wintfs[1].mac = '02:00:00:00:02:01'
+        ref.reset()
+        self.assertIsNone(ref.sta_id)
+        self.assertEqual(bytes.fromhex('020000000201'), ref.get_packed_mac())
+
+    def testReplaced(self):
+        """Another link class replacing the interface takes the reference
+        over"""
+        sta = FakeStation()
+        ref = DynamicIntfRef(sta, intf='sta1-wlan1')
+        self.assertEqual('02:00:00:00:01:01', ref.get_mac())
+        sta.wintfs[1] = FakeIntf('sta1-wlan1', '02:00:00:00:03:01')
+        ref.reset(intf='sta1-wlan1')
+        self.assertIs(sta.wintfs[1], ref.get_wlan_intf())
+        self.assertEqual(bytes.fromhex('020000000301'), ref.get_packed_mac())
+
+if __name__ == "__main__":
+    unittest.main()
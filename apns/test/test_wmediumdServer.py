@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test the connector against the pure-Python wmediumd stand-in."""
+
+import os
+import re
+import socket
+import time
+import unittest
+from unittest import mock
+
+from apns.link import wmediumd
+from apns.wmediumdConnector import w_server, w_cst, w_pos, w_txpower, \
+    w_gain, w_height, w_medium, WmediumdGRandom, SNRLink, ERRPROBLink, \
+    WmediumdSPECPROBLink, WmediumdIntfRef, WmediumdException, WStarter, \
+    set_interference, wmediumd_mode
+from apns.wmediumdServer import WmediumdServer
+
+from fakeNodes import wmediumd_node
+
+
+class testWmediumdServer(unittest.TestCase):
+
+    def start(self, **kwargs):
+        self.server = WmediumdServer(**kwargs).start()
+        self.addCleanup(self.server.stop)
+        # as w_server.connect, without waiting for wmediumd to come up
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(5)
+        sock.connect(self.server.path)
+        w_server.sock, w_server.connected = sock, True
+        w_server.last_sent.clear()
+        self.addCleanup(w_server.disconnect)
+        self.intfs = [WmediumdIntfRef('sta%d' % i, 'sta%d-wlan0' % i,
+                                      '02:00:00:00:00:%02x' % i)
+                      for i in range(1, 4)]
+        for intf in self.intfs:
+            intf.sta_id = w_server.register_interface(intf.get_mac())
+
+    def testUpdates(self):
+        self.start()
+        sta1, sta2, _ = self.intfs
+        self.assertEqual([0, 1, 2], [intf.sta_id for intf in self.intfs])
+        self.assertEqual((w_cst.WUPDATE_INTF_DUPLICATE, -1),
+                         w_server.send_add(sta1.get_mac()))
+        w_server.update_pos(w_pos(sta1, [1., 2., 3.]))
+        w_server.update_txpower(w_txpower(sta1, 14))
+        w_server.update_gain(w_gain(sta1, 5))
+        w_server.update_height(w_height(sta1, 2))
+        w_server.update_medium(w_medium(sta1, 1))
+        w_server.update_gaussian_random(WmediumdGRandom(sta1, 0.5))
+        w_server.update_link_snr(SNRLink(sta1, sta2, 20))
+        w_server.update_link_errprob(ERRPROBLink(sta1, sta2, 0.5))
+        w_server.update_link_specprob(
+            WmediumdSPECPROBLink(sta1, sta2, [[0.1] * 12] * 12))
+        mac = sta1.get_mac()
+        self.assertEqual((1., 2., 3.), self.server.get('pos', mac))
+        self.assertEqual((14,), self.server.get('txpower', mac))
+        self.assertEqual((5,), self.server.get('gain', mac))
+        self.assertEqual((2,), self.server.get('height', mac))
+        self.assertEqual((1,), self.server.get('medium', mac))
+        self.assertEqual((0.5,), self.server.get('gaussian_random', mac))
+        self.assertEqual(['add'] * 4 + ['pos', 'txpower', 'gain', 'height',
+                                        'medium', 'gaussian_random', 'snr',
+                                        'errprob', 'specprob'],
+                         [name for name, _ in self.server.received])
+
+    def testDelete(self):
+        self.start()
+        sta1, sta2, sta3 = self.intfs
+        w_server.unregister_interface(sta1.get_mac())
+        self.assertEqual(w_cst.WUPDATE_SUCCESS,
+                         w_server.send_del_by_id(sta2.sta_id))
+        with self.assertRaises(WmediumdException):
+            w_server.update_pos(w_pos(sta1, [1., 2., 3.]))
+        w_server.update_pos(w_pos(sta3, [1., 2., 3.]))
+        self.assertEqual({sta3.get_packed_mac()}, set(self.server.stations))
+
+    def testLatency(self):
+        """A batch waits for the latency once, not once per update"""
+        self.start(latency=0.05)
+        start = time.time()
+        with w_server.batch_updates():
+            for x in range(100):
+                for intf in self.intfs:
+                    w_server.update_pos(w_pos(intf, [x, 0., 0.]))
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(300, self.server.counts['pos'])
+        self.assertEqual((99., 0., 0.),
+                         self.server.get('pos', self.intfs[2].get_mac()))
+
+    def testWriter(self):
+        self.start()
+        w_server.start_writer()
+        with w_server.batch_updates(wait=False):
+            for intf in self.intfs:
+                w_server.update_txpower(w_txpower(intf, 20))
+        w_server.update_gain(w_gain(self.intfs[0], 3))
+        self.assertEqual(3, self.server.counts['txpower'])
+        self.assertEqual(1, self.server.counts['gain'])
+
+    def testBulkRegistration(self):
+        """Stations added at once are registered in one write, before
+        the updates queued after them"""
+        self.start(latency=0.05)
+        intfs = [WmediumdIntfRef('sta%d' % i, 'sta%d-wlan0' % i,
+                                 '02:00:00:00:01:%02x' % i)
+                 for i in range(200)]
+        start = time.time()
+        with w_server.batch_updates():
+            self.assertEqual([None] * 200, w_server.register_interfaces(intfs))
+            for intf in intfs:
+                w_server.update_txpower(w_txpower(intf, 20))
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(list(range(3, 203)), [intf.sta_id for intf in intfs])
+        self.assertEqual(203, self.server.counts['add'])
+        self.assertEqual(200, self.server.counts['txpower'])
+
+
+class Model(object):
+    model, exp = 'logDistance', 3.
+
+
+class testWmediumdConfig(unittest.TestCase):
+
+    def testConfig(self):
+        aps = [WmediumdIntfRef('ap%d' % i, 'ap%d-wlan1' % i,
+                               '02:00:00:00:0%d:00' % i) for i in (1, 2)]
+        path = WStarter.write_config(
+            aps, ppm=Model, pos=[w_pos(aps[0], [0, 0, 0]),
+                                 w_pos(aps[1], [10.25, 5, 1])],
+            txpowers=[w_txpower(ap, 20) for ap in aps], fading_cof=0,
+            noise_th=-91, isnodeaps=[1, 1], parameters=[])
+        self.addCleanup(os.unlink, path)
+        with open(path) as f:
+            config = f.read()
+        self.assertEqual('ifaces :\n{\n\tids = (\n\t\t"02:00:00:00:01:00",'
+                         '\n\t\t"02:00:00:00:02:00"\n\t);\n'
+                         '\tenable_interference = true;\n};\nmodel:\n{\n'
+                         '\ttype = "path_loss";\n\tpositions = ('
+                         '\n\t\t(0.0, 0.0, 0.0),\n\t\t(10.2, 5.0, 1.0)'
+                         '\n\t);\n\tfading_coefficient = 0;'
+                         '\n\tnoise_threshold = -91;\n\tisnodeaps = (1, 1);'
+                         '\n\ttx_powers = (20, 20);'
+                         '\n\tmodel_name = "log_distance";'
+                         '\n\tpath_loss_exp = 3.0;\n\txg = 0.0;\n};', config)
+        self.assertEqual([0, 1], [ap.sta_id for ap in aps])
+
+    def testLarge(self):
+        """Rows are formatted by chunks, the string is the same"""
+        n = 5000
+        pos = [w_pos(None, [i * 0.5, i % 7, 0]) for i in range(n)]
+        configstr = set_interference(
+            configstr='', ppm=Model, pos=pos,
+            txpowers=[w_txpower(None, 14)] * n, fading_cof=0,
+            noise_th=-91, isnodeaps=[0] * n).configstr
+        self.assertEqual(n, configstr.count('\n\t\t('))
+        self.assertIn('\n\t\t(2499.5, 1.0, 0.0)\n\t);', configstr)
+        self.assertIn('tx_powers = (' + ', '.join(['14'] * n) + ');',
+                      configstr)
+
+
+class WmediumdStart(object):
+    """Starts wmediumd as WStarter does, the stand-in serving it"""
+
+    def __init__(self, test):
+        server = WmediumdServer().start()
+        test.addCleanup(server.stop)
+        test.addCleanup(w_server.disconnect)
+        mode = wmediumd_mode.mode
+        wmediumd_mode.mode = w_cst.INTERFERENCE_MODE
+        test.addCleanup(setattr, wmediumd_mode, 'mode', mode)
+        connect = w_server.connect
+
+        def start():
+            self.load_config()  # wmediumd knows its configured interfaces
+            connect(server.path)
+        patches = [mock.patch('apns.wmediumdConnector.subprocess'),
+                   mock.patch.object(w_server, 'connect', start),
+                   mock.patch('apns.wmediumdConnector.sleep')]
+        self.subprocess = patches[0].start()
+        self.subprocess.call.return_value = 0  # wmediumd is installed
+        for patch in patches[1:]:
+            patch.start()
+        for patch in patches:
+            test.addCleanup(patch.stop)
+        self.server = server
+
+    def load_config(self):
+        """Adds the interfaces listed in the configuration to the stand-in"""
+        ids = self.get_config().split('ids = (')[1].split(');')[0]
+        for mac in re.findall('"([0-9a-f:]+)"', ids):
+            self.server.apply('add', (bytes.fromhex(mac.replace(':', '')),))
+
+    def get_config(self):
+        """:return: the configuration file wmediumd was started with"""
+        cmdline = self.subprocess.Popen.call_args[0][0]
+        with open(cmdline[cmdline.index('-c') + 1]) as f:
+            return f.read()
+
+
+class testWmediumdStart(unittest.TestCase):
+
+    def testWithAPs(self):
+        """wmediumd starts with the APs, stations are registered later"""
+        start = WmediumdStart(self)
+        ap1 = wmediumd_node('ap1', [10, 20, 0], ['02:00:00:00:0a:00',
+                                                '02:00:00:00:0a:01'])
+        ap2 = wmediumd_node('ap2', [30, 20, 0], ['02:00:00:00:0b:00'])
+        for intf in list(ap1.wintfs.values()) + list(ap2.wintfs.values()):
+            intf.sendIntfTowmediumd()  # not running yet: left for later
+        wmediumd(fading_cof=0, noise_th=-91, ppm=Model, aps=[ap1, ap2],
+                 stations=[], wlinks=[], mediums=[])
+        config = start.get_config()
+        self.assertIn('\t\t"02:00:00:00:0a:00",\n\t\t"02:00:00:00:0a:01",'
+                      '\n\t\t"02:00:00:00:0b:00"\n\t);', config)
+        self.assertIn('(10.0, 20.0, 0.0),\n\t\t(11.0, 20.0, 0.0),'
+                      '\n\t\t(30.0, 20.0, 0.0)', config)
+        self.assertIn('isnodeaps = (1, 1, 1);', config)
+        self.assertEqual([0, 1, 2], [intf.sta_id for intf in
+                                     ap1.wmIfaces + ap2.wmIfaces])
+        ap1.wintfs[0].sendIntfTowmediumd()  # listed, not registered again
+        sta1 = wmediumd_node('sta1', [0, 0, 0], ['02:00:00:00:00:01'])
+        sta1.wintfs[0].sendIntfTowmediumd()
+        self.assertEqual({'add': 1}, start.server.counts)
+        self.assertEqual(1, len(sta1.wmIfaces))
+        self.assertIsNotNone(sta1.wmIfaces[0].sta_id)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+"""Package: apns
+   Test that Wmnet starts wmediumd in the interference mode with the APs
+   in its configuration."""
+
+import unittest
+
+from apns.link import wmediumd
+from apns.net import Wmnet
+from apns.wmediumdConnector import interference
+
+from fakeNodes import wmediumd_node
+from test_wmediumdServer import WmediumdStart
+
+
+class FakeNet(object):
+    start_wmediumd = Wmnet.start_wmediumd
+    start_deferred_wmediumd = Wmnet.start_deferred_wmediumd
+
+    def __init__(self, aps, stations):
+        self.link, self.wmediumd_mode = wmediumd, interference
+        self.aps, self.stations = aps, stations
+        self.wlinks, self.initial_mediums = [], []
+        self.fading_cof, self.noise_th = 0, -91
+
+
+class testStartWmediumd(unittest.TestCase):
+
+    def testDeferred(self):
+        "the APs added before the stations are in the configuration"
+        start = WmediumdStart(self)
+        ap1 = wmediumd_node('ap1', [10, 20, 0], ['02:00:00:00:0a:00'])
+        net = FakeNet([ap1], [])
+        for intf in ap1.wintfs.values():
+            intf.sendIntfTowmediumd()
+        net.start_deferred_wmediumd()
+        self.assertIn('"02:00:00:00:0a:00"', start.get_config())
+        self.assertEqual(0, ap1.wmIfaces[0].sta_id)
+        self.assertEqual({'gain': 1}, start.server.counts)
+        net.start_deferred_wmediumd()  # running: not started again
+        self.assertEqual(1, start.subprocess.Popen.call_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,270 @@
+"""Streaming importers for ns-2 setdest, BonnMotion and SUMO FCD traces.
+
+Files are read incrementally (gzip compressed ones too) and the
+waypoints of every node are interpolated on the fly into positions
+every `step` seconds, which are written into a binary trace (see
+mobilityTrace) that ReplayingMobility replays. Only the last waypoint
+of each node is kept in memory, whatever the duration of the trace."""
+
+import gzip
+import math
+import re
+import xml.etree.ElementTree as ET
+
+from apns.log import debug
+from apns.mobilityTrace import TraceRecorder
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt')
+    return open(path, 'r')
+
+
+def get_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.xml'):
+        return 'sumo'
+    if name.endswith('.movements'):
+        return 'bonnmotion'
+    return 'ns2'
+
+
+def get_name(names, id_):
+    """Node name of a trace id: names may be a dict, a callable or None
+    (numeric ids i become sta<i+1>, others are kept)"""
+    if names is None:
+        return 'sta%d' % (int(id_) + 1) if str(id_).isdigit() else id_
+    if callable(names):
+        return names(id_)
+    return names.get(id_, names.get(str(id_)))
+
+
+class Sampler(object):
+    """Positions of one node every `step` seconds, interpolated between
+    the waypoints it gets. Samples equal to the previous one are dropped:
+    a replayed node keeps its position until the next sample"""
+    __slots__ = ('name', 'step', 'sink', 'last', 'tick', 'emitted')
+
+    def __init__(self, name, step, sink):
+        self.name, self.step, self.sink = name, step, sink
+        self.last = None  # last waypoint: time, position
+        self.tick = 0  # next sample at tick * step
+        self.emitted = None
+
+    def emit(self, t, pos):
+        pos = tuple(round(p, 2) for p in pos)
+        if pos != self.emitted:
+            self.emitted = pos
+            self.sink(self.name, t, pos)
+
+    def add(self, t, pos):
+        """Waypoint: the node is at pos at time t"""
+        if self.last is None:
+            self.emit(t, pos)
+            self.tick = int(math.floor(t / self.step)) + 1
+        else:
+            t0, pos0 = self.last
+            while self.tick * self.step <= t:
+                g = self.tick * self.step
+                f = (g - t0) / (t - t0) if t > t0 else 1.
+                self.emit(g, [a + (b - a) * f for a, b in zip(pos0, pos)])
+                self.tick += 1
+        self.last = t, pos
+
+    def flush(self):
+        if self.last is not None:
+            self.emit(*self.last)
+
+
+class TraceImporter(object):
+    """Base class: parse() feeds the waypoints of the nodes into add()"""
+
+    def __init__(self, path, step=1., names=None):
+        """:param path: trace file, may be gzip compressed
+        :param step: seconds between the positions written
+        :param names: maps trace ids to node names, see get_name()"""
+        self.path, self.step, self.names = path, step, names
+        self.samplers = {}
+        self.sink = None
+
+    def add(self, id_, t, pos):
+        if id_ not in self.samplers:
+            name = get_name(self.names, id_)
+            if name is None:  # node not wanted
+                self.samplers[id_] = None
+                return
+            self.samplers[id_] = Sampler(name, self.step, self.sink)
+        sampler = self.samplers[id_]
+        if sampler:
+            sampler.add(t, pos)
+
+    def samples(self, sink):
+        """Parses the file
+        :param sink: called with name, time and position of every sample"""
+        self.sink = sink
+        self.samplers = {}
+        self.parse()
+        for sampler in self.samplers.values():
+            if sampler:
+                sampler.flush()
+
+    def save(self, dst):
+        """Writes a binary trace
+        :return: number of samples written"""
+        recorder = TraceRecorder(dst)
+        self.samples(recorder.add_sample)
+        total = recorder.close()
+        debug('%s imported into %s\n' % (self.path, dst))
+        return total
+
+    def parse(self):
+        raise NotImplementedError
+
+
+class Ns2Trace(TraceImporter):
+    """ns-2 setdest scenario:
+        $node_(0) set X_ 150.0
+        $ns_ at 2.0 "$node_(0) setdest 10.0 20.0 5.0"
+    Nodes move straight to the destination at the given speed, until
+    they arrive or get a new destination"""
+    set_re = re.compile(r'\$node_\((\d+)\)\s+set\s+([XYZ])_\s+(\S+)')
+    dest_re = re.compile(r'\$ns_\s+at\s+(\S+)\s+"\$node_\((\d+)\)\s+'
+                         r'setdest\s+(\S+)\s+(\S+)\s+(\S+)"')
+
+    def parse(self):
+        # node: [position, time, destination, speed] of its movement
+        moves = {}
+        with open_text(self.path) as f:
+            for line in f:
+                m = self.dest_re.search(line)
+                if m:
+                    t, node = float(m.group(1)), m.group(2)
+                    dest = float(m.group(3)), float(m.group(4))
+                    self.setdest(moves, node, t, dest, float(m.group(5)))
+                    continue
+                m = self.set_re.search(line)
+                if m:
+                    move = moves.setdefault(m.group(1),
+                                            [[0., 0., 0.], 0., None, 0.])
+                    move[0]['XYZ'.index(m.group(2))] = float(m.group(3))
+        for node, move in moves.items():
+            self.arrive(node, move, None)
+
+    def arrive(self, node, move, t):
+        """Position of a node at time t (None: once arrived)"""
+        pos, t0, dest, speed = move
+        if dest is None or not speed:
+            if t is None:
+                self.add(node, t0, pos)
+            return pos
+        dist = math.hypot(dest[0] - pos[0], dest[1] - pos[1])
+        t_arrival = t0 + dist / speed
+        if t is None or t >= t_arrival:
+            pos = [dest[0], dest[1], pos[2]]
+            self.add(node, t_arrival, pos)
+            move[:] = [pos, t_arrival, None, 0.]
+            return pos
+        f = (t - t0) * speed / dist
+        return [pos[0] + (dest[0] - pos[0]) * f,
+                pos[1] + (dest[1] - pos[1]) * f, pos[2]]
+
+    def setdest(self, moves, node, t, dest, speed):
+        move = moves.setdefault(node, [[0., 0., 0.], 0., None, 0.])
+        if node not in self.samplers:
+            self.add(node, move[1], move[0])
+        pos = self.arrive(node, move, t)
+        self.add(node, t, pos)
+        move[:] = [pos, t, dest, speed]
+
+
+def iter_lines(f, size=1 << 16):
+    """Tokens of a text file, None at the end of every line, without
+    reading whole lines: BonnMotion puts a node trajectory on one line"""
+    carry = ''
+    while True:
+        block = f.read(size)
+        if not block:
+            break
+        lines = (carry + block).split('\n')
+        carry = lines.pop()
+        for line in lines:
+            for token in line.split():
+                yield token
+            yield None
+        tokens = carry.split()
+        if tokens and not carry[-1].isspace():
+            carry = tokens.pop()  # may go on in the next block
+        else:
+            carry = ''
+        for token in tokens:
+            yield token
+    for token in carry.split():
+        yield token
+    yield None
+
+
+class BonnMotionTrace(TraceImporter):
+    """BonnMotion .movements file: line i holds the waypoints of node i,
+    'time x y' (or 'time x y z' for 3D scenarios) one after the other"""
+
+    def __init__(self, path, step=1., names=None, dim=2):
+        super(BonnMotionTrace, self).__init__(path, step, names)
+        self.dim = dim
+
+    def parse(self):
+        node, values = 0, []
+        with open_text(self.path) as f:
+            for token in iter_lines(f):
+                if token is None:
+                    if values or node in self.samplers:
+                        node += 1
+                    values = []
+                    continue
+                values.append(float(token))
+                if len(values) == self.dim + 1:
+                    pos = values[1:] + [0.] * (3 - self.dim)
+                    self.add(node, values[0], pos)
+                    values = []
+
+
+class SumoTrace(TraceImporter):
+    """SUMO floating car data (--fcd-output):
+        <timestep time="0.00"><vehicle id="veh0" x="1" y="2" .../></timestep>
+    Vehicles and persons are imported, elements are dropped once read"""
+    tags = ('vehicle', 'person')
+
+    def parse(self):
+        t, root = 0., None
+        with open_text(self.path) as f:
+            for event, elem in ET.iterparse(f, events=('start', 'end')):
+                if root is None:
+                    root = elem
+                if event == 'start':
+                    if elem.tag == 'timestep':
+                        t = float(elem.get('time'))
+                elif elem.tag in self.tags:
+                    pos = [float(elem.get('x')), float(elem.get('y')),
+                           float(elem.get('z', 0.))]
+                    self.add(elem.get('id'), t, pos)
+                elif elem.tag == 'timestep':
+                    root.clear()
+
+
+importers = {'ns2': Ns2Trace, 'bonnmotion': BonnMotionTrace,
+             'sumo': SumoTrace}
+
+
+def import_trace(src, dst, fmt=None, step=1., names=None, **kwargs):
+    """Converts a ns-2 setdest, BonnMotion or SUMO FCD trace into a binary
+    trace for ReplayingMobility
+    :param src: trace file
+    :param dst: binary trace written
+    :param fmt: 'ns2', 'bonnmotion' or 'sumo', from the file name if None
+    :param step: seconds between the interpolated positions
+    :param names: maps trace ids to node names, see get_name()
+    :return: number of samples written"""
+    fmt = fmt or get_format(src)
+    if fmt not in importers:
+        raise Exception('Unknown trace format %s' % fmt)
+    return importers[fmt](src, step=step, names=names, **kwargs).save(dst)
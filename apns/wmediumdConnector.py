@@ -1,15 +1,21 @@
 """Helps starting the wmediumd service"""
 
 import ctypes
+import io
+import math
 import os
 import socket
 import struct
 import subprocess
 import tempfile
-from sys import version_info as py_version_info
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import partial
+from queue import Queue, Empty
 from time import sleep
 
-from apns.log import info, debug
+from apns.log import info, debug, error
 
 
 class wmediumd_mode(object):
@@ -92,6 +98,20 @@ class WmediumdException(Exception):
     pass
 
 
+def write_rows(file_, fmt, values, sep, width=1, chunk=1024):
+    """Writes fmt % row for every row, separated by sep, formatting
+    chunk rows at once
+    :param values: the values of all the rows, one after the other
+    :param width: values per row"""
+    rows = len(values) // width
+    for start in range(0, rows, chunk):
+        count = min(chunk, rows - start)
+        if start:
+            file_.write(sep)
+        file_.write(sep.join([fmt] * count) %
+                    tuple(values[start * width:(start + count) * width]))
+
+
 class set_interference(object):
     configstr = ''
 
@@ -99,59 +119,45 @@ class set_interference(object):
         self.interference(**kwargs)
 
     def interference(self, configstr, ppm, pos, txpowers,
-                     fading_cof, noise_th, isnodeaps, **kwargs):
-        configstr += '\tenable_interference = true;'
-        configstr += '\n};\nmodel:\n{\n'
-        configstr += '\ttype = "path_loss";\n\tpositions = ('
-        first_pos = True
-        for mappedpos in pos:
-            posX = float(mappedpos.sta_pos[0])
-            posY = float(mappedpos.sta_pos[1])
-            posZ = float(mappedpos.sta_pos[2])
-            if first_pos:
-                first_pos = False
-            else:
-                configstr += ','
-            configstr += '\n\t\t(%.1f, %.1f, %.1f)' % (
-                posX, posY, posZ)
-        configstr += '\n\t);\n\tfading_coefficient = %d;' % fading_cof
-        configstr += '\n\tnoise_threshold = %d;' % noise_th
-        configstr += '\n\tisnodeaps = ('
-        first_isnodeap = True
-        for isnodeap in isnodeaps:
-            if first_isnodeap:
-                configstr += '%s' % isnodeap
-                first_isnodeap = False
-            else:
-                configstr += ', %s' % isnodeap
-        configstr += ');\n\ttx_powers = ('
-        first_txpower = True
-        for mappedtxpower in txpowers:
-            txpower = mappedtxpower.sta_txpower
-            if first_txpower:
-                configstr += '%s' % txpower
-                first_txpower = False
-            else:
-                configstr += ', %s' % txpower
+                     fading_cof, noise_th, isnodeaps, file_=None, **kwargs):
+        """Writes the interference model of the wmediumd configuration
+        :param configstr: what comes before it
+        :param file_: file it is streamed to, kept in self.configstr if None"""
+        out = io.StringIO() if file_ is None else file_
+        out.write(configstr)
+        out.write('\tenable_interference = true;')
+        out.write('\n};\nmodel:\n{\n')
+        out.write('\ttype = "path_loss";\n\tpositions = (')
+        write_rows(out, '\n\t\t(%.1f, %.1f, %.1f)',
+                   [float(p) for mappedpos in pos
+                    for p in mappedpos.sta_pos[:3]], ',', width=3)
+        out.write('\n\t);\n\tfading_coefficient = %d;' % fading_cof)
+        out.write('\n\tnoise_threshold = %d;' % noise_th)
+        out.write('\n\tisnodeaps = (')
+        write_rows(out, '%s', list(isnodeaps), ', ')
+        out.write(');\n\ttx_powers = (')
+        write_rows(out, '%s', [mappedtxpower.sta_txpower
+                               for mappedtxpower in txpowers], ', ')
         if ppm.model == 'ITU':
-            configstr += ');\n\tmodel_name = "itu";\n\tnFLOORS = %d;' \
-                         '\n\tlF = %d;\n\tpL = %d;\n};' % \
-                         (ppm.nFloors, ppm.lF, ppm.pL)
+            out.write(');\n\tmodel_name = "itu";\n\tnFLOORS = %d;'
+                      '\n\tlF = %d;\n\tpL = %d;\n};' %
+                      (ppm.nFloors, ppm.lF, ppm.pL))
         elif ppm.model == 'logDistance':
-            configstr += ');\n\tmodel_name = "log_distance";' \
-                         '\n\tpath_loss_exp = %.1f;\n\txg = 0.0;\n};' \
-                         % ppm.exp
+            out.write(');\n\tmodel_name = "log_distance";'
+                      '\n\tpath_loss_exp = %.1f;\n\txg = 0.0;\n};'
+                      % ppm.exp)
         elif ppm.model == 'twoRayGround':
-            configstr += ');\n\tmodel_name = "two_ray_ground";' \
-                         '\n\tsL = %d;\n};' % ppm.sL
+            out.write(');\n\tmodel_name = "two_ray_ground";'
+                      '\n\tsL = %d;\n};' % ppm.sL)
         elif ppm.model == 'logNormalShadowing':
-            configstr += ');\n\tmodel_name = "log_normal_shadowing";' \
-                         '\n\tpath_loss_exp = %.1f;\n\tsL = %d;\n};' \
-                         % (ppm.exp, ppm.sL)
+            out.write(');\n\tmodel_name = "log_normal_shadowing";'
+                      '\n\tpath_loss_exp = %.1f;\n\tsL = %d;\n};'
+                      % (ppm.exp, ppm.sL))
         else:
-            configstr += ');\n\tmodel_name = "free_space";\n\tsL = %d;\n};' \
-                         % ppm.sL
-        self.configstr = configstr
+            out.write(');\n\tmodel_name = "free_space";\n\tsL = %d;\n};'
+                      % ppm.sL)
+        if file_ is None:
+            self.configstr = out.getvalue()
         return self.configstr
 
 
@@ -208,6 +214,10 @@ class WStarter(object):
         cmdline = ['wmediumd']
 
         cmdline[1:1] = kwargs['parameters']
+        if kwargs.get('intfrefs') and \
+                wmediumd_mode.mode == w_cst.INTERFERENCE_MODE:
+            # started with these interfaces, the others are added later
+            cmdline += ['-c', self.write_config(**kwargs)]
         WStarter.wmd_logfile = tempfile.NamedTemporaryFile(prefix='mn_wmd_log_',
                                                            suffix='.log',
                                                            delete=True)
@@ -220,6 +230,28 @@ class WStarter(object):
 
         self.is_connected = True
 
+    @staticmethod
+    def write_config(intfrefs, **kwargs):
+        """
+        Streams the configuration of the interference mode to a file
+        :param intfrefs: interfaces wmediumd starts with (e.g. the APs),
+        kwargs giving their positions, txpowers and isnodeaps
+        :return: the name of the file
+        """
+        with tempfile.NamedTemporaryFile(mode='w', prefix='mn_wmd_config_',
+                                         suffix='.cfg', delete=False,
+                                         buffering=1 << 16) as f:
+            f.write('ifaces :\n{\n\tids = (')
+            write_rows(f, '\n\t\t"%s"',
+                       [intfref.get_mac() for intfref in intfrefs], ',')
+            f.write('\n\t);\n')
+            set_interference(configstr='', file_=f, **kwargs)
+        for sta_id, intfref in enumerate(intfrefs):
+            intfref.sta_id = sta_id
+        WStarter.wmd_config_name = f.name
+        debug("Name of wmediumd config: %s\n" % f.name)
+        return f.name
+
 
 class w_pos(object):
     def __init__(self, staintf, sta_pos):
@@ -363,6 +395,11 @@ class WmediumdSPECPROBLink(object):
         self.errprobs = errprobs
 
 
+def pack_mac(mac):
+    """:return: the 6 bytes of a MAC address as sent to wmediumd"""
+    return bytes.fromhex(mac.replace(':', ''))
+
+
 class WmediumdIntfRef:
     """Intf Ref"""
 
@@ -381,6 +418,8 @@ class WmediumdIntfRef:
         self.__staname = staname
         self.__intfname = intfname
         self.__intfmac = intfmac
+        self.__packed_mac = None
+        self.sta_id = None  # wmediumd station index, once registered
 
     def get_station_name(self):
         """
@@ -403,6 +442,27 @@ class WmediumdIntfRef:
         """
         return self.__intfmac
 
+    def get_packed_mac(self):
+        """
+        Get the MAC address as sent to wmediumd, packed once
+        :rtype: bytes
+        """
+        if self.__packed_mac is None:
+            self.__packed_mac = pack_mac(self.get_mac())
+        return self.__packed_mac
+
+    def reset(self, intf=None):
+        """
+        Forget the packed MAC address and, after a MAC address change, the
+        station index. A renamed interface keeps its wmediumd station index
+        :param intf: new name of the interface, if it was renamed
+        """
+        self.__packed_mac = None
+        if intf is None:
+            self.sta_id = None
+        else:
+            self.__intfname = intf
+
     def id(self):
         """
         Id used in dicts
@@ -428,6 +488,8 @@ class DynamicIntfRef(WmediumdIntfRef):
         WmediumdIntfRef.__init__(self, "", "", "")
         self.__sta = sta
         self.__intf = intf
+        self.__wlan_intf = None
+        self.__packed_mac = None
 
     def get_station_name(self):
         return self.__sta.name
@@ -435,18 +497,33 @@ class DynamicIntfRef(WmediumdIntfRef):
     def get_intf_name(self):
         return self.__intf
 
+    def get_wlan_intf(self):
+        """The wireless interface referenced, looked up by name once:
+        reset() after it is renamed or replaced in sta.wintfs"""
+        if self.__wlan_intf is None:
+            intf_name = str(self.get_intf_name())
+            for wlan_intf in self.__sta.wintfs.values():
+                if wlan_intf.name == intf_name:
+                    self.__wlan_intf = wlan_intf
+                    break
+        return self.__wlan_intf
+
     def get_mac(self):
-        intf_name = self.get_intf_name()
-        index = 0
-        found = False
+        wlan_intf = self.get_wlan_intf()
+        if wlan_intf is not None:
+            return wlan_intf.mac
+
+    def get_packed_mac(self):
+        """Packed once, reset() after the MAC address changes"""
+        if self.__packed_mac is None:
+            self.__packed_mac = pack_mac(self.get_mac())
+        return self.__packed_mac
 
-        for wlan_intf in self.__sta.wintfs.values():
-            if wlan_intf.name == str(intf_name):
-                found = True
-                break
-            index += 1
-        if found:
-            return self.__sta.wintfs[index].mac
+    def reset(self, intf=None):
+        WmediumdIntfRef.reset(self, intf=intf)
+        if intf is not None:
+            self.__intf = intf
+        self.__wlan_intf = self.__packed_mac = None
 
 
 class w_server(object):
@@ -518,6 +595,28 @@ class w_server(object):
 
     sock = None
     connected = False
+    # requests queued by the thread running batch_updates
+    batch = threading.local()
+    # flushed earlier past this, so neither side fills its socket buffer
+    max_batch = 1024
+    # updates this close to the last one sent for an interface are not
+    # sent: position (m), txpower (dBm), antenna gain (dBi). Negative
+    # thresholds send every update
+    thresholds = {'pos': 0.01, 'txpower': 0, 'gain': 0}
+    last_sent = {}  # (update, packed mac): values wmediumd acknowledged
+    sending = {}  # (update, packed mac): number of the last one sent
+    counters = {}  # update: {'sent': n, 'suppressed': n}
+    # last_sent, sending and counters, from the mobility, association and
+    # writer threads
+    sent_lock = threading.Lock()
+    # what a queued request returns: success, no station index yet
+    queued = (None, w_cst.WUPDATE_SUCCESS)
+    # one request/response exchange on the socket at a time
+    lock = threading.RLock()
+    # thread writing the queued requests, see start_writer
+    writer = None
+    queue = None
+    writer_timeout = 5  # seconds stop_writer waits for wmediumd to answer
 
     @classmethod
     def connect(cls, uds_address=w_cst.SOCKET_PATH):
@@ -533,6 +632,10 @@ class w_server(object):
         sleep(1)
         cls.sock.connect(uds_address)
         cls.connected = True
+        with cls.sent_lock:
+            cls.last_sent.clear()
+            cls.sending.clear()
+        cls.start_writer()
 
     @classmethod
     def disconnect(cls):
@@ -540,32 +643,61 @@ class w_server(object):
         """
         Disconnect from the wmediumd server
         """
+        cls.stop_writer()
         if cls.sock:
             try:
                 WStarter.wmd_logfile.close()
-            except OSError:
+            except (OSError, AttributeError):
                 pass
+            if WStarter.wmd_config_name:
+                try:
+                    os.unlink(WStarter.wmd_config_name)
+                except OSError:
+                    pass
+                WStarter.wmd_config_name = None
 
             cls.sock.close()
             cls.connected = False
 
     @classmethod
-    def register_interface(cls, mac):
-        # type (str) -> int
+    def register_interface(cls, mac, intf=None):
+        # type (str, WmediumdIntfRef) -> int
         """
         Register a new interface at wmediumd
         :param mac The mac address of the interface
-        :return The wmediumd station index
+        :param intf The reference the station index is kept in. If
+        given, the registration is queued when batching
+        :return The wmediumd station index, None if queued
 
         :type mac: str
         :rtype int
         """
         debug("\n{} Registering interface with mac {}\n".format(w_cst.LOG_PREFIX, mac))
-        ret, sta_id = w_server.send_add(mac)
+        callback = None
+        if intf is not None:
+            def callback(resp):
+                if resp[-1] == w_cst.WUPDATE_SUCCESS:
+                    intf.sta_id = resp[-2]
+        ret, sta_id = w_server.send_add(mac, callback)
         if ret != w_cst.WUPDATE_SUCCESS:
             raise WmediumdException("Received error code from wmediumd: code {}".format(ret))
         return sta_id
 
+    @classmethod
+    def register_interfaces(cls, intfs):
+        # type (List[WmediumdIntfRef]) -> List[int]
+        """
+        Register interfaces at wmediumd in bulk, all the add requests
+        being written at once
+        :param intfs The references of the interfaces
+        :return The wmediumd station indexes (None if an outer batch is
+        still to be flushed)
+        """
+        with cls.batch_updates():
+            for intf in intfs:
+                cls.register_interface(intf.get_mac(), intf)
+        return [intf.sta_id for intf in intfs]
+
     @classmethod
     def unregister_interface(cls, mac):
         # type (str) -> None
@@ -578,10 +710,62 @@ class w_server(object):
         debug("\n%s Unregistering interface with mac %s\n"
              % (w_cst.LOG_PREFIX, mac))
         ret = w_server.send_del_by_mac(mac)
+        with cls.sent_lock:
+            for update in cls.thresholds:
+                cls.last_sent.pop((update, pack_mac(mac)), None)
         if ret != w_cst.WUPDATE_SUCCESS:
             raise WmediumdException("Received error code from wmediumd: "
                                     "code %d" % ret)
 
+    @classmethod
+    def is_redundant(cls, update, intf, values):
+        # type (str, WmediumdIntfRef, Sequence[float]) -> bool
+        """
+        Whether an update is within its threshold of the last one
+        wmediumd acknowledged for the interface, counted as suppressed
+        :param update: 'pos', 'txpower' or 'gain'
+        :param values: the values of the update
+        """
+        key = update, intf.get_packed_mac()
+        values = tuple(float(value) for value in values)
+        with cls.sent_lock:
+            last = cls.last_sent.get(key)
+            counter = cls.counters.setdefault(update,
+                                              {'sent': 0, 'suppressed': 0})
+            if last is not None and len(last) == len(values) and math.sqrt(
+                    sum((a - b) ** 2 for a, b in zip(last, values))) \
+                    <= cls.thresholds[update]:
+                counter['suppressed'] += 1
+                return True
+            return False
+
+    @classmethod
+    def get_sent_callback(cls, update, intf, values):
+        # type (str, WmediumdIntfRef, Sequence[float]) -> Callable
+        """
+        Counts an update as sent. Until its response is received, what
+        wmediumd holds is unknown: nothing is suppressed for the interface
+        :return: the callback keeping the values once acknowledged, and
+        forgetting them if wmediumd answered with an error
+        """
+        key = update, intf.get_packed_mac()
+        values = tuple(float(value) for value in values)
+        with cls.sent_lock:
+            cls.counters.setdefault(update, {'sent': 0, 'suppressed': 0})
+            cls.counters[update]['sent'] += 1
+            number = cls.sending[key] = cls.sending.get(key, 0) + 1
+            cls.last_sent.pop(key, None)
+
+        def callback(resp):
+            with cls.sent_lock:
+                if cls.sending.get(key) != number:
+                    return  # a later update is on its way
+                if resp[-1] == w_cst.WUPDATE_SUCCESS:
+                    cls.last_sent[key] = values
+                else:
+                    cls.last_sent.pop(key, None)
+        return callback
+
     @classmethod
     def update_link_snr(cls, link):
         # type (SNRLink) -> None
@@ -603,7 +787,10 @@ class w_server(object):
         :param pos The pos to update
         :type pos: w_pos
         """
-        ret = w_server.send_pos_update(pos)
+        if cls.is_redundant('pos', pos.staintf, pos.sta_pos):
+            return
+        ret = w_server.send_pos_update(pos, cls.get_sent_callback(
+            'pos', pos.staintf, pos.sta_pos))
         if ret != w_cst.WUPDATE_SUCCESS:
             raise WmediumdException("Received error code from wmediumd: "
                                     "code %d" % ret)
@@ -617,7 +804,11 @@ class w_server(object):
 
         :type txpower: w_txpower
         """
-        ret = w_server.send_txpower_update(txpower)
+        if cls.is_redundant('txpower', txpower.staintf,
+                            (txpower.sta_txpower,)):
+            return
+        ret = w_server.send_txpower_update(txpower, cls.get_sent_callback(
+            'txpower', txpower.staintf, (txpower.sta_txpower,)))
         if ret != w_cst.WUPDATE_SUCCESS:
             raise WmediumdException("Received error code from wmediumd: "
                                     "code %d" % ret)
@@ -630,7 +821,10 @@ class w_server(object):
         :param gain The gain to update
         :type gain: Gain
         """
-        ret = w_server.send_gain_update(gain)
+        if cls.is_redundant('gain', gain.staintf, (gain.sta_gain,)):
+            return
+        ret = w_server.send_gain_update(gain, cls.get_sent_callback(
+            'gain', gain.staintf, (gain.sta_gain,)))
         if ret != w_cst.WUPDATE_SUCCESS:
             raise WmediumdException("Received error code from wmediumd: "
                                     "code %d" % ret)
@@ -712,17 +906,18 @@ class w_server(object):
              "value %d\n" % (w_cst.LOG_PREFIX,
                              link.sta1intf.get_mac(),
                              link.sta2intf.get_mac(), link.snr))
-        cls.sock.send(cls.__create_snr_update_request(link))
-        return cls.__parse_response(
+        return cls.__request(
+            cls.__create_snr_update_request(link),
             w_cst.WSERVER_SNR_UPDATE_RESPONSE_TYPE,
             cls.__snr_update_response_struct)[-1]
 
     @classmethod
-    def send_pos_update(cls, pos):
-        # type (w_pos) -> int
+    def send_pos_update(cls, pos, callback=None):
+        # type (w_pos, Callable) -> int
         """
         Send an update to the wmediumd server
         :param pos: The w_pos to update
+        :param callback: called with the response once received
         :return: A WUPDATE_* constant
         """
         posX = pos.sta_pos[0]
@@ -731,43 +926,45 @@ class w_server(object):
         debug("%s Updating Pos of %s to x=%s, y=%s, z=%s\n" % (
            w_cst.LOG_PREFIX, pos.staintf.get_mac(),
            posX, posY, posZ))
-        cls.sock.send(cls.__create_pos_update_request(pos, posX, posY, posZ))
-        return cls.__parse_response(
+        return cls.__request(
+            cls.__create_pos_update_request(pos, posX, posY, posZ),
             w_cst.WSERVER_POS_UPDATE_RESPONSE_TYPE,
-            cls.__pos_update_response_struct)[-1]
+            cls.__pos_update_response_struct, callback=callback)[-1]
 
     @classmethod
-    def send_txpower_update(cls, txpower):
-        # type (w_txpower) -> int
+    def send_txpower_update(cls, txpower, callback=None):
+        # type (w_txpower, Callable) -> int
         """
         Send an update to the wmediumd server
         :param txpower: The w_txpower to update
+        :param callback: called with the response once received
         :return: A WUPDATE_* constant
         """
         debug("%s Updating TxPower of %s to %d\n" % (
            w_cst.LOG_PREFIX, txpower.staintf.get_mac(),
            txpower.sta_txpower))
-        cls.sock.send(cls.__create_txpower_update_request(txpower))
-        return cls.__parse_response(
+        return cls.__request(
+            cls.__create_txpower_update_request(txpower),
             w_cst.WSERVER_TXPOWER_UPDATE_RESPONSE_TYPE,
-            cls.__txpower_update_response_struct)[-1]
+            cls.__txpower_update_response_struct, callback=callback)[-1]
 
     @classmethod
-    def send_gain_update(cls, gain):
-        # type (gain) -> int
+    def send_gain_update(cls, gain, callback=None):
+        # type (gain, Callable) -> int
         """
         Send an update to the wmediumd server
         :param gain: The Gain to update
+        :param callback: called with the response once received
         :return: A WUPDATE_* constant
         """
         gain_ = gain.sta_gain
         debug("%s Updating Antenna Gain of %s to %d\n" % (
            w_cst.LOG_PREFIX, gain.staintf.get_mac(),
            gain_))
-        cls.sock.send(cls.__create_gain_update_request(gain))
-        return cls.__parse_response(
+        return cls.__request(
+            cls.__create_gain_update_request(gain),
             w_cst.WSERVER_GAIN_UPDATE_RESPONSE_TYPE,
-            cls.__gain_update_response_struct)[-1]
+            cls.__gain_update_response_struct, callback=callback)[-1]
 
     @classmethod
     def send_gaussian_random_update(cls, gRandom):
@@ -781,8 +978,8 @@ class w_server(object):
         debug("%s Updating Gaussian Random of %s to %s\n" % (
            w_cst.LOG_PREFIX, gRandom.staintf.get_mac(),
            gRandom_))
-        cls.sock.send(cls.__create_gaussian_random_update_request(gRandom))
-        return cls.__parse_response(
+        return cls.__request(
+            cls.__create_gaussian_random_update_request(gRandom),
             w_cst.WSERVER_GAUSSIAN_RANDOM_UPDATE_RESPONSE_TYPE,
             cls.__gaussian_random_update_response_struct)[-1]
 
@@ -798,8 +995,8 @@ class w_server(object):
         debug("%s Updating Antenna Height of %s to %d\n" % (
            w_cst.LOG_PREFIX, height.staintf.get_mac(),
            height_))
-        cls.sock.send(cls.__create_height_update_request(height))
-        return cls.__parse_response(
+        return cls.__request(
+            cls.__create_height_update_request(height),
             w_cst.WSERVER_HEIGHT_UPDATE_RESPONSE_TYPE,
             cls.__height_update_response_struct)[-1]
 
@@ -816,8 +1013,8 @@ class w_server(object):
                  w_cst.LOG_PREFIX, link.sta1intf.get_mac(),
                  link.sta2intf.get_mac(),
                  link.errprob))
-        cls.sock.send(cls.__create_errprob_update_request(link))
-        return cls.__parse_response(
+        return cls.__request(
+            cls.__create_errprob_update_request(link),
             w_cst.WSERVER_ERRPROB_UPDATE_RESPONSE_TYPE,
             cls.__errprob_update_response_struct)[-1]
 
@@ -832,8 +1029,8 @@ class w_server(object):
         debug("\n%s Updating SPECPROB from interface %s to interface %s" % (
            w_cst.LOG_PREFIX, link.sta1intf.get_mac(),
            link.sta2intf.get_mac()))
-        cls.sock.send(cls.__create_specprob_update_request(link))
-        return cls.__parse_response(
+        return cls.__request(
+            cls.__create_specprob_update_request(link),
             w_cst.WSERVER_SPECPROB_UPDATE_RESPONSE_TYPE,
             cls.__specprob_update_response_struct)[-1]
 
@@ -845,10 +1042,10 @@ class w_server(object):
         :param mac: The mac address of the interface to be deleted
         :return: A WUPDATE_* constant
         """
-        cls.sock.send(cls.__create_station_del_by_mac_request(mac))
-        return cls.__parse_response(
+        return cls.__request(
+            cls.__create_station_del_by_mac_request(mac),
             w_cst.WSERVER_DEL_BY_MAC_RESPONSE_TYPE,
-            cls.__station_del_by_mac_response_struct)[-1]
+            cls.__station_del_by_mac_response_struct, queue=False)[-1]
 
     @classmethod
     def send_del_by_id(cls, sta_id):
@@ -858,24 +1055,28 @@ class w_server(object):
         :param sta_id: The wmediumd index of the station
         :return: A WUPDATE_* constant
         """
-        cls.sock.send(cls.__create_station_del_by_id_request(sta_id))
-        return cls.__parse_response(
+        return cls.__request(
+            cls.__create_station_del_by_id_request(sta_id),
             w_cst.WSERVER_DEL_BY_ID_RESPONSE_TYPE,
-            cls.__station_del_by_id_response_struct)[-1]
+            cls.__station_del_by_id_response_struct, queue=False)[-1]
 
     @classmethod
-    def send_add(cls, mac):
-        # type (str) -> (int, int)
+    def send_add(cls, mac, callback=None):
+        # type (str, Callable) -> (int, int)
         """
         Send an update to the wmediumd server
         :param mac: The mac address of the new interface
+        :param callback: called with the response once received. If
+        given, the request can be queued in a batch, the index returned
+        then being None
         :return: A WUPDATE_* constant and on success at the second pos
         the index
         """
-        cls.sock.send(cls.__create_station_add_request(mac))
-        resp = cls.__parse_response(
+        resp = cls.__request(
+            cls.__create_station_add_request(mac),
             w_cst.WSERVER_ADD_RESPONSE_TYPE,
-            cls.__station_add_response_struct)
+            cls.__station_add_response_struct,
+            queue=callback is not None, callback=callback)
         return resp[-1], resp[-2]
 
     @classmethod
@@ -890,168 +1091,382 @@ class w_server(object):
         debug("%s Updating Medium ID of %s to %d\n" % (
             w_cst.LOG_PREFIX, medium.staintf.get_mac(),
             medium_))
-        cls.sock.send(cls.__create_medium_update_request(medium))
-        return cls.__parse_response(
-            w_cst.WSERVER_MEDIUM_UPDATE_REQUEST_TYPE,
+        return cls.__request(
+            cls.__create_medium_update_request(medium),
+            w_cst.WSERVER_MEDIUM_UPDATE_RESPONSE_TYPE,
             cls.__medium_update_response_struct)[-1]
 
     @classmethod
     def __create_snr_update_request(cls, link):
         """snr update request"""
-        # type (SNRLink) -> str
+        # type (SNRLink) -> (struct.Struct, tuple)
         msgtype = w_cst.WSERVER_SNR_UPDATE_REQUEST_TYPE
-        if py_version_info < (3, 0):
-            mac_from = link.sta1intf.get_mac().replace(':', '').decode('hex')
-            mac_to = link.sta2intf.get_mac().replace(':', '').decode('hex')
-        else:
-            mac_from = bytes.fromhex(link.sta1intf.get_mac().replace(':', ''))
-            mac_to = bytes.fromhex(link.sta2intf.get_mac().replace(':', ''))
+        mac_from = link.sta1intf.get_packed_mac()
+        mac_to = link.sta2intf.get_packed_mac()
         snr = int(link.snr)
-        return cls.__snr_update_request_struct.pack(msgtype, mac_from,
-                                                    mac_to, snr)
+        return cls.__snr_update_request_struct, (msgtype, mac_from,
+                                                 mac_to, snr)
 
     @classmethod
     def __create_pos_update_request(cls, pos, posX, posY, posZ):
         """pos update request"""
-        # type (pos) -> str
+        # type (pos) -> (struct.Struct, tuple)
         msgtype = w_cst.WSERVER_POS_UPDATE_REQUEST_TYPE
-        if py_version_info < (3, 0):
-            mac = pos.staintf.get_mac().replace(':', '').decode('hex')
-        else:
-            mac = bytes.fromhex(pos.staintf.get_mac().replace(':', ''))
-        return cls.__pos_update_request_struct.pack(msgtype, mac,
-                                                    posX, posY, posZ)
+        mac = pos.staintf.get_packed_mac()
+        return cls.__pos_update_request_struct, (msgtype, mac,
+                                                 posX, posY, posZ)
 
     @classmethod
     def __create_txpower_update_request(cls, txpower):
         """tx power update request"""
-        # type (w_txpower) -> str
+        # type (w_txpower) -> (struct.Struct, tuple)
         msgtype = w_cst.WSERVER_TXPOWER_UPDATE_REQUEST_TYPE
-        mac = bytes.fromhex((txpower.staintf.get_mac().replace(':', '')))
+        mac = txpower.staintf.get_packed_mac()
         txpower_ = txpower.sta_txpower
-        return cls.__txpower_update_request_struct.pack(msgtype, mac, txpower_)
+        return cls.__txpower_update_request_struct, (msgtype, mac, txpower_)
 
     @classmethod
     def __create_gain_update_request(cls, gain):
         """antenna gain update request"""
-        # type (gain) -> str
+        # type (gain) -> (struct.Struct, tuple)
         msgtype = w_cst.WSERVER_GAIN_UPDATE_REQUEST_TYPE
-        if py_version_info < (3, 0):
-            mac = gain.staintf.get_mac().replace(':', '').decode('hex')
-        else:
-            mac = bytes.fromhex((gain.staintf.get_mac().replace(':', '')))
+        mac = gain.staintf.get_packed_mac()
         gain_ = gain.sta_gain
-        return cls.__gain_update_request_struct.pack(msgtype, mac, gain_)
+        return cls.__gain_update_request_struct, (msgtype, mac, gain_)
 
     @classmethod
     def __create_gaussian_random_update_request(cls, gRandom):
         """gaussian random update request"""
-        # type (WmediumdGRandom) -> str
+        # type (WmediumdGRandom) -> (struct.Struct, tuple)
         msgtype = w_cst.WSERVER_GAUSSIAN_RANDOM_UPDATE_REQUEST_TYPE
-        if py_version_info < (3, 0):
-            mac = gRandom.staintf.get_mac().replace(':', '').decode('hex')
-        else:
-            mac = bytes.fromhex((gRandom.staintf.get_mac().replace(':', '')))
+        mac = gRandom.staintf.get_packed_mac()
         gRandom_ = gRandom.sta_gaussian_random
-        return cls.__gaussian_random_update_request_struct.pack(msgtype, mac,
-                                                                gRandom_)
+        return cls.__gaussian_random_update_request_struct, (msgtype, mac,
+                                                             gRandom_)
 
     @classmethod
     def __create_height_update_request(cls, height):
         """height update request"""
-        # type (height) -> str
+        # type (height) -> (struct.Struct, tuple)
         msgtype = w_cst.WSERVER_HEIGHT_UPDATE_REQUEST_TYPE
-        if py_version_info < (3, 0):
-            mac = height.staintf.get_mac().replace(':', '').decode('hex')
-        else:
-            mac = bytes.fromhex((height.staintf.get_mac().replace(':', '')))
+        mac = height.staintf.get_packed_mac()
         height_ = height.sta_height
-        return cls.__height_update_request_struct.pack(msgtype, mac, height_)
+        return cls.__height_update_request_struct, (msgtype, mac, height_)
 
     @classmethod
     def __create_errprob_update_request(cls, link):
         """error prob update request"""
-        # type (ERRPROBLink) -> str
+        # type (ERRPROBLink) -> (struct.Struct, tuple)
         msgtype = w_cst.WSERVER_ERRPROB_UPDATE_REQUEST_TYPE
-        if py_version_info < (3, 0):
-            mac_from = link.sta1intf.get_mac().replace(':', '').decode('hex')
-            mac_to = link.sta2intf.get_mac().replace(':', '').decode('hex')
-        else:
-            mac_from = bytes.fromhex((link.sta1intf.get_mac().replace(':', '')))
-            mac_to = bytes.fromhex((link.sta2intf.get_mac().replace(':', '')))
+        mac_from = link.sta1intf.get_packed_mac()
+        mac_to = link.sta2intf.get_packed_mac()
         errprob = cls.__conv_float_to_fixed_point(link.errprob)
-        return cls.__errprob_update_request_struct.pack(msgtype, mac_from, mac_to,
-                                                        errprob)
+        return cls.__errprob_update_request_struct, (msgtype, mac_from,
+                                                     mac_to, errprob)
 
     @classmethod
     def __create_specprob_update_request(cls, link):
         """specprob update request"""
-        # type (WmediumdSPECPROBLink) -> str
+        # type (WmediumdSPECPROBLink) -> (struct.Struct, tuple)
         msgtype = w_cst.WSERVER_SPECPROB_UPDATE_REQUEST_TYPE
-        if py_version_info < (3, 0):
-            mac_from = link.sta1int.get_mac().replace(':', '').decode('hex')
-            mac_to = link.sta2intf.get_mac().replace(':', '').decode('hex')
-        else:
-            mac_from = bytes.fromhex((link.sta1intf.get_mac().replace(':', '')))
-            mac_to = bytes.fromhex((link.sta2intf.get_mac().replace(':', '')))
+        mac_from = link.sta1intf.get_packed_mac()
+        mac_to = link.sta2intf.get_packed_mac()
         fixed_points = [None] * 144
         for size_idx in range(0, 12):
             for rate_idx in range(0, 12):
                 fixed_points[size_idx * 12 + rate_idx] = \
                     cls.__conv_float_to_fixed_point(
                         link.errprobs[size_idx][rate_idx])
-        return cls.__specprob_update_request_struct.pack(msgtype, mac_from,
-                                                         mac_to, *fixed_points)
+        return cls.__specprob_update_request_struct, (msgtype, mac_from,
+                                                      mac_to, *fixed_points)
 
     @classmethod
     def __create_station_del_by_mac_request(cls, mac):
         """del station by mac"""
-        # type (str) -> str
+        # type (str) -> (struct.Struct, tuple)
         msgtype = w_cst.WSERVER_DEL_BY_MAC_REQUEST_TYPE
-        macparsed = mac.replace(':', '').decode('hex')
-        return cls.__station_del_by_mac_request_struct.pack(msgtype, macparsed)
+        macparsed = pack_mac(mac)
+        return cls.__station_del_by_mac_request_struct, (msgtype, macparsed)
 
     @classmethod
     def __create_station_del_by_id_request(cls, sta_id):
         """del station by id"""
-        # type (int) -> str
+        # type (int) -> (struct.Struct, tuple)
         msgtype = w_cst.WSERVER_DEL_BY_ID_REQUEST_TYPE
-        return cls.__station_del_by_id_request_struct.pack(msgtype, sta_id)
+        return cls.__station_del_by_id_request_struct, (msgtype, sta_id)
 
     @classmethod
     def __create_station_add_request(cls, mac):
         """add station"""
-        # type (str) -> str
+        # type (str) -> (struct.Struct, tuple)
         msgtype = w_cst.WSERVER_ADD_REQUEST_TYPE
-        if py_version_info < (3, 0):
-            macparsed = mac.replace(':', '').decode('hex')
-        else:
-            macparsed = bytes.fromhex(mac.replace(':', ''))
-        return cls.__station_add_request_struct.pack(msgtype, macparsed)
+        macparsed = pack_mac(mac)
+        return cls.__station_add_request_struct, (msgtype, macparsed)
 
     @classmethod
     def __create_medium_update_request(cls, medium):
         """medium update request"""
-        # type (w_medium) -> str
+        # type (w_medium) -> (struct.Struct, tuple)
         msgtype = w_cst.WSERVER_MEDIUM_UPDATE_REQUEST_TYPE
-        if py_version_info < (3, 0):
-            mac = medium.staintf.get_mac().replace(':', '').decode('hex')
-        else:
-            mac = bytes.fromhex((medium.staintf.get_mac().replace(':', '')))
+        mac = medium.staintf.get_packed_mac()
         mediumid_ = medium.sta_medium_id
-        return cls.__medium_update_request_struct.pack(msgtype, mac, mediumid_)
+        return cls.__medium_update_request_struct, (msgtype, mac, mediumid_)
+
+    @classmethod
+    @contextmanager
+    def batch_updates(cls, wait=True):
+        """
+        The updates sent by the calling thread within the block are
+        queued and written to wmediumd at once when it ends. Their
+        responses are then read and checked together (see flush_batch),
+        a queued update returning WUPDATE_SUCCESS meanwhile.
+        Blocks can be nested, the outermost one flushes. If the block
+        raises, the updates queued before are still sent (errors sending
+        them are logged) and the exception is raised again.
+        :param wait: if False and the writer thread runs, the block ends
+        without waiting for the responses (errors are logged)
+        """
+        if not cls.connected or cls.get_batch() is not None:
+            yield
+            return
+        cls.batch.requests, cls.batch.size, cls.batch.wait = [], 0, wait
+        if getattr(cls.batch, 'buffer', None) is None:
+            cls.batch.buffer = bytearray(4096)
+        try:
+            yield
+        except Exception:
+            try:
+                cls.flush_batch()
+            except Exception as e:
+                error('%s %s\n' % (w_cst.LOG_PREFIX, e))
+            raise
+        else:
+            cls.flush_batch()
+        finally:
+            cls.batch.requests = None
+
+    @classmethod
+    def get_batch(cls):
+        return getattr(cls.batch, 'requests', None)
+
+    @classmethod
+    def flush_batch(cls):
+        # type () -> Union[int, Future]
+        """
+        Sends the queued requests in one write, then reads all their
+        responses and checks their types and codes
+        :return: the number of requests sent, or the Future of their
+        responses if the batch does not wait for them
+        """
+        expects = cls.get_batch()
+        if not expects:
+            return 0
+        batch = cls.batch
+        data = memoryview(batch.buffer)[:batch.size].tobytes()
+        batch.requests, batch.size = [], 0
+        if cls.writer is not None and not batch.wait:
+            future = cls.submit(data, expects)
+            future.add_done_callback(partial(cls.__done, expects))
+            return future
+        responses = cls.exchange(data, expects)
+        cls.__callback(expects, responses)
+        cls.__check(responses)
+        return len(expects)
+
+    @staticmethod
+    def __callback(expects, responses):
+        for (_, _, callback), resp in zip(expects, responses):
+            if callback:
+                callback(resp)
+
+    @classmethod
+    def __check(cls, responses):
+        errors = [resp[-1] for resp in responses
+                  if resp[-1] != w_cst.WUPDATE_SUCCESS]
+        if errors:
+            raise WmediumdException("Received error code from wmediumd: "
+                                    "code %d (%d of %d updates failed)"
+                                    % (errors[0], len(errors), len(responses)))
+
+    @classmethod
+    def __done(cls, expects, future):
+        """Runs the callbacks of a batch that was not waited for, and
+        logs its errors"""
+        try:
+            cls.__callback(expects, future.result())
+            cls.__check(future.result())
+        except Exception as e:
+            error('%s %s\n' % (w_cst.LOG_PREFIX, e))
+
+    @classmethod
+    def __request(cls, request, expected_type, resp_struct, queue=True,
+                  callback=None):
+        """Sends a request and parses its response, or packs it into the
+        batch buffer if the calling thread is batching. Requests that are
+        not queued flush the batch first, so the responses keep the order
+        of the requests
+        :param request: request struct and values, see __create_*
+        :param callback: called with the response, once received"""
+        # type ((struct.Struct, tuple), int, struct.Struct, bool, Callable) -> tuple
+        req_struct, values = request
+        expects = cls.get_batch()
+        if expects is not None:
+            if queue:
+                batch = cls.batch
+                end = batch.size + req_struct.size
+                if end > len(batch.buffer):
+                    batch.buffer.extend(bytes(max(len(batch.buffer),
+                                                  req_struct.size)))
+                req_struct.pack_into(batch.buffer, batch.size, *values)
+                batch.size = end
+                expects.append((expected_type, resp_struct, callback))
+                if len(expects) >= cls.max_batch:
+                    cls.flush_batch()
+                return cls.queued
+            cls.flush_batch()
+        # the calling thread waits for the response, so its buffer for the
+        # struct is not packed again before it is written
+        buffers = getattr(cls.batch, 'buffers', None)
+        if buffers is None:
+            buffers = cls.batch.buffers = {}
+        buffer = buffers.get(req_struct)
+        if buffer is None:
+            buffer = buffers[req_struct] = bytearray(req_struct.size)
+        req_struct.pack_into(buffer, 0, *values)
+        resp = cls.exchange(buffer, [(expected_type, resp_struct)])[0]
+        if callback:
+            callback(resp)
+        return resp
+
+    @classmethod
+    def exchange(cls, data, expects):
+        """Sends requests and returns their responses, safe from any
+        thread: through the writer thread if it runs, holding the socket
+        lock otherwise
+        :param data: the packed requests
+        :param expects: (response type, response struct[, callback]) per
+        request"""
+        if cls.writer is not None:
+            return cls.submit(data, expects).result()
+        with cls.lock:
+            if not cls.connected:
+                raise WmediumdException("Not connected to wmediumd server")
+            return cls.__exchange(data, expects)
+
+    @classmethod
+    def submit(cls, data, expects):
+        # type (bytes, list) -> Future
+        """Queues requests for the writer thread. They are written in
+        the order they are submitted, so the updates of an interface
+        reach wmediumd in order
+        :return: Future of the list of responses"""
+        if not cls.connected:
+            raise WmediumdException("Not connected to wmediumd server")
+        future = Future()
+        cls.queue.put((data, expects, future))
+        return future
+
+    @classmethod
+    def start_writer(cls):
+        """Starts the thread every request then goes through"""
+        if cls.writer is None:
+            cls.queue = Queue()
+            cls.writer = threading.Thread(name='wmediumdWriter',
+                                          target=cls.__write, args=(cls.queue,))
+            cls.writer.daemon = True
+            cls.writer.start()
+
+    @classmethod
+    def stop_writer(cls):
+        """Stops the writer thread once the requests queued are sent. If
+        wmediumd does not answer them within writer_timeout, the socket
+        is shut down, failing them"""
+        writer, cls.writer = cls.writer, None
+        if writer is not None:
+            cls.queue.put(None)
+            writer.join(cls.writer_timeout)
+            if writer.is_alive() and cls.sock:
+                try:
+                    cls.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                writer.join(cls.writer_timeout)
+
+    @classmethod
+    def __write(cls, queue):
+        """Writer thread: requests queued meanwhile are sent together
+        and their futures resolved with their responses. Once an exchange
+        failed, the requests still queued fail too"""
+        stop = False
+        broken = None
+        while not stop:
+            pending = [queue.get()]
+            while True:
+                try:
+                    pending.append(queue.get_nowait())
+                except Empty:
+                    break
+            if None in pending:
+                stop = True
+                pending = pending[:pending.index(None)]
+            if not pending:
+                continue
+            if broken is not None:
+                for _, _, future in pending:
+                    future.set_exception(WmediumdException(
+                        "Connection to wmediumd lost: %s" % broken))
+                continue
+            data = b''.join([data_ for data_, _, _ in pending])
+            expects = [expect for _, expects_, _ in pending
+                       for expect in expects_]
+            try:
+                with cls.lock:
+                    responses = cls.__exchange(data, expects)
+            except Exception as e:
+                broken = e
+                for _, _, future in pending:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for _, expects_, future in pending:
+                future.set_result(responses[offset:offset + len(expects_)])
+                offset += len(expects_)
+
+    @classmethod
+    def __exchange(cls, data, expects):
+        """Writes requests at once, then reads all their responses. If
+        that fails, the responses left on the socket would be read as the
+        ones of the next requests: the connection is marked as lost"""
+        try:
+            cls.sock.sendall(data)
+            received = cls.__recv(sum(resp_struct.size
+                                      for _, resp_struct, *_ in expects))
+            responses, offset = [], 0
+            for expected_type, resp_struct, *_ in expects:
+                resp = resp_struct.unpack_from(received, offset)
+                offset += resp_struct.size
+                if resp[0] != expected_type:
+                    raise WmediumdException(
+                        "Received response of unknown type %d, expected %d"
+                        % (resp[0], expected_type))
+                responses.append(resp)
+        except Exception:
+            cls.connected = False
+            raise
+        return responses
 
     @classmethod
-    def __parse_response(cls, expected_type, resp_struct):
-        """parse response"""
-        # type (int, struct.Struct)->tuple
-        recvd_data = cls.sock.recv(resp_struct.size)
-        # recvd_type = cls.__base_struct.unpack(recvd_data[0])[0]
-        # if recvd_type != expected_type:
-        #    raise WmediumdException(
-        #        "Received response of unknown type %d, expected %d" % (recvd_type,
-        # expected_type))
-        return resp_struct.unpack(recvd_data)
+    def __recv(cls, size):
+        """Reads exactly size bytes"""
+        data = bytearray(size)
+        view = memoryview(data)
+        received = 0
+        while received < size:
+            n = cls.sock.recv_into(view[received:])
+            if not n:
+                raise WmediumdException("wmediumd closed the connection")
+            received += n
+        return data
 
     @classmethod
     def __conv_float_to_fixed_point(cls, d):
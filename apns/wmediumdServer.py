@@ -0,0 +1,183 @@
+"""A pure-Python stand-in for the wmediumd UNIX socket server.
+
+It answers the requests w_server sends (see wmediumdConnector) with the
+same structs as wmediumd, keeps the registered interfaces and the last
+values received for them and can record every update. wmediumd and the
+aprf_drv module are not needed, so the connector can be tested and
+benchmarked anywhere:
+
+    server = WmediumdServer().start()
+    w_server.connect(server.path)
+    ...
+    w_server.disconnect()
+    server.stop()"""
+
+import os
+import socket
+import struct
+import tempfile
+import threading
+from time import sleep
+
+from apns.log import debug
+from apns.wmediumdConnector import w_cst
+
+
+MAC = '6s'
+
+
+class WmediumdServer(object):
+    # request type: (name, request format, response format after the request)
+    formats = {
+        w_cst.WSERVER_SNR_UPDATE_REQUEST_TYPE: ('snr', MAC + MAC + 'i', 'B'),
+        w_cst.WSERVER_DEL_BY_MAC_REQUEST_TYPE: ('del_by_mac', MAC, 'B'),
+        w_cst.WSERVER_DEL_BY_ID_REQUEST_TYPE: ('del_by_id', 'i', 'B'),
+        w_cst.WSERVER_ADD_REQUEST_TYPE: ('add', MAC, 'iB'),
+        w_cst.WSERVER_ERRPROB_UPDATE_REQUEST_TYPE: ('errprob',
+                                                    MAC + MAC + 'i', 'B'),
+        w_cst.WSERVER_SPECPROB_UPDATE_REQUEST_TYPE: ('specprob',
+                                                     MAC + MAC + '144i', 'B'),
+        w_cst.WSERVER_POS_UPDATE_REQUEST_TYPE: ('pos', MAC + 'fff', 'B'),
+        w_cst.WSERVER_TXPOWER_UPDATE_REQUEST_TYPE: ('txpower', MAC + 'i', 'B'),
+        w_cst.WSERVER_GAIN_UPDATE_REQUEST_TYPE: ('gain', MAC + 'i', 'B'),
+        w_cst.WSERVER_HEIGHT_UPDATE_REQUEST_TYPE: ('height', MAC + 'i', 'B'),
+        w_cst.WSERVER_GAUSSIAN_RANDOM_UPDATE_REQUEST_TYPE: ('gaussian_random',
+                                                            MAC + 'f', 'B'),
+        w_cst.WSERVER_MEDIUM_UPDATE_REQUEST_TYPE: ('medium', MAC + 'i', 'B')}
+
+    def __init__(self, path=None, latency=0., record=True):
+        """:param path: UNIX socket path, a temporary one if None
+        :param latency: delay (s) before answering each read of requests
+        :param record: keep every request received in self.received"""
+        self.path = path or os.path.join(tempfile.mkdtemp(), 'wmediumd.sock')
+        self.latency = latency
+        self.record = record
+        self.received = []  # (name, values) in the order received
+        self.counts = {}  # name: requests received
+        self.stations = {}  # packed mac: station index
+        self.next_id = 0
+        self.values = {}  # (name, packed mac): last values
+        self.lock = threading.Lock()
+        self.sock = None
+        self.threads = []
+        self.requests = {}  # type: (name, request struct, response struct)
+        for msgtype, (name, req_fmt, resp_fmt) in self.formats.items():
+            req_fmt = 'B' + req_fmt
+            if msgtype == w_cst.WSERVER_SPECPROB_UPDATE_REQUEST_TYPE:
+                # neither the request type nor the probabilities are sent back
+                resp_struct = struct.Struct('!B' + MAC + MAC + resp_fmt)
+            else:
+                resp_struct = struct.Struct('!B' + req_fmt + resp_fmt)
+            self.requests[msgtype] = (name, struct.Struct('!' + req_fmt),
+                                      resp_struct)
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(8)
+        thread = threading.Thread(name='wmediumdServer', target=self.accept)
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+        debug('--- wmediumd stand-in listening on %s\n' % self.path)
+        return self
+
+    def stop(self):
+        if self.sock:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.sock.close()
+            self.sock = None
+        for thread in self.threads:
+            thread.join(1)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def accept(self):
+        while self.sock:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            thread = threading.Thread(name='wmediumdClient', target=self.serve,
+                                      args=(conn,))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def serve(self, conn):
+        """Answers the complete requests of every read at once"""
+        data = b''
+        with conn:
+            while True:
+                try:
+                    chunk = conn.recv(1 << 16)
+                except OSError:
+                    return
+                if not chunk:
+                    return
+                data += chunk
+                out, offset = [], 0
+                while offset < len(data):
+                    msgtype = data[offset]
+                    if msgtype == w_cst.WSERVER_SHUTDOWN_REQUEST_TYPE:
+                        return
+                    if msgtype not in self.requests:
+                        debug('--- wmediumd stand-in: unknown request %d\n'
+                              % msgtype)
+                        return
+                    name, req_struct, resp_struct = self.requests[msgtype]
+                    if len(data) - offset < req_struct.size:
+                        break
+                    request = req_struct.unpack_from(data, offset)
+                    offset += req_struct.size
+                    out.append(self.answer(name, request, resp_struct))
+                data = data[offset:]
+                if out:
+                    if self.latency:
+                        sleep(self.latency)
+                    conn.sendall(b''.join(out))
+
+    def answer(self, name, request, resp_struct):
+        """:return: the packed response to a request"""
+        msgtype, values = request[0], request[1:]
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+            if self.record:
+                self.received.append((name, values))
+            code, tail = self.apply(name, values)
+        if msgtype == w_cst.WSERVER_SPECPROB_UPDATE_REQUEST_TYPE:
+            return resp_struct.pack(msgtype + 1, values[0], values[1], code)
+        return resp_struct.pack(msgtype + 1, *(request + tail + (code,)))
+
+    def apply(self, name, values):
+        """:return: WUPDATE_* code and the fields before it in the response"""
+        if name == 'add':
+            mac = values[0]
+            if mac in self.stations:
+                return w_cst.WUPDATE_INTF_DUPLICATE, (-1,)
+            self.stations[mac] = self.next_id
+            self.next_id += 1
+            return w_cst.WUPDATE_SUCCESS, (self.stations[mac],)
+        if name == 'del_by_id':
+            macs = [mac for mac, idx in self.stations.items()
+                    if idx == values[0]]
+        else:
+            macs = [mac for mac in values[:2]
+                    if isinstance(mac, bytes)]
+        if not macs or any(mac not in self.stations for mac in macs):
+            return w_cst.WUPDATE_INTF_NOTFOUND, ()
+        if name in ('del_by_mac', 'del_by_id'):
+            del self.stations[macs[0]]
+            return w_cst.WUPDATE_SUCCESS, ()
+        self.values[(name,) + tuple(macs)] = values[len(macs):]
+        return w_cst.WUPDATE_SUCCESS, ()
+
+    def get(self, name, mac):
+        """:return: the last values of an update received for an interface
+        :param mac: MAC address, e.g. '02:00:00:00:00:01'"""
+        return self.values.get((name, bytes.fromhex(mac.replace(':', ''))))